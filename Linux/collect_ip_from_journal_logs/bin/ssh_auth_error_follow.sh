@@ -0,0 +1,30 @@
+#!/bin/bash
+
+# sshサービスのジャーナルログを追跡してIPアドレスの出現数を集計し、日付が変わったらCSVファイルに出力するスクリプト
+# (利用想定) systemd サービスとして常駐させる ※cron による ssh_auth_error.sh の替わり
+# journalctl の読み込み位置 (カーソル) は集計結果と一緒にチェックポイントファイルに保存され、
+# 再起動時は --after-cursor でその続きから読み込む
+
+HOME="/home/testuser"
+CMD="/usr/bin/journalctl"
+GREP_KWD=": authentication failure;"
+WORK_DIR="$HOME/work"
+CHECKPOINT_FILE="$WORK_DIR/auth_error_follow.json"
+PY_SCRIPT_DIR="$HOME/bin/python"
+
+cd "$PY_SCRIPT_DIR"
+# チェックポイントファイルから集計済みのカーソルを取得する
+cursor=""
+if [ -f "$CHECKPOINT_FILE" ]; then
+   cursor=$(python3 -c 'import json, sys; print(json.load(open(sys.argv[1])).get("cursor") or "")' \
+      "$CHECKPOINT_FILE")
+fi
+cursor_opt=()
+if [ -n "$cursor" ]; then
+   cursor_opt=(--after-cursor="$cursor")
+fi
+
+$CMD -f -u ssh.service -o json "${cursor_opt[@]}" \
+   | grep --line-buffered "$GREP_KWD" \
+   | python3 FollowAuthErrorLog.py --log-file - --stdin-format json \
+      --checkpoint-file "$CHECKPOINT_FILE"
@@ -0,0 +1,131 @@
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from typing import Callable, List, Tuple
+
+from ExportCSV_with_autherrorlog import (
+    count_ip_from_lines, count_ip_from_mmap, extract_ip_tolist, read_text
+)
+
+"""
+Qiita投稿用スクリプト
+SSH不正ログインエラーログからIPアドレスを抽出する処理のベンチマーク
+ サンプルログを指定倍数に拡大し、"rhost=" を含まない行を指定割合で混在させたログファイルで
+ 抽出方式ごとの処理速度(行/秒)を計測する
+ (1) list-regex: extract_ip_tolist 全ての行に正規表現を適用 (従来方式)
+ (2) list-prefilter: extract_ip_tolist "rhost=" を含む行のみ照合
+ (3) stream-regex: count_ip_from_lines 1行ずつ読み込みながら正規表現を適用
+ (4) stream-prefilter: count_ip_from_lines 1行ずつ読み込みながら "rhost=" を含む行のみ照合
+ (5) mmap: count_ip_from_mmap メモリマップしたファイルをバイト列のまま照合
+"""
+
+DEFAULT_LOG_FILE: str = os.path.join("error_logs", "AuthFail_ssh_2024-07-09.log")
+# "rhost=" を含まない行のサンプル
+NOISE_LINE: str = ("2024-07-09T00:02:21+09:00 sshd[{pid}]: "
+                   "Connection closed by authenticating user root 45.145.4.{host} "
+                   "port {port} [preauth]\n")
+
+
+def make_scaled_log(src_lines: List[str], scale: int, noise_ratio: float,
+                    save_file: str, seed: int) -> int:
+    rnd: random.Random = random.Random(seed)
+    line_count: int = 0
+    with open(save_file, mode='w') as fp:
+        for _ in range(scale):
+            for line in src_lines:
+                fp.write(line)
+                line_count += 1
+                # 指定割合で "rhost=" を含まない行を挿入する
+                if rnd.random() < noise_ratio:
+                    fp.write(NOISE_LINE.format(pid=rnd.randint(1000, 99999),
+                                               host=rnd.randint(1, 254),
+                                               port=rnd.randint(1024, 65535)))
+                    line_count += 1
+    return line_count
+
+
+def measure(func: Callable[[str], Counter], log_file: str,
+            repeat: int) -> Tuple[float, Counter]:
+    # 最も速かった実行時間を採用する
+    best: float = float("inf")
+    result: Counter = Counter()
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        result = func(log_file)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def list_regex(log_file: str) -> Counter:
+    return Counter(extract_ip_tolist(read_text(log_file), parser="regex"))
+
+
+def list_prefilter(log_file: str) -> Counter:
+    return Counter(extract_ip_tolist(read_text(log_file), parser="prefilter"))
+
+
+def stream_regex(log_file: str) -> Counter:
+    with open(log_file, mode='r') as fp:
+        return count_ip_from_lines(fp, parser="regex")
+
+
+def stream_prefilter(log_file: str) -> Counter:
+    with open(log_file, mode='r') as fp:
+        return count_ip_from_lines(fp, parser="prefilter")
+
+
+def batch_main():
+    logging.basicConfig(format="%(message)s")
+    app_logger = logging.getLogger(__name__)
+    app_logger.setLevel(level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log-file", type=str, default=DEFAULT_LOG_FILE,
+                        help="Sample log file.")
+    parser.add_argument("--scale", type=int, default=200,
+                        help="Sample log scale, default 200.")
+    parser.add_argument("--noise-ratio", type=float, default=1.0,
+                        help="Ratio of lines without 'rhost=', default 1.0.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Repeat count, default 3.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed.")
+    args: argparse.Namespace = parser.parse_args()
+
+    src_lines: List[str] = read_text(args.log_file)
+    benchmarks: List[Tuple[str, Callable[[str], Counter]]] = [
+        ("list-regex", list_regex),
+        ("list-prefilter", list_prefilter),
+        ("stream-regex", stream_regex),
+        ("stream-prefilter", stream_prefilter),
+        ("mmap", count_ip_from_mmap),
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        scaled_file: str = os.path.join(tmp_dir, os.path.basename(args.log_file))
+        line_count: int = make_scaled_log(
+            src_lines, args.scale, args.noise_ratio, scaled_file, args.seed
+        )
+        app_logger.info(
+            f"lines: {line_count}, size: {os.path.getsize(scaled_file):,} bytes"
+            f", repeat: {args.repeat}"
+        )
+
+        expected: Counter = Counter()
+        for (name, func) in benchmarks:
+            elapsed, result = measure(func, scaled_file, args.repeat)
+            if name == "list-regex":
+                expected = result
+            # 従来方式と同じ集計結果であること
+            matched: bool = result == expected
+            app_logger.info(
+                f"{name:>16}: {elapsed:.3f} sec, {line_count / elapsed:,.0f} lines/sec"
+                f", match: {matched}"
+            )
+
+
+if __name__ == '__main__':
+    batch_main()
@@ -0,0 +1,110 @@
+import argparse
+import logging
+import random
+import time
+from typing import Callable, List, Tuple
+
+from iputil import ipv4
+
+"""
+Qiita投稿用スクリプト
+IPアドレスリストのソート処理のベンチマーク
+ (1) 前ゼロ3桁に加工した文字列でソートし元のIPアドレスに戻す (従来方式)
+ (2) 整数値をキーにソート
+ (3) 整数値の配列(array)に一括変換してソートし元のIPアドレスに戻す
+ (4) NumPy配列に一括変換してソートし元のIPアドレスに戻す ※NumPyインストール時のみ
+"""
+
+
+def make_random_ip_list(size: int, seed: int) -> List[str]:
+    rnd: random.Random = random.Random(seed)
+    return [ipv4.int_to_ip(rnd.getrandbits(32)) for _ in range(size)]
+
+
+def sort_with_zero_padding(ip_list: List[str]) -> List[str]:
+    # 従来方式: ExportCSV_with_autherrorlog.convert_sorted_ip_list (変更前)
+    full_ip_list: List[str] = []
+    ip_4: List[str]
+    for ip_addr in ip_list:
+        ip_4 = ip_addr.split(".")
+        ip_full: str = (f"{int(ip_4[0]):03}.{int(ip_4[1]):03}."
+                        f"{int(ip_4[2]):03}.{int(ip_4[3]):03}")
+        full_ip_list.append(ip_full)
+    sorted_list: List[str] = sorted(full_ip_list)
+    result: List[str] = []
+    for full_ip in sorted_list:
+        ip_4 = full_ip.split(".")
+        org_ip: str = f"{int(ip_4[0])}.{int(ip_4[1])}.{int(ip_4[2])}.{int(ip_4[3])}"
+        result.append(org_ip)
+    return result
+
+
+def sort_with_int_key(ip_list: List[str]) -> List[str]:
+    return ipv4.sorted_ip_list(ip_list)
+
+
+def sort_with_int_array(ip_list: List[str]) -> List[str]:
+    return ipv4.from_int_array(sorted(ipv4.to_int_array(ip_list)))
+
+
+def sort_with_ndarray(ip_list: List[str]) -> List[str]:
+    import numpy as np
+
+    return ipv4.from_int_ndarray(np.sort(ipv4.to_int_ndarray(ip_list)))
+
+
+def measure(func: Callable[[List[str]], List[str]],
+            ip_list: List[str], repeat: int) -> Tuple[float, List[str]]:
+    # 最も速かった実行時間を採用する
+    best: float = float("inf")
+    result: List[str] = []
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        result = func(ip_list)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def batch_main():
+    logging.basicConfig(format="%(message)s")
+    app_logger = logging.getLogger(__name__)
+    app_logger.setLevel(level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1000000,
+                        help="IP address count, default 1000000.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Repeat count, default 3.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed.")
+    args: argparse.Namespace = parser.parse_args()
+
+    ip_list: List[str] = make_random_ip_list(args.size, args.seed)
+    app_logger.info(f"ip_list.size: {len(ip_list)}, repeat: {args.repeat}")
+
+    benchmarks: List[Tuple[str, Callable[[List[str]], List[str]]]] = [
+        ("zero_padding", sort_with_zero_padding),
+        ("int_key", sort_with_int_key),
+        ("int_array", sort_with_int_array),
+    ]
+    try:
+        import numpy  # noqa: F401
+        benchmarks.append(("ndarray", sort_with_ndarray))
+    except ImportError:
+        app_logger.info("numpy is not installed, skip ndarray.")
+
+    base_time: float = 0.
+    expected: List[str] = []
+    for (name, func) in benchmarks:
+        elapsed, result = measure(func, ip_list, args.repeat)
+        if name == "zero_padding":
+            base_time, expected = elapsed, result
+        # 従来方式と同じ並びであること
+        matched: bool = result == expected
+        app_logger.info(
+            f"{name:>12}: {elapsed:.3f} sec, x{base_time / elapsed:.2f}, match: {matched}"
+        )
+
+
+if __name__ == '__main__':
+    batch_main()
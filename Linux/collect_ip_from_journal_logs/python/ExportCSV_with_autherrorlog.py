@@ -1,10 +1,18 @@
 import argparse
+import glob
+import gzip
 import logging
+import lzma
+import mmap
 import os
 import re
+import sys
 from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import date
-from typing import List, Optional, Set, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, TextIO, Tuple
+
+from iputil import ipv4
 
 """
 Qiita投稿用スクリプト
@@ -17,12 +25,35 @@ Qiita投稿用スクリプト
 re_auth_fail: re.Pattern = re.compile(
     r"^.+?rhost=([0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}).*$"
 )
+# 前処理: "rhost=" を含む行のみ "rhost=" の直後からIPアドレスを照合する
+RHOST_KEY: str = "rhost="
+re_rhost_ip: re.Pattern = re.compile(
+    r"[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}"
+)
+# メモリマップしたファイルをバイト列のまま照合する
+re_rhost_ip_bytes: re.Pattern = re.compile(
+    rb"rhost=([0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3})"
+)
 # ファイル名のログ日付抽出
-re_log_file: re.Pattern = re.compile(r"^AuthFail_ssh_(\d{4}-\d{2}-\d{2})\.log$")
+re_log_file: re.Pattern = re.compile(
+    r"^AuthFail_ssh_(\d{4}-\d{2}-\d{2})\.log(\.gz|\.xz)?$"
+)
+
+
+def open_log_file(file_name: str) -> TextIO:
+    # "-" なら標準入力 (journalctl の出力をパイプで受け取る)
+    if file_name == "-":
+        return sys.stdin
+    # 圧縮ファイルは拡張子で判定する
+    if file_name.endswith(".gz"):
+        return gzip.open(file_name, mode='rt')
+    if file_name.endswith(".xz"):
+        return lzma.open(file_name, mode='rt')
+    return open(file_name, mode='r')
 
 
 def read_text(file_name: str) -> List[str]:
-    with open(file_name, 'r') as fp:
+    with open_log_file(file_name) as fp:
         lines: List[str] = [ln for ln in fp]
         return lines
 
@@ -53,47 +84,184 @@ def save_csvfile(param_save_path: str, filename: str, csv_list: List[str]) -> st
     return save_file
 
 
-def extract_log_date(file_path: str) -> str:
-    # ファイル名から日付を取得
+def match_log_date(file_path: str) -> Optional[str]:
+    # ファイル名から日付を取得 ※該当しなければ None
     b_name: str = os.path.basename(file_path)
     f_mat: Optional[re.Match] = re_log_file.search(b_name)
-    if f_mat:
-        return f_mat.group(1)
-    else:
-        return date.today().isoformat()
+    return f_mat.group(1) if f_mat else None
+
+
+def extract_log_date(file_path: str) -> str:
+    # ファイル名に日付がなければ当日 (標準入力など)
+    log_date: Optional[str] = match_log_date(file_path)
+    return log_date if log_date is not None else date.today().isoformat()
+
+
+def extract_ip_regex(line: str) -> Optional[str]:
+    mat: Optional[re.Match] = re_auth_fail.search(line)
+    return mat.group(1) if mat else None
 
 
-def extract_ip_tolist(lines: List[str]) -> List[str]:
+def extract_ip_prefilter(line: str) -> Optional[str]:
+    # "rhost=" を含まない行は正規表現を適用しない
+    pos: int = line.find(RHOST_KEY, 1)
+    while pos >= 0:
+        mat: Optional[re.Match] = re_rhost_ip.match(line, pos + len(RHOST_KEY))
+        if mat:
+            return mat.group(0)
+        pos = line.find(RHOST_KEY, pos + 1)
+    return None
+
+
+# 行単位の抽出関数
+LINE_PARSERS: Dict[str, Callable[[str], Optional[str]]] = {
+    "regex": extract_ip_regex,
+    "prefilter": extract_ip_prefilter,
+}
+
+
+def extract_ip_tolist(lines: List[str], parser: str = "regex") -> List[str]:
+    extract: Callable[[str], Optional[str]] = LINE_PARSERS[parser]
     result: List = []
     for line in lines:
-        mat: Optional[re.Match] = re_auth_fail.search(line)
-        if mat:
-            result.append(mat.group(1))
+        ip_addr: Optional[str] = extract(line)
+        if ip_addr:
+            result.append(ip_addr)
     return result
 
 
+def count_ip_from_lines(lines: Iterable[str], parser: str = "regex") -> Counter:
+    # 1行ずつ読み込みながらIPアドレスの出現数をカウントする ※ファイル全体をメモリに保持しない
+    extract: Callable[[str], Optional[str]] = LINE_PARSERS[parser]
+    counter: Counter = Counter()
+    for line in lines:
+        ip_addr: Optional[str] = extract(line)
+        if ip_addr:
+            counter[ip_addr] += 1
+    return counter
+
+
+def count_ip_from_mmap(file_name: str) -> Counter:
+    # 非圧縮ファイルをメモリマップしてバイト列のまま "rhost=IPアドレス" を走査する
+    # ※行単位の抽出関数と同じく1行につき最初の1件のみ (行頭の "rhost=" は対象外)
+    counter: Counter = Counter()
+    with open(file_name, mode='rb') as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            return counter
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # 集計済みの行の先頭位置
+            counted_line: int = -1
+            for mat in re_rhost_ip_bytes.finditer(mm):
+                line_start: int = mm.rfind(b"\n", 0, mat.start()) + 1
+                if line_start == counted_line or line_start == mat.start():
+                    continue
+                counted_line = line_start
+                counter[mat.group(1).decode('ascii')] += 1
+    return counter
+
+
 def convert_sorted_ip_list(ip_list: List[str]) -> List[str]:
-    # カウンターオブジェクトから重複のないキーを取得
-    ip_set: Set[str] = set(ip_list)
-    # ソート用の前ゼロ加工したIPアドレスを格納するリスト
-    full_ip_list: List[str] = []
-    ip_4: List[str]
-    for ip_addr in ip_set:
-        ip_4 = ip_addr.split(".")
-        # IPアドレスの各パーツを前ゼロ加工して結合する
-        ip_full: str = (f"{int(ip_4[0]):03}.{int(ip_4[1]):03}."
-                        f"{int(ip_4[2]):03}.{int(ip_4[3]):03}")
-        full_ip_list.append(ip_full)
-    # 前ゼロ加工したIPアドレスリストを数値的にソート
-    sorted_list: List[str] = sorted(full_ip_list)
-    # IPアドレスを元に戻す
-    result: List[str] = []
-    for full_ip in sorted_list:
-        ip_4 = full_ip.split(".")
-        # 各パーツに分解し、パーツごとに数値に戻して元のIPアドレスに戻す
-        org_ip: str = f"{int(ip_4[0])}.{int(ip_4[1])}.{int(ip_4[2])}.{int(ip_4[3])}"
-        result.append(org_ip)
-    return result
+    # 重複のないIPアドレスを整数値をキーに昇順ソート
+    return ipv4.sorted_ip_list(ip_list, unique=True)
+
+
+def count_log_file(f_path: str, line_parser: str,
+                   stream: bool = False) -> Tuple[Counter, int]:
+    # エラーログファイルの読み込み
+    counter: Counter
+    list_size: int
+    if stream or f_path == "-":
+        # 1行ずつ読み込みながら抽出した ip の出現数をカウント
+        if line_parser == "mmap":
+            counter = count_ip_from_mmap(f_path)
+        else:
+            with open_log_file(f_path) as fp:
+                counter = count_ip_from_lines(fp, parser=line_parser)
+        list_size = sum(counter.values())
+    else:
+        lines: List[str] = read_text(f_path)
+        ip_list: List[str] = extract_ip_tolist(lines, parser=line_parser)
+        list_size = len(ip_list)
+        # 抽出した ip の出現数をカウント
+        counter = Counter(ip_list)
+    return counter, list_size
+
+
+def make_csv_list(counter: Counter, log_date: str, appear_threshold: int) -> List[str]:
+    csv_list: List[str] = []
+    # CSV出力: 出現回数が指定件数以上 ※show_top はコンソール出力のみ
+    for (ip_addr, cnt) in counter.most_common():
+        if cnt >= appear_threshold:
+            csv_line: str = f'"{log_date}","{ip_addr}",{cnt}'
+            csv_list.append(csv_line)
+    return csv_list
+
+
+def export_log_csv(f_path: str, log_date: str, save_path: str, appear_threshold: int,
+                   line_parser: str, stream: bool) -> Tuple[str, int, int, Optional[str]]:
+    # 1日分のログファイルを集計してCSVファイルに保存する ※プロセスプールのワーカーで実行
+    counter: Counter
+    list_size: int
+    counter, list_size = count_log_file(f_path, line_parser, stream=stream)
+    if list_size == 0:
+        return log_date, 0, 0, None
+
+    csv_list: List[str] = make_csv_list(counter, log_date, appear_threshold)
+    save_name: str = f"ssh_auth_error_{log_date}.csv"
+    saved_file: str = save_csvfile(save_path, save_name, csv_list)
+    return log_date, list_size, len(csv_list), saved_file
+
+
+def export_log_dir_main(args: argparse.Namespace, logger: logging.Logger) -> None:
+    log_dir: str = os.path.expanduser(args.log_dir)
+    if not os.path.isdir(log_dir):
+        logger.error(f"DirectoryNotFound: {log_dir}")
+        exit(1)
+
+    # ログ日付(ファイル名)の昇順
+    #  ファイル名に日付がないファイルはスキップする
+    #  同じ日付の複数ファイル (例: .log と .log.gz) は出力CSVが同じため先頭(非圧縮を優先)のみ集計する
+    date_files: Dict[str, str] = {}
+    for f_path in sorted(glob.glob(os.path.join(log_dir, args.log_glob))):
+        log_date: Optional[str] = match_log_date(f_path)
+        if log_date is None:
+            logger.warning(f"No log date in file name, skipped: {f_path}")
+        elif log_date in date_files:
+            logger.warning(f"Duplicate log date {log_date}, skipped: {f_path}")
+        else:
+            date_files[log_date] = f_path
+    log_files: List[str] = list(date_files.values())
+    logger.info(f"log_files.size: {len(log_files)}, workers: {args.workers}")
+    if len(log_files) == 0:
+        return
+
+    if args.parser == "mmap" and (
+            not args.stream or any(f.endswith((".gz", ".xz")) for f in log_files)):
+        logger.error("--parser mmap requires --stream and uncompressed log file.")
+        exit(1)
+
+    # 保存先ディレクトリはワーカー実行前に作成しておく
+    save_path: str = os.path.expanduser(args.save_path)
+    if not os.path.exists(save_path):
+        os.makedirs(save_path)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures: List[Future] = [
+            executor.submit(export_log_csv, f_path, log_date, save_path, args.appear_threshold,
+                            args.parser, args.stream)
+            for log_date, f_path in date_files.items()
+        ]
+        for f_path, future in zip(log_files, futures):
+            try:
+                log_date, list_size, output_lines, saved_file = future.result()
+            except Exception as err:
+                logger.error(f"{f_path}: {err}")
+                continue
+            if saved_file is not None:
+                logger.info(f"{log_date}: ip_list.size: {list_size}"
+                            f", output_lines: {output_lines}, Saved: {saved_file}")
+            else:
+                logger.info(f"{log_date}: 不正アクセスに該当するIPアドレス未検出.")
 
 
 def batch_main():
@@ -102,16 +270,39 @@ def batch_main():
     app_logger.setLevel(level=logging.INFO)
 
     # コマンドラインパラメータ
-    # --log-file: エラーログファイル ※必須
+    # --log-file: エラーログファイル ※ --log-dir とどちらか必須
+    #    圧縮ファイル(.gz, .xz)に対応, "-" なら標準入力から読み込む
+    # --log-dir: エラーログファイルのディレクトリ ※複数日のログを並列に集計しCSVファイル出力する
+    #    --log-glob: ログファイル名のパターン ※デフォルト: "AuthFail_ssh_*.log*"
+    #    --workers: 並列実行するプロセス数 ※デフォルト: CPU数
+    # --stream: 1行ずつ読み込みながら集計する ※ログファイルのサイズによらずメモリ使用量が一定
+    # --log-date: ログ日付 ※未指定ならファイル名から取得 (標準入力の場合は当日)
+    # --parser: IPアドレスの抽出方式 ※デフォルト: prefilter
+    #    regex: 全ての行に正規表現を適用, prefilter: "rhost=" を含む行のみ照合
+    #    mmap: 非圧縮ファイルをメモリマップしてバイト列のまま照合 (--stream 指定時のみ)
     # (A) コンソール出力: --output console ※デフォルト
     #    --show-top: Top N, デフォルト(=0) 全て出力
-    #    --sort-ip-addr: 指定された場合、前ゼロ加工したIPアドレスの昇順でソート
+    #    --sort-ip-addr: 指定された場合、IPアドレス(整数値)の昇順でソート
     # (B) CSVファイル出力: --output csv
     #    --save-path: CSVの出力先ディレクトリ ※デフォルト: "~/Documents/csv"
     #    --appear-threshold: 出現数の最小値 ※デフォルト: 30回
     parser = argparse.ArgumentParser()
-    parser.add_argument("--log-file", required=True, type=str,
-                        help="Log File name.")
+    log_group = parser.add_mutually_exclusive_group(required=True)
+    log_group.add_argument("--log-file", type=str,
+                           help="Log File name (.log, .log.gz, .log.xz), '-' is stdin.")
+    log_group.add_argument("--log-dir", type=str,
+                           help="Log files directory, output csv for each log date.")
+    parser.add_argument("--log-glob", type=str, default="AuthFail_ssh_*.log*",
+                        help="Log file name pattern in --log-dir.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Process pool size for --log-dir, default cpu count.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Count ip-addr while reading log lines.")
+    parser.add_argument("--log-date", type=str,
+                        help="Log date (YYYY-mm-dd), default from log file name.")
+    parser.add_argument("--parser", type=str,
+                        choices=["regex", "prefilter", "mmap"], default="prefilter",
+                        help="Extract ip-addr parser, default prefilter.")
     parser.add_argument("--output", type=str,
                         choices=["console", "csv"], default="console",
                         help="Output console or csv file, default console.")
@@ -125,6 +316,14 @@ def batch_main():
     parser.add_argument("--save-path", type=str, default="~/Documents/csv",
                         help="Save csv file path(Directory).")
     args: argparse.Namespace = parser.parse_args()
+    if args.log_dir is not None:
+        # 複数日のログファイルを並列に集計する ※CSVファイル出力のみ
+        app_logger.info(f"log-dir: {args.log_dir}, log-glob: {args.log_glob}")
+        app_logger.info(f"appear-threshold: {args.appear_threshold}")
+        app_logger.info(f"save_path: {args.save_path}")
+        export_log_dir_main(args, app_logger)
+        return
+
     log_file: str = args.log_file
     app_logger.info(f"log-file: {log_file}")
 
@@ -139,37 +338,38 @@ def batch_main():
         app_logger.info(f"{p_output}, appear-threshold: {args.appear_threshold}")
         app_logger.info(f"save_path: {args.save_path}")
 
-    # エラーログファイルの存在チェック
+    # エラーログファイルの存在チェック ※標準入力を除く
     f_path: str
     if log_file.find("~/") == 0:
         f_path = os.path.expanduser(log_file)
     else:
         f_path = log_file
-    if not os.path.exists(f_path):
+    if f_path != "-" and not os.path.exists(f_path):
         app_logger.error(f"FileNotFound: {f_path}")
         exit(1)
 
     # エラーログファイルの読み込み
-    lines: List[str] = read_text(f_path)
-    ip_list: List[str] = extract_ip_tolist(lines)
-    list_size: int = len(ip_list)
+    line_parser: str = args.parser
+    if line_parser == "mmap" and (
+            not args.stream or f_path == "-" or f_path.endswith((".gz", ".xz"))):
+        app_logger.error("--parser mmap requires --stream and uncompressed log file.")
+        exit(1)
+
+    counter: Counter
+    list_size: int
+    counter, list_size = count_log_file(f_path, line_parser, stream=args.stream)
     app_logger.info(f"ip_list.size: {list_size}")
 
     if list_size > 0:
-        # 抽出した ip の出現数をカウント
-        counter: Counter = Counter(ip_list)
         app_logger.info(f"counter.elements.size: {len(counter)}")
         if output == "csv":
             # ファイル出力する場合は出現回数の閾値
             appear_threshold: int = args.appear_threshold
             # ファイル名からログ日付を取り出す ※シェルスクリプトでログ日付がファイル名の末尾に付与されている
-            log_date: str = extract_log_date(f_path)
-            csv_list: List[str] = []
-            # CSV出力: 出現回数が指定件数以上
-            for (ip_addr, cnt) in counter.most_common():
-                if cnt >= appear_threshold:
-                    csv_line: str = f'"{log_date}","{ip_addr}",{cnt}'
-                    csv_list.append(csv_line)
+            log_date: str = args.log_date if args.log_date else extract_log_date(f_path)
+            csv_list: List[str] = make_csv_list(
+                counter, log_date, appear_threshold
+            )
             app_logger.info(f"output_lines: {len(csv_list)}")
             # 保存ファイル名
             save_name: str = f"ssh_auth_error_{log_date}.csv"
@@ -185,7 +385,7 @@ def batch_main():
                 # Top N位
                 most_common = counter.most_common(args.show_top)
             if args.sort_ip_addr:
-                # 前ゼロ加工済みIPアドレスの昇順
+                # IPアドレス(整数値)の昇順
                 tmp_list: List[str] = [ip for (ip, cnt) in most_common]
                 sorted_ip_list = convert_sorted_ip_list(tmp_list)
                 for ip in sorted_ip_list:
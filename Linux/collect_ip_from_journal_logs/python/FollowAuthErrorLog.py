@@ -0,0 +1,324 @@
+import argparse
+import json
+import logging
+import os
+import re
+import select
+import signal
+import sys
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from ExportCSV_with_autherrorlog import (
+    LINE_PARSERS, make_csv_list, save_csvfile
+)
+
+"""
+Qiita投稿用スクリプト
+SSH不正ログインエラーログを追跡しながらIPアドレスの出現数を日付ごとに集計する常駐スクリプト
+ (1) 追記され続けるログファイル (tail -f 相当)
+ (2) 標準入力 (journalctl -f -o json の出力をパイプで受け取る)
+[チェックポイントファイル]
+ 読み込み済みのバイト位置と日付ごとの集計結果を定期的に保存し、再起動時はその続きから読み込む
+ CSVファイルに保存済みの最新日付も保存し、保存済みの日付の (遅れて届いた) ログ行は集計しない
+ ※標準入力の場合、読み込み位置はジャーナルのカーソル (__CURSOR) を集計結果と一緒に保存し、
+   再起動時は journalctl --after-cursor にチェックポイントのカーソルを指定する
+[CSVファイル出力]
+ 日付が変わったら (午前0時 + 猶予時間) 前日までの集計結果をCSVファイルに保存する
+"""
+
+# ログ行の先頭の日付 (journalctl -o short-iso)
+re_line_date: re.Pattern = re.compile(r"^(\d{4}-\d{2}-\d{2})T")
+# 1回の読み込みサイズ
+READ_SIZE: int = 65536
+
+
+class AuthErrorFollower(object):
+    def __init__(self, checkpoint_file: str, save_path: str,
+                 appear_threshold: int, line_parser: str,
+                 logger: logging.Logger, journal_json: bool = False):
+        self.checkpoint_file = checkpoint_file
+        self.save_path = save_path
+        self.appear_threshold = appear_threshold
+        self.extract = LINE_PARSERS[line_parser]
+        self.logger = logger
+        # 標準入力が journalctl -o json の出力 (1行1エントリ) か
+        self.journal_json = journal_json
+        # 日付ごとのカウンター
+        self.counters: Dict[str, Counter] = {}
+        # 追跡中のファイル情報 ※標準入力の場合は使用しない
+        self.inode: Optional[int] = None
+        self.offset: int = 0
+        # 集計済みのジャーナルエントリのカーソル ※標準入力 (json) の場合のみ使用する
+        self.cursor: Optional[str] = None
+        # 改行で終わっていない読み込み途中の行
+        self.pending: bytes = b""
+        # 読み込んだログ行の最新日付
+        self.latest_date: str = ""
+        # CSVファイルに保存済みの最新日付 ※この日付以前のログ行は集計しない
+        self.flushed_date: str = ""
+        # 保存済みの日付ごとの集計しなかったログ行数
+        self.late_counts: Counter = Counter()
+        self.stopped: bool = False
+        self.load_checkpoint()
+
+    def load_checkpoint(self) -> None:
+        if not os.path.exists(self.checkpoint_file):
+            return
+        with open(self.checkpoint_file, 'r') as fp:
+            data: Dict[str, Any] = json.load(fp)
+        self.inode = data.get("inode")
+        self.offset = data.get("offset", 0)
+        self.cursor = data.get("cursor")
+        self.flushed_date = data.get("flushed_date", "")
+        self.counters = {
+            log_date: Counter(counts) for log_date, counts in data["counters"].items()
+        }
+        self.logger.info(
+            f"Load checkpoint: offset: {self.offset}, days: {sorted(self.counters)}"
+            f", flushed_date: {self.flushed_date}"
+        )
+
+    def save_checkpoint(self) -> None:
+        data: Dict[str, Any] = {
+            "inode": self.inode,
+            "offset": self.offset,
+            "cursor": self.cursor,
+            "flushed_date": self.flushed_date,
+            "counters": {log_date: dict(cnt) for log_date, cnt in self.counters.items()}
+        }
+        # 書き込み途中で停止しても壊れないように一時ファイルから置き換える
+        tmp_file: str = f"{self.checkpoint_file}.tmp"
+        with open(tmp_file, 'w') as fp:
+            json.dump(data, fp)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def process_line(self, line: str) -> None:
+        mat: Optional[re.Match] = re_line_date.match(line)
+        self.count_ip(mat.group(1) if mat else date.today().isoformat(), line)
+
+    def process_journal_line(self, line: str) -> None:
+        if not line:
+            return
+        try:
+            entry: Dict[str, Any] = json.loads(line)
+        except json.JSONDecodeError as err:
+            self.logger.warning(f"Invalid journal entry: {err}")
+            return
+        message: Any = entry.get("MESSAGE")
+        if isinstance(message, list):
+            # UTF-8 以外を含むメッセージはバイト値の配列で出力される
+            message = bytes(message).decode('utf-8', errors='replace')
+        if isinstance(message, str):
+            timestamp: Optional[str] = entry.get("__REALTIME_TIMESTAMP")
+            log_date: str = (
+                datetime.fromtimestamp(int(timestamp) / 1000000).date().isoformat()
+                if timestamp else date.today().isoformat()
+            )
+            self.count_ip(log_date, message)
+        # 集計後にカーソルを進める ※チェックポイントに集計結果と一緒に保存する
+        self.cursor = entry.get("__CURSOR", self.cursor)
+
+    def count_ip(self, log_date: str, text: str) -> None:
+        ip_addr: Optional[str] = self.extract(text)
+        if ip_addr is None:
+            return
+        if log_date <= self.flushed_date:
+            # 保存済みのCSVファイルを部分的な集計結果で上書きしないように読み捨てる
+            self.late_counts[log_date] += 1
+            return
+        if log_date > self.latest_date:
+            self.latest_date = log_date
+        counter: Optional[Counter] = self.counters.get(log_date)
+        if counter is None:
+            counter = Counter()
+            self.counters[log_date] = counter
+        counter[ip_addr] += 1
+
+    def process_chunk(self, chunk: bytes) -> None:
+        # 改行までを処理し、残りは次の読み込みと連結する
+        data: bytes = self.pending + chunk
+        end: int = data.rfind(b"\n")
+        if end < 0:
+            self.pending = data
+            return
+        self.pending = data[end + 1:]
+        process: Callable[[str], None] = (
+            self.process_journal_line if self.journal_json else self.process_line
+        )
+        for line in data[:end].decode('utf-8', errors='replace').split("\n"):
+            process(line)
+        # 読み込み済みのバイト位置は読み込み途中の行の先頭
+        self.offset += end + 1
+
+    def flush_closed_days(self, flush_delay: int, caught_up: bool) -> None:
+        for log_date, count in sorted(self.late_counts.items()):
+            self.logger.warning(f"{log_date}: already saved, skip late lines: {count}")
+        self.late_counts.clear()
+        # 猶予時間を差し引いた日付より前の集計結果をCSVファイルに保存する
+        closed_date: str = (
+            datetime.now() - timedelta(seconds=flush_delay)).date().isoformat()
+        if not caught_up:
+            # 未読のログが残っている間は後続の日付のログ行を読み込んだ日付のみ保存する
+            closed_date = min(closed_date, self.latest_date)
+        flush_dates: List[str] = sorted(d for d in self.counters if d < closed_date)
+        for log_date in flush_dates:
+            csv_list: List[str] = make_csv_list(
+                self.counters[log_date], log_date, self.appear_threshold
+            )
+            saved_file: str = save_csvfile(
+                self.save_path, f"ssh_auth_error_{log_date}.csv", csv_list
+            )
+            self.logger.info(
+                f"{log_date}: output_lines: {len(csv_list)}, Saved: {saved_file}"
+            )
+            del self.counters[log_date]
+            self.flushed_date = log_date
+        if len(flush_dates) > 0:
+            self.save_checkpoint()
+
+    def follow_file(self, file_path: str, poll_interval: float,
+                    checkpoint_interval: float, flush_delay: int) -> None:
+        fd: int = self.open_file(file_path)
+        last_checkpoint: float = time.monotonic()
+        try:
+            while not self.stopped:
+                chunk: bytes = os.read(fd, READ_SIZE)
+                if chunk:
+                    self.process_chunk(chunk)
+                    self.flush_closed_days(flush_delay, caught_up=False)
+                else:
+                    # ログローテーションされたら新しいファイルを先頭から読み込む
+                    if self.is_rotated(file_path):
+                        os.close(fd)
+                        self.logger.info(f"Rotated: {file_path}")
+                        self.inode, self.offset, self.pending = None, 0, b""
+                        fd = self.open_file(file_path)
+                        continue
+                    self.flush_closed_days(flush_delay, caught_up=True)
+                    time.sleep(poll_interval)
+                if time.monotonic() - last_checkpoint >= checkpoint_interval:
+                    self.save_checkpoint()
+                    last_checkpoint = time.monotonic()
+        finally:
+            os.close(fd)
+            self.save_checkpoint()
+
+    def open_file(self, file_path: str) -> int:
+        fd: int = os.open(file_path, os.O_RDONLY)
+        st: os.stat_result = os.fstat(fd)
+        if self.inode == st.st_ino and self.offset <= st.st_size:
+            # チェックポイントの続きから読み込む
+            os.lseek(fd, self.offset, os.SEEK_SET)
+        else:
+            self.offset = 0
+        self.inode = st.st_ino
+        self.logger.info(f"Follow: {file_path}, offset: {self.offset}")
+        return fd
+
+    def is_rotated(self, file_path: str) -> bool:
+        try:
+            st: os.stat_result = os.stat(file_path)
+        except FileNotFoundError:
+            return False
+        return st.st_ino != self.inode or st.st_size < self.offset
+
+    def follow_stdin(self, poll_interval: float,
+                     checkpoint_interval: float, flush_delay: int) -> None:
+        fd: int = sys.stdin.fileno()
+        last_checkpoint: float = time.monotonic()
+        try:
+            while not self.stopped:
+                readable, _, _ = select.select([fd], [], [], poll_interval)
+                if readable:
+                    chunk: bytes = os.read(fd, READ_SIZE)
+                    if not chunk:
+                        # パイプが閉じられた ※全て読み込んだので前日までを保存する
+                        if self.pending:
+                            self.process_chunk(b"\n")
+                        self.flush_closed_days(flush_delay, caught_up=True)
+                        break
+                    self.process_chunk(chunk)
+                # 一定時間入力がなければ読み込み済み
+                self.flush_closed_days(flush_delay, caught_up=not readable)
+                if time.monotonic() - last_checkpoint >= checkpoint_interval:
+                    self.save_checkpoint()
+                    last_checkpoint = time.monotonic()
+        finally:
+            self.save_checkpoint()
+
+    def stop(self, signum, frame) -> None:
+        self.logger.info(f"Received signal: {signum}")
+        self.stopped = True
+
+
+def batch_main():
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s",
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    app_logger = logging.getLogger(__name__)
+    app_logger.setLevel(level=logging.INFO)
+
+    # コマンドラインパラメータ
+    # --log-file: 追跡するログファイル, "-" なら標準入力 ※必須
+    # --checkpoint-file: チェックポイントファイル ※デフォルト: "~/work/auth_error_follow.json"
+    # --save-path: CSVの出力先ディレクトリ ※デフォルト: "~/Documents/csv"
+    # --appear-threshold: 出現数の最小値 ※デフォルト: 30回
+    # --flush-delay: 午前0時からCSV出力までの猶予時間(秒) ※デフォルト: 300秒
+    # --stdin-format: 標準入力の形式 json (journalctl -o json) | short-iso ※デフォルト: json
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log-file", required=True, type=str,
+                        help="Follow log file name, '-' is stdin.")
+    parser.add_argument("--checkpoint-file", type=str,
+                        default="~/work/auth_error_follow.json",
+                        help="Checkpoint json file.")
+    parser.add_argument("--save-path", type=str, default="~/Documents/csv",
+                        help="Save csv file path(Directory).")
+    parser.add_argument("--appear-threshold", type=int, default=30,
+                        help="出現数の閾値 N回以上。既定値=30回")
+    parser.add_argument("--parser", type=str,
+                        choices=["regex", "prefilter"], default="prefilter",
+                        help="Extract ip-addr parser, default prefilter.")
+    parser.add_argument("--poll-interval", type=float, default=1.0,
+                        help="Poll interval seconds, default 1.0.")
+    parser.add_argument("--checkpoint-interval", type=float, default=60.0,
+                        help="Checkpoint interval seconds, default 60.")
+    parser.add_argument("--flush-delay", type=int, default=300,
+                        help="Delay seconds after midnight to save csv, default 300.")
+    parser.add_argument("--stdin-format", type=str,
+                        choices=["json", "short-iso"], default="json",
+                        help="journalctl output format of stdin, default json.")
+    args: argparse.Namespace = parser.parse_args()
+    app_logger.info(f"log-file: {args.log_file}, checkpoint-file: {args.checkpoint_file}")
+    app_logger.info(f"appear-threshold: {args.appear_threshold}"
+                    f", save_path: {args.save_path}")
+
+    checkpoint_file: str = os.path.expanduser(args.checkpoint_file)
+    checkpoint_dir: str = os.path.dirname(checkpoint_file)
+    if checkpoint_dir and not os.path.exists(checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+
+    follower: AuthErrorFollower = AuthErrorFollower(
+        checkpoint_file, args.save_path, args.appear_threshold, args.parser, app_logger,
+        journal_json=(args.log_file == "-" and args.stdin_format == "json")
+    )
+    # systemctl stop 等で停止された場合もチェックポイントを保存する
+    signal.signal(signal.SIGTERM, follower.stop)
+    signal.signal(signal.SIGINT, follower.stop)
+
+    if args.log_file == "-":
+        follower.follow_stdin(args.poll_interval, args.checkpoint_interval,
+                              args.flush_delay)
+    else:
+        f_path: str = os.path.expanduser(args.log_file)
+        if not os.path.exists(f_path):
+            app_logger.error(f"FileNotFound: {f_path}")
+            exit(1)
+        follower.follow_file(f_path, args.poll_interval, args.checkpoint_interval,
+                             args.flush_delay)
+    app_logger.info("Stopped.")
+
+
+if __name__ == '__main__':
+    batch_main()
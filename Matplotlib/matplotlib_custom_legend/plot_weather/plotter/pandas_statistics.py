@@ -46,32 +46,27 @@ def get_temp_out_stat(df_desc: DataFrame) -> TempOutStat:
         # 時刻部分は "時:分"までとする
         return py_datetime.strftime("%Y-%m-%d %H:%M")
 
-    # 外気温列
-    temp_out_ser: Series = df_desc[COL_TEMP_OUT]
-    # 外気温列から最低・最高・平均気温を取得
-    min_temper: np.float64 = temp_out_ser.min()
-    max_temper: np.float64 = temp_out_ser.max()
-    avg_temper: np.float64 = temp_out_ser.mean()
-    # 全ての最低気温を取得する
-    df_min_all: DataFrame = df_desc[temp_out_ser <= min_temper]
-    # 全ての最高気温を取得する
-    df_max_all: pd.DataFrame = df_desc[temp_out_ser >= max_temper]
-    # それぞれ直近の１レコードのみ取得
-    min_first: Series = df_min_all.iloc[0]
-    max_first: Series = df_max_all.iloc[0]
+    # 外気温列 ※DataFrame のコピーを作らずに NumPy 配列から取得する
+    temp_out_arr: np.ndarray = df_desc[COL_TEMP_OUT].to_numpy(dtype=np.float64)
+    # 外気温列から平均気温を取得 ※NaN (NULL) は除外
+    avg_temper: np.float64 = np.nanmean(temp_out_arr)
+    # 降順に並んでいるので最初に出現する位置が直近の最低気温・最高気温
+    min_pos: int = int(np.nanargmin(temp_out_arr))
+    max_pos: int = int(np.nanargmax(temp_out_arr))
+    time_ser: Series = df_desc[COL_TIME]
     # 最低気温情報
-    min_measurement_datetime: str = get_measurement_time(min_first[COL_TIME])
+    min_measurement_datetime: str = get_measurement_time(time_ser.iloc[min_pos])
     #   測定日は先頭 10桁分(年月日)
     measurement_day: str = min_measurement_datetime[:10]
     #   出現時刻は時分
     min_appear_time: str = min_measurement_datetime[11:]
-    temp_out_min: TempOut = TempOut(min_appear_time, float(min_first[COL_TEMP_OUT]))
+    temp_out_min: TempOut = TempOut(min_appear_time, float(temp_out_arr[min_pos]))
     # 最高気温情報
-    max_measurement_datetime: str = get_measurement_time(max_first[COL_TIME])
+    max_measurement_datetime: str = get_measurement_time(time_ser.iloc[max_pos])
     max_appear_time: str = max_measurement_datetime[11:]
-    temp_out_max: TempOut = TempOut(max_appear_time, float(max_first[COL_TEMP_OUT]))
+    temp_out_max: TempOut = TempOut(max_appear_time, float(temp_out_arr[max_pos]))
     # 平均気温は小数点第一位に四捨五入した値を設定
     return TempOutStat(
-        measurement_day, average_temper=round(avg_temper, 1),
+        measurement_day, average_temper=round(float(avg_temper), 1),
         min=temp_out_min, max=temp_out_max
     )
@@ -88,36 +88,7 @@ def extract_date_range(csv_files: List[str], from_date: str, to_date: str) -> Li
     return result
 
 
-def bulk_exists_ip_addr(conn: connection,
-                        ip_list: List[str],
-                        logger: Optional[logging.Logger] = None) -> Dict[str, int]:
-    # IN ( in_clause )
-    in_clause: Tuple[str, ...] = tuple(ip_list)
-    if logger is not None:
-        logger.debug(f"in_clause: {in_clause}")
-    try:
-        cur: cursor
-        with conn.cursor() as cur:
-            cur.execute("""
-SELECT id,ip_addr FROM mainte2.unauth_ip_addr WHERE ip_addr IN %s""",
-                        (in_clause,)
-                        )
-            if logger is not None:
-                if cur.query is not None:
-                    logger.debug(f"{cur.query.decode('utf-8')}")
-            # IN句で一致したIPアドレスの idとIPアドレスのタプルをすべて取得
-            rows: List[tuple[Any, ...]] = cur.fetchall()
-            if logger is not None:
-                logger.debug(f"rows: {rows}")
-
-            # 戻り値: IPアドレスをキーとするIPのIDの辞書
-            result_dict: Dict[str, int] = {ip_addr: ip_id for (ip_id, ip_addr) in rows}
-            return result_dict
-    except (Exception, psycopg2.DatabaseError) as err:
-        raise err
-
-
-def bulk_insert_unauth_ip_addr(
+def bulk_upsert_unauth_ip_addr(
         conn: connection,
         qry_params: tuple[Dict[str, Any], ...],
         logger: Optional[logging.Logger] = None) -> Dict[str, int]:
@@ -126,13 +97,29 @@ def bulk_insert_unauth_ip_addr(
     try:
         cur: cursor
         with conn.cursor() as cur:
+            # 未登録のIPアドレスのみ登録し、登録済みを含む全てのIPアドレスのIDを返却する
             rows: List[Tuple[Any, ...]] = execute_values(
                 cur,
                 """
-INSERT INTO mainte2.unauth_ip_addr(ip_addr, reg_date)
- VALUES %s RETURNING id,ip_addr""",
+WITH params(ip_addr, reg_date) AS (
+   VALUES %s
+), ins AS (
+   INSERT INTO mainte2.unauth_ip_addr(ip_addr, reg_date)
+    SELECT ip_addr, reg_date::DATE FROM params
+    ON CONFLICT (ip_addr) DO NOTHING
+    RETURNING id,ip_addr
+)
+SELECT id,ip_addr FROM ins
+UNION ALL
+SELECT
+   uia.id, uia.ip_addr
+FROM
+   mainte2.unauth_ip_addr uia
+   INNER JOIN params ON params.ip_addr = uia.ip_addr""",
                 qry_params,
                 template="(%(ip_addr)s, %(reg_date)s)",
+                # CTEの VALUES を分割しないように1回のクエリーで実行する
+                page_size=max(len(qry_params), 1),
                 fetch=True
             )
             # 実行されたSQLを出力
@@ -216,32 +203,12 @@ INSERT INTO mainte2.ssh_auth_error(log_date, ip_id, appear_count)
         raise err
 
 
-def get_register_ip_list(
-        exists_ip_dict: Dict[str, int],
-        csv_lines: List[str],
-        logger: Optional[logging.Logger] = None) -> List[RegUnauthIpAddr]:
+def get_register_ip_list(csv_lines: List[str]) -> List[RegUnauthIpAddr]:
+    # 登録済みかどうかは登録時に判定するためすべてのIPアドレスを対象とする
     result: List[RegUnauthIpAddr] = []
-    if len(exists_ip_dict) > 0:
-        registered_cnt: int = 0
-        for line in csv_lines:
-            fields: List[str] = line.split(",")
-            registered_id: Optional[int] = exists_ip_dict.get(fields[1])
-            if registered_id is None:
-                result.append(RegUnauthIpAddr(
-                    ip_addr=fields[1], reg_date=fields[0])
-                )
-            else:
-                registered_cnt += 1
-        if registered_cnt > 0:
-            if logger is not None:
-                logger.info(f"Registered_count: {registered_cnt}")
-    else:
-        # 登録済みレコードがない場合はすべて登録
-        for line in csv_lines:
-            fields = line.split(",")
-            result.append(RegUnauthIpAddr(
-                ip_addr=fields[1], reg_date=fields[0])
-            )
+    for line in csv_lines:
+        fields: List[str] = line.split(",")
+        result.append(RegUnauthIpAddr(ip_addr=fields[1], reg_date=fields[0]))
     return result
 
 
@@ -267,24 +234,20 @@ def get_register_ssh_auth_error_list(
     return result
 
 
-def insert_unauth_ip_main(
+def upsert_unauth_ip_main(
         conn: connection,
-        exists_ip_dict: Dict[str, int],
         reg_ip_list: List[RegUnauthIpAddr],
-        logger: Optional[logging.Logger] = None, enable_debug=False) -> None:
-    # namedtupleを辞書のタプルに変換
+        logger: Optional[logging.Logger] = None, enable_debug=False) -> Dict[str, int]:
+    # dataclassを辞書のタプルに変換
     params: Tuple[Dict[str, Any], ...] = tuple([asdict(rec) for rec in reg_ip_list])
-    registered_ip_ids: Dict[str, int] = bulk_insert_unauth_ip_addr(
-        conn, params, logger=logger
+    ip_ids: Dict[str, int] = bulk_upsert_unauth_ip_addr(
+        conn, params, logger=logger if enable_debug else None
     )
     if logger is not None:
-        logger.info(f"registered_ip_ids.size: {len(registered_ip_ids)}")
-        if logger is not None and enable_debug:
-            logger.debug(f"registered_ip_ids: {registered_ip_ids}")
-    # 新たに登録されたIPアドレスとIDを追加する
-    exists_ip_dict.update(registered_ip_ids)
-    if logger is not None and enable_debug:
-        logger.debug(f"update.exists_ip_dict:\n{exists_ip_dict}")
+        logger.info(f"ip_ids.size: {len(ip_ids)}")
+        if enable_debug:
+            logger.debug(f"ip_ids: {ip_ids}")
+    return ip_ids
 
 
 def insert_ssh_auth_error_main(
@@ -321,34 +284,66 @@ def insert_ssh_auth_error_main(
             logger.info("ssh_auth_error テーブルに登録可能データなし.")
 
 
+# CSVファイルを COPY FROM STDIN でステージングテーブルに転送し、2つのテーブルに INSERT ... SELECT で登録する
+def copy_csv_insert(
+        conn: connection,
+        csv_file: str,
+        logger: Optional[logging.Logger] = None) -> None:
+    try:
+        cur: cursor
+        with conn.cursor() as cur:
+            # トランザクション終了時に削除される一時テーブル
+            cur.execute("""
+CREATE TEMP TABLE IF NOT EXISTS tmp_ssh_auth_error_csv(
+   log_date DATE NOT NULL,
+   ip_addr VARCHAR(15) NOT NULL,
+   appear_count INTEGER NOT NULL
+) ON COMMIT DROP""")
+            cur.execute("TRUNCATE tmp_ssh_auth_error_csv")
+            # CSVファイルをそのまま転送する ※ファイル全体をメモリに読み込まない
+            with open(csv_file, 'r') as fp:
+                cur.copy_expert(
+                    "COPY tmp_ssh_auth_error_csv(log_date, ip_addr, appear_count)"
+                    " FROM STDIN WITH (FORMAT csv, HEADER true)",
+                    fp
+                )
+            if logger is not None:
+                logger.info(f"copy.rowcount: {cur.rowcount}")
+            # 不正アクセスIPアドレステーブル: 登録済みのIPアドレスは無視する
+            cur.execute("""
+INSERT INTO mainte2.unauth_ip_addr(ip_addr, reg_date)
+ SELECT ip_addr, log_date FROM tmp_ssh_auth_error_csv
+ ON CONFLICT (ip_addr) DO NOTHING""")
+            if logger is not None:
+                logger.info(f"unauth_ip_addr.rowcount: {cur.rowcount}")
+            # 不正アクセスカウンターテーブル: 当該日に登録済みのIPアドレスは無視する
+            cur.execute("""
+INSERT INTO mainte2.ssh_auth_error(log_date, ip_id, appear_count)
+ SELECT
+   tmp.log_date, uia.id, tmp.appear_count
+ FROM
+   tmp_ssh_auth_error_csv tmp
+   INNER JOIN mainte2.unauth_ip_addr uia ON uia.ip_addr = tmp.ip_addr
+ ON CONFLICT DO NOTHING""")
+            if logger is not None:
+                logger.info(f"ssh_auth_error.rowcount: {cur.rowcount}")
+    except (Exception, psycopg2.DatabaseError) as err:
+        raise err
+
+
 def csv_lines_insert(conn: connection,
                      csv_lines: List[str],
                      logger: Optional[logging.Logger] = None,
                      enable_debug: bool = False) -> None:
     try:
-        # CSVから取得したIPアドレス(2列目)が登録済みかチェック
-        ip_list: List[str] = [line.split(",")[1] for line in csv_lines]
-        exists_ip_dict: Dict[str, int] = bulk_exists_ip_addr(conn, ip_list, logger=None)
+        # 不正アクセスIPアドレステーブルに未登録のIPアドレスを登録し、全てのIPアドレスのIDを取得
+        reg_ip_datas: List[RegUnauthIpAddr] = get_register_ip_list(csv_lines)
         if logger is not None:
-            logger.info(f"exists_ip_dict.size: {len(exists_ip_dict)}")
-
-        # 登録済みIPアドレスを除外した追加登録用のレコードリストを作成
-        reg_ip_datas: List[RegUnauthIpAddr] = get_register_ip_list(
-            exists_ip_dict, csv_lines, logger=logger
+            logger.info(f"reg_ip_datas.size: {len(reg_ip_datas)}")
+        exists_ip_dict: Dict[str, int] = upsert_unauth_ip_main(
+            conn, reg_ip_datas, logger=logger, enable_debug=enable_debug
         )
 
-        # unauth_ip_addrテーブルとssh_auth_errorテーブル登録トランザクション
-        reg_ip_datas_cnt: int = len(reg_ip_datas)
-        if logger is not None:
-            logger.info(f"reg_ip_datas.size: {reg_ip_datas_cnt}")
-
-        # 不正アクセスIPアドレステーブル新規登録
-        if reg_ip_datas_cnt > 0:
-            insert_unauth_ip_main(
-                conn, exists_ip_dict, reg_ip_datas,
-                logger=logger, enable_debug=enable_debug
-            )
-
         # 不正アクセスカウンターテーブル登録用リスト
         ssh_auth_error_list: List[SshAuthError] = get_register_ssh_auth_error_list(
             exists_ip_dict, csv_lines, logger=logger
@@ -385,6 +380,9 @@ def batch_main():
     # レコード登録用CSVファイルの処理終了日付
     parser.add_argument("--to-date", type=str, required=True,
                         help="CSV file to date.")
+    # COPY FROM STDIN によるステージングテーブル経由で登録する
+    parser.add_argument("--use-copy", action="store_true",
+                        help="Bulk insert with COPY FROM STDIN.")
     args: argparse.Namespace = parser.parse_args()
     # CSVディレクトリ
     csv_dir: str = args.csv_dir
@@ -428,6 +426,11 @@ def batch_main():
         db = pgdatabase.PgDatabase(DB_CONF_FILE, logger=None)
         conn: connection = db.get_connection()
         for filename in match_files:
+            if args.use_copy:
+                app_logger.info(f"{filename}")
+                copy_csv_insert(conn, filename, logger=app_logger)
+                continue
+
             csv_lines: List[str] = read_csv(filename)
             csv_line: int = len(csv_lines)
             app_logger.info(f"{filename}: {csv_line}")
@@ -1,36 +1,111 @@
 import json
 import logging
 import socket
-from typing import Optional
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, Optional
 import psycopg2
 from psycopg2.extensions import connection
+from psycopg2.pool import ThreadedConnectionPool
 # from psycopg2.extras import DictConnection
 
 """
 PostgreSQL Database接続生成クラス
+[プールモード] pool_size > 0 ※既定値 (0) は従来どおり1接続を保持する
+ ThreadedConnectionPool から接続を貸し出す (スレッドセーフ)
+ ※貸出中の接続数が pool_size に達している場合は返却されるまで待機する
+ with db.connection() as conn: で接続を取得し、ブロックを抜けるとコミットしてプールに返却する
+  ※例外発生時はロールバックしてから返却する
 """
 
 
+@lru_cache(maxsize=None)
+def _load_config(configfile: str) -> str:
+    # 同一プロセス内では設定ファイルを1回だけ読み込む
+    with open(configfile, 'r') as fp:
+        return fp.read()
+
+
+@lru_cache(maxsize=1)
+def _get_hostname() -> str:
+    return socket.gethostname()
+
+
+def load_db_conf(configfile: str, hostname: Optional[str] = None) -> Dict[str, Any]:
+    db_conf: Dict[str, Any] = json.loads(_load_config(configfile))
+    if hostname is None:
+        hostname = _get_hostname()
+    db_conf["host"] = db_conf["host"].format(hostname=hostname)
+    return db_conf
+
+
 class PgDatabase(object):
     def __init__(self, configfile,
                  hostname: Optional[str] = None,
-                 logger: Optional[logging.Logger] = None):
+                 logger: Optional[logging.Logger] = None,
+                 pool_size: int = 0):
         self.logger = logger
-        with open(configfile, 'r') as fp:
-            db_conf = json.load(fp)
-            if hostname is None:
-                hostname = socket.gethostname()
-            db_conf["host"] = db_conf["host"].format(hostname=hostname)
-        # default connection is itarable curosr
-        self.conn = psycopg2.connect(**db_conf)
-        # Dictinaly-like cursor connection.
-        # self.conn = psycopg2.connect(**db_conf, connection_factory=DictConnection)
-        if self.logger is not None:
-            self.logger.debug(self.conn)
+        db_conf: Dict[str, Any] = load_db_conf(configfile, hostname)
+        self.conn: Optional[connection] = None
+        self.pool: Optional[ThreadedConnectionPool] = None
+        self.pool_slots: Optional[threading.BoundedSemaphore] = None
+        if pool_size > 0:
+            # 最小1接続で生成し、最大 pool_size まで必要に応じて接続する
+            self.pool = ThreadedConnectionPool(1, pool_size, **db_conf)
+            # プールが枯渇すると PoolError になるため貸出数をセマフォで制限する
+            self.pool_slots = threading.BoundedSemaphore(pool_size)
+            if self.logger is not None:
+                self.logger.debug(f"pool_size: {pool_size}")
+        else:
+            # default connection is itarable curosr
+            self.conn = psycopg2.connect(**db_conf)
+            # Dictinaly-like cursor connection.
+            # self.conn = psycopg2.connect(**db_conf, connection_factory=DictConnection)
+            if self.logger is not None:
+                self.logger.debug(self.conn)
 
     def get_connection(self) -> connection:
+        if self.conn is None:
+            if self.pool is None:
+                # 非プールモードの接続は close() 後に再接続しない
+                raise psycopg2.InterfaceError("connection already closed")
+            # プールモード: 初回呼び出し時にプールから取得し close() まで保持する
+            self.conn = self._getconn()
         return self.conn
 
+    def _getconn(self) -> connection:
+        # プールモードでのみ呼び出される
+        assert self.pool is not None and self.pool_slots is not None
+        self.pool_slots.acquire()
+        try:
+            return self.pool.getconn()
+        except Exception:
+            self.pool_slots.release()
+            raise
+
+    def _putconn(self, conn: connection) -> None:
+        assert self.pool is not None and self.pool_slots is not None
+        self.pool.putconn(conn)
+        self.pool_slots.release()
+
+    @contextmanager
+    def connection(self) -> Iterator[connection]:
+        # 非プールモードの場合は既存の接続を使う
+        if self.pool is None:
+            conn: connection = self.get_connection()
+        else:
+            conn = self._getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if self.pool is not None:
+                self._putconn(conn)
+
     def rollback(self) -> None:
         if self.conn is not None:
             self.conn.rollback()
@@ -43,4 +118,11 @@ class PgDatabase(object):
         if self.conn is not None:
             if self.logger is not None:
                 self.logger.debug(f"Close {self.conn}")
-            self.conn.close()
+            if self.pool is not None:
+                self._putconn(self.conn)
+            else:
+                self.conn.close()
+            self.conn = None
+        if self.pool is not None:
+            # プールの全ての接続を閉じる
+            self.pool.closeall()
@@ -11,9 +11,6 @@ FROM
 WHERE
    ip_start LIKE '${1}'
 ORDER BY
- LPAD(SPLIT_PART(ip_start,'.',1), 3, '0') || '.' ||
- LPAD(SPLIT_PART(ip_start,'.',2), 3, '0') || '.' ||
- LPAD(SPLIT_PART(ip_start,'.',3), 3, '0') || '.' ||
- LPAD(SPLIT_PART(ip_start,'.',4), 3, '0');
+ ip_start::inet;
 EOF
 
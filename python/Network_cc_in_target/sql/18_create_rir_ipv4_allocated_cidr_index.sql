@@ -0,0 +1,8 @@
+-- qiita-exampledb
+
+-- 国コードがNULLの不正アクセスIPアドレスをネットワークアドレステーブルと結合して一括更新する
+--   IpNetworkCC_in_hosts.py --server-side-join
+-- ネットワークアドレスの包含検索(inet << cidr)用GiSTインデックス
+DROP INDEX IF EXISTS mainte2.idx_RIR_ipv4_allocated_cidr_gist;
+CREATE INDEX idx_RIR_ipv4_allocated_cidr_gist ON mainte2.RIR_ipv4_allocated_cidr
+  USING gist (network_addr inet_ops);
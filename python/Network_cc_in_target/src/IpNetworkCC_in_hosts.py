@@ -1,8 +1,10 @@
 import argparse
+import bisect
 import csv
 import json
 import logging
 import os
+from array import array
 from collections import OrderedDict
 from datetime import date
 from dataclasses import asdict, dataclass
@@ -14,6 +16,7 @@ import psycopg2
 from psycopg2.extensions import connection, cursor
 
 from db import pgdatabase
+from iputil import ipv4
 from log import logsetting
 
 """
@@ -24,6 +27,9 @@ IPアドレスの国コードを一括取得しファイル保存する
 (1) 不正アクセスIPアドレスマスタ (unath_ip_addr)
   国コードがNULLの全てのIPアドレス取得
 (2) RIRデータマスターテーブル (rir_ipv4_allocated)　　
+  ※ --in-memory-index 指定時は全レコードを一括取得しメモリ上の区間インデックスで検索する
+(3) RIRネットワークアドレステーブル (rir_ipv4_allocated_cidr)
+  ※ --server-side-join 指定時は(1)と結合し国コードの検索と更新を1回のクエリーで実行する
 
 [出力ファイル]
 1. 国コード更新用SQLファイル
@@ -63,6 +69,15 @@ class RirRecord:
     country_code: str
 
 
+# RIRデータのインメモリ区間インデックス
+#  開始IP(整数)の昇順に並べた開始IP・終了IP配列と国コードリストを同じ添字で保持する
+@dataclass(frozen=True)
+class RirIntervalIndex:
+    ip_starts: array
+    ip_ends: array
+    country_codes: List[str]
+
+
 def read_json(file_name: str) -> Dict[str, Any]:
     with open(file_name, 'r') as fp:
         data = json.load(fp)
@@ -117,6 +132,23 @@ def detect_cc_in_cidr_cc_list(
     return match_network, match_cc
 
 
+def add_network_host(
+        param_dict_ip_net: Dict[str, IpNetworkWithCC],
+        match_network: str, match_cc: str, target_ip: str) -> None:
+    # IPネットワークに属する全てのホストをリストに追加
+    data: Optional[IpNetworkWithCC] = param_dict_ip_net.get(match_network)
+    if data is None:
+        # 辞書オブジェクトに存在しない場合はレコードを追加
+        param_dict_ip_net[match_network] = IpNetworkWithCC(
+            ip_network=match_network,
+            country_code=match_cc,
+            ip_hosts=[target_ip]
+        )
+    else:
+        # 辞書オブジェクトに存在したらターケットをホストリストに追加
+        data.ip_hosts.append(target_ip)
+
+
 def get_ip_list_with_null_cc(
         conn: connection,
         fetch_limit: int,
@@ -133,10 +165,7 @@ FROM
 WHERE
    country_code IS NULL 
 ORDER BY
- LPAD(SPLIT_PART(ip_addr,'.',1), 3, '0') || '.' ||
- LPAD(SPLIT_PART(ip_addr,'.',2), 3, '0') || '.' ||
- LPAD(SPLIT_PART(ip_addr,'.',3), 3, '0') || '.' ||
- LPAD(SPLIT_PART(ip_addr,'.',4), 3, '0')
+   ip_addr::inet
 LIMIT {fetch_limit}"""
                         )
             # レコード取得件数チェック
@@ -165,7 +194,7 @@ def get_rir_table_matches(
     result: List[Tuple[str, int, str]]
     try:
         cur: cursor
-        # 前ゼロ埋めしたIPアドレスの昇順にソートする
+        # IPアドレス(inet型)の昇順にソートする
         with conn.cursor() as cur:
             cur.execute("""
 SELECT
@@ -175,10 +204,7 @@ FROM
 WHERE
    ip_start LIKE %(partial_match)s
 ORDER BY
- LPAD(SPLIT_PART(ip_start,'.',1), 3, '0') || '.' ||
- LPAD(SPLIT_PART(ip_start,'.',2), 3, '0') || '.' ||
- LPAD(SPLIT_PART(ip_start,'.',3), 3, '0') || '.' ||
- LPAD(SPLIT_PART(ip_start,'.',4), 3, '0')""",
+   ip_start::inet""",
                         ({'partial_match': like_ip}))
             # レコード取得件数チェック
             if cur.rowcount > 0:
@@ -231,18 +257,9 @@ def detect_cc_in_matches(
         if match_network is not None and match_cc is not None:
             # ネットワークと国コードが取得できた
             if param_dict_ip_net is not None:
-                # IPネットワークに属する全てのホストをリストに追加
-                data: Optional[IpNetworkWithCC] = param_dict_ip_net.get(match_network)
-                if data is None:
-                    # 辞書オブジェクトに存在しない場合はレコードを追加
-                    param_dict_ip_net[match_network] = IpNetworkWithCC(
-                        ip_network=match_network,
-                        country_code=match_cc,
-                        ip_hosts=[str(target_ip_addr)]
-                    )
-                else:
-                    # 辞書オブジェクトに存在したらターケットをホストリストに追加
-                    data.ip_hosts.append(str(target_ip_addr))
+                add_network_host(
+                    param_dict_ip_net, match_network, match_cc, str(target_ip_addr)
+                )
 
     return match_network, match_cc
 
@@ -340,6 +357,196 @@ def rir_table_matches_main(
             sql_lines.append(sql_line)
 
 
+def get_rir_table_all(
+        conn: connection,
+        logger: Optional[logging.Logger] = None) -> List[Tuple[str, int, str]]:
+    result: List[Tuple[str, int, str]]
+    try:
+        cur: cursor
+        # 全レコードを1回のクエリーで取得する ※ソートはインデックス生成時に整数で行う
+        with conn.cursor() as cur:
+            cur.execute("""
+SELECT
+   ip_start,ip_count,country_code
+FROM
+   mainte2.RIR_ipv4_allocated""")
+            if cur.rowcount > 0:
+                result = cur.fetchall()
+            else:
+                result = []
+            if logger is not None:
+                logger.debug(f"rows.size: {len(result)}")
+        return result
+    except (Exception, psycopg2.DatabaseError) as err:
+        raise err
+
+
+def build_rir_interval_index(rows: List[Tuple[str, int, str]]) -> RirIntervalIndex:
+    # (開始IP, 終了IP, 国コード) を開始IPの整数値で昇順ソートする
+    intervals: List[Tuple[int, int, str]] = []
+    for (ip_start, ip_count, country_code) in rows:
+        ip_first: int = ipv4.ip_to_int(ip_start)
+        intervals.append((ip_first, ip_first + int(ip_count) - 1, country_code))
+    intervals.sort()
+    return RirIntervalIndex(
+        ip_starts=array('L', [interval[0] for interval in intervals]),
+        ip_ends=array('L', [interval[1] for interval in intervals]),
+        country_codes=[interval[2] for interval in intervals]
+    )
+
+
+def detect_cc_in_index(
+        target_ip_addr: IPv4Address,
+        rir_index: RirIntervalIndex,
+        param_dict_ip_net: Optional[Dict[str, IpNetworkWithCC]] = None,
+        logger: Optional[logging.Logger] = None) -> Tuple[Optional[str], Optional[str]]:
+    target_ip_int: int = int(target_ip_addr)
+    # ターゲットIP以下の開始IPを持つ最後のレコードを二分探索する
+    pos: int = bisect.bisect_right(rir_index.ip_starts, target_ip_int) - 1
+    if pos < 0 or rir_index.ip_ends[pos] < target_ip_int:
+        # どの割り当て範囲にも含まれない
+        return None, None
+
+    ip_start: int = rir_index.ip_starts[pos]
+    match_cc: str = rir_index.country_codes[pos]
+    # 一致したレコードのみネットワークアドレス(CIDR)に展開する
+    cidr_cc_list: List[Tuple[IPv4Network, str]] = get_cidr_cc_list(
+        ipv4.int_to_ip(ip_start), rir_index.ip_ends[pos] - ip_start + 1, match_cc
+    )
+    if logger is not None:
+        logger.debug(cidr_cc_list)
+    match_network: Optional[str]
+    match_network, _ = detect_cc_in_cidr_cc_list(str(target_ip_addr), cidr_cc_list)
+    if match_network is not None and param_dict_ip_net is not None:
+        add_network_host(param_dict_ip_net, match_network, match_cc, str(target_ip_addr))
+    return match_network, match_cc
+
+
+def rir_index_matches_main(
+        conn: connection,
+        target_ip_list: List[str],
+        dict_ip_network_cc: Optional[Dict[str, IpNetworkWithCC]],
+        unknown_ip_list: Optional[List[str]],
+        sql_lines: Optional[List[str]],
+        logger: logging.Logger, enable_debug: bool = False) -> None:
+    # RIRデータを1回だけ読み込みインメモリ区間インデックスを生成する
+    rir_index: RirIntervalIndex = build_rir_interval_index(
+        get_rir_table_all(conn, logger=logger if enable_debug else None)
+    )
+    logger.info(f"rir_index.size: {len(rir_index.country_codes)}")
+
+    for i, target_ip in enumerate(target_ip_list):
+        target_ip_addr: IPv4Address = ip_address(target_ip)  # type: ignore
+        match_cc: Optional[str]
+        _, match_cc = detect_cc_in_index(
+            target_ip_addr,
+            rir_index,
+            param_dict_ip_net=dict_ip_network_cc,
+            logger=logger if enable_debug else None
+        )
+        upd_cc: str
+        if match_cc is not None:
+            upd_cc = match_cc
+            if enable_debug:
+                logger.debug(f"{i + 1:04d}: {target_ip}, {upd_cc}")
+        else:
+            # 一致なし
+            upd_cc = CC_UNKNOWN
+            logger.warning(f"{i + 1:04d}: {target_ip}, RIR_ipv4_allocated no match.")
+            if unknown_ip_list is not None:
+                unknown_ip_list.append(target_ip)
+
+        if sql_lines is not None:
+            sql_lines.append(FMT_SQL.format(upd_cc, target_ip))
+
+
+def update_cc_with_rir_cidr_join(
+        conn: connection,
+        fetch_limit: int,
+        logger: Optional[logging.Logger] = None) -> List[Tuple[str, str, Optional[str]]]:
+    result: List[Tuple[str, str, Optional[str]]]
+    try:
+        cur: cursor
+        # 国コードがNULLのIPアドレスとネットワークアドレスを結合し1回のUPDATEで国コードを更新する
+        #  ネットワークアドレス列のGiSTインデックス(inet_ops)で包含検索する
+        #  一致しないIPアドレスは国コード不明('??')で更新する
+        with conn.cursor() as cur:
+            cur.execute("""
+WITH targets AS (
+   SELECT
+      ip_addr
+   FROM
+      mainte2.unauth_ip_addr
+   WHERE
+      country_code IS NULL
+   LIMIT %(fetch_limit)s
+), matches AS (
+   SELECT
+      t.ip_addr,
+      COALESCE(r.country_code, %(cc_unknown)s) AS country_code,
+      r.network_addr
+   FROM
+      targets t
+      LEFT JOIN LATERAL (
+         SELECT
+            network_addr, country_code
+         FROM
+            mainte2.RIR_ipv4_allocated_cidr
+         WHERE
+            network_addr >> t.ip_addr::inet
+         LIMIT 1
+      ) r ON true
+)
+UPDATE
+   mainte2.unauth_ip_addr u
+SET
+   country_code = m.country_code
+FROM
+   matches m
+WHERE
+   u.ip_addr = m.ip_addr
+RETURNING
+   m.ip_addr, m.country_code, m.network_addr::text""",
+                        ({'fetch_limit': fetch_limit, 'cc_unknown': CC_UNKNOWN}))
+            if cur.rowcount > 0:
+                rows: List[Tuple[str, str, Optional[str]]] = cur.fetchall()
+                # RETURNINGの順序は不定のためIPアドレスの昇順にソートする
+                result = sorted(rows, key=lambda row: ipv4.ip_to_int(row[0]))
+            else:
+                result = []
+            if logger is not None:
+                if cur.query is not None:
+                    logger.debug(f"{cur.query.decode('utf-8')}")
+                logger.debug(f"rows.size: {len(result)}")
+        return result
+    except (Exception, psycopg2.DatabaseError) as err:
+        raise err
+
+
+def rir_cidr_join_main(
+        conn: connection,
+        fetch_limit: int,
+        dict_ip_network_cc: Optional[Dict[str, IpNetworkWithCC]],
+        unknown_ip_list: Optional[List[str]],
+        sql_lines: Optional[List[str]],
+        logger: logging.Logger, enable_debug: bool = False) -> int:
+    updated_rows: List[Tuple[str, str, Optional[str]]] = update_cc_with_rir_cidr_join(
+        conn, fetch_limit, logger=logger if enable_debug else None
+    )
+    # 更新結果から出力ファイルの内容を生成する
+    for (ip_addr, country_code, network_addr) in updated_rows:
+        if network_addr is None:
+            logger.warning(f"{ip_addr}, RIR_ipv4_allocated_cidr no match.")
+            if unknown_ip_list is not None:
+                unknown_ip_list.append(ip_addr)
+        elif dict_ip_network_cc is not None:
+            add_network_host(dict_ip_network_cc, network_addr, country_code, ip_addr)
+
+        if sql_lines is not None:
+            sql_lines.append(FMT_SQL.format(country_code, ip_addr))
+    return len(updated_rows)
+
+
 def save_network_cc_dict(
         date_part: str, save_dir: str, dict_ip_network_cc: Dict[str, IpNetworkWithCC],
         logger: logging.Logger) -> None:
@@ -387,6 +594,14 @@ def export_main():
     # 不正アクセスIPマスタの国コード更新クエリーファイルを出力しない
     parser.add_argument("--no-output-sql", action="store_true",
                         help="No output country_code update SQL file.")
+    # 国コードの検索方法 ※同時に指定できない
+    detect_group = parser.add_mutually_exclusive_group()
+    # RIRデータを一括読み込みしメモリ上の区間インデックスで国コードを検索する
+    detect_group.add_argument("--in-memory-index", action="store_true",
+                              help="Detect country code with in-memory RIR interval index.")
+    # 国コードの検索と更新をデータベース側で一括実行する ※更新結果をSQLファイルに記録する
+    detect_group.add_argument("--server-side-join", action="store_true",
+                              help="Update country code with RIR_ipv4_allocated_cidr join.")
     # fetch-limitが10件程度の場合に指定する ※大量のログが出力される
     parser.add_argument("--enable-debug", action="store_true",
                         help="Enable logger debug out.")
@@ -394,6 +609,8 @@ def export_main():
     fetch_limit: int = args.fetch_limit
     save_match_network: bool = args.save_match_network
     no_output_sql: bool = args.no_output_sql
+    in_memory_index: bool = args.in_memory_index
+    server_side_join: bool = args.server_side_join
     enable_debug: bool = args.enable_debug
 
     # クエリーの出力先
@@ -424,19 +641,36 @@ def export_main():
     try:
         db = pgdatabase.PgDatabase(DB_CONF_FILE, logger=None)
         conn: connection = db.get_connection()
-        # 国コードがNULLのIPアドレスを取得 ※大量にログが出力されるためloggerにNoneを設定する
-        target_ip_list: List[str] = get_ip_list_with_null_cc(
-            conn, fetch_limit, logger=None
-        )
-        target_ip_list_size: int = len(target_ip_list)
-        app_logger.info(f"target_ip_list.size: {target_ip_list_size}")
-
-        if target_ip_list_size > 0:
-            rir_table_matches_main(
-                conn, target_ip_list, dict_ip_network_cc, unknown_ip_list, sql_lines,
+        if server_side_join:
+            # 検索と更新を1回のクエリーで実行する
+            updated_count: int = rir_cidr_join_main(
+                conn, fetch_limit, dict_ip_network_cc, unknown_ip_list, sql_lines,
                 app_logger, enable_debug
             )
+            db.commit()
+            app_logger.info(f"updated.count: {updated_count}")
+        else:
+            # 国コードがNULLのIPアドレスを取得 ※大量にログが出力されるためloggerにNoneを設定する
+            target_ip_list: List[str] = get_ip_list_with_null_cc(
+                conn, fetch_limit, logger=None
+            )
+            target_ip_list_size: int = len(target_ip_list)
+            app_logger.info(f"target_ip_list.size: {target_ip_list_size}")
+
+            if target_ip_list_size > 0:
+                if in_memory_index:
+                    rir_index_matches_main(
+                        conn, target_ip_list, dict_ip_network_cc, unknown_ip_list,
+                        sql_lines, app_logger, enable_debug
+                    )
+                else:
+                    rir_table_matches_main(
+                        conn, target_ip_list, dict_ip_network_cc, unknown_ip_list,
+                        sql_lines, app_logger, enable_debug
+                    )
     except psycopg2.Error as db_err:
+        if db is not None:
+            db.rollback()
         app_logger.error(db_err)
         exit(1)
     except Exception as err:
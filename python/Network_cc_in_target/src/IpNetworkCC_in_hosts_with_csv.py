@@ -13,6 +13,7 @@ import psycopg2
 from psycopg2.extensions import connection, cursor
 
 from db import pgdatabase
+from iputil import ipv4
 
 """
 [Qiita投稿No38用スクリプト]
@@ -102,7 +103,7 @@ def get_rir_table_matches(
     result: List[Tuple[str, int, str]]
     try:
         cur: cursor
-        # 前ゼロ埋めしたIPアドレスの昇順にソートする
+        # IPアドレス(inet型)の昇順にソートする
         with conn.cursor() as cur:
             cur.execute("""
 SELECT
@@ -112,10 +113,7 @@ FROM
 WHERE
    ip_start LIKE %(partial_match)s
 ORDER BY
- LPAD(SPLIT_PART(ip_start,'.',1), 3, '0') || '.' ||
- LPAD(SPLIT_PART(ip_start,'.',2), 3, '0') || '.' ||
- LPAD(SPLIT_PART(ip_start,'.',3), 3, '0') || '.' ||
- LPAD(SPLIT_PART(ip_start,'.',4), 3, '0')""",
+   ip_start::inet""",
                         ({'partial_match': like_ip}))
             # レコード取得件数チェック
             if cur.rowcount > 0:
@@ -185,21 +183,8 @@ def detect_cc_in_matches(
 def sorted_ip_addr_list(csv_lines: List[str]) -> List[str]:
     # CSVからIPアドレス(2列目)のみを取得
     ip_list: List[str] = [csv_line.split(",")[1] for csv_line in csv_lines]
-    # IPアドレスをドットで分割した各パートごとに前ゼロ3桁に加工する
-    ip_full_list: List = []
-    for ip_item in ip_list:
-        ip_4 = ip_item.split('.')
-        full = f"{int(ip_4[0]):03}.{int(ip_4[1]):03}.{int(ip_4[2]):03}.{int(ip_4[3]):03}"
-        ip_full_list.append(full)
-    # 前ゼロ3桁に加工したIPアドレスを昇順でソートする
-    sorted_ip_list: List = sorted(ip_full_list)
-    # ソート済みIPアドレスを元に戻す
-    sorted_org_ip_list: List = []
-    for full_ip in sorted_ip_list:
-        fields = full_ip.split('.')
-        org_ip = f"{int(fields[0])}.{int(fields[1])}.{int(fields[2])}.{int(fields[3])}"
-        sorted_org_ip_list.append(org_ip)
-    return sorted_org_ip_list
+    # IPアドレスの整数値をキーに昇順でソートする
+    return ipv4.sorted_ip_list(ip_list)
 
 
 def rir_table_matches_main(
@@ -74,7 +74,7 @@ def get_rir_table_matches(
     result: List[Tuple[str, int, str]]
     try:
         cur: cursor
-        # 前ゼロ埋めしたIPアドレスの昇順にソートする
+        # IPアドレス (inet型) の昇順にソートする
         with conn.cursor() as cur:
             cur.execute("""
 SELECT
@@ -84,10 +84,7 @@ FROM
 WHERE
    ip_start LIKE %(partial_match)s
 ORDER BY
- LPAD(SPLIT_PART(ip_start,'.',1), 3, '0') || '.' ||
- LPAD(SPLIT_PART(ip_start,'.',2), 3, '0') || '.' ||
- LPAD(SPLIT_PART(ip_start,'.',3), 3, '0') || '.' ||
- LPAD(SPLIT_PART(ip_start,'.',4), 3, '0')""",
+ ip_start::inet""",
                         ({'partial_match': like_ip}))
             # レコード取得件数チェック
             if cur.rowcount > 0:
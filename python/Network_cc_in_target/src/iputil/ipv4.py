@@ -0,0 +1,64 @@
+import socket
+import struct
+from array import array
+from typing import Any, Iterable, List
+
+"""
+IPv4アドレス変換ユーティリティ
+IPアドレス文字列と32ビット整数(ネットワークバイトオーダー)を相互変換する
+
+[用途]
+ 前ゼロ3桁に加工した文字列でのソートに替えて整数値をキーにソートする
+ ※SQLでは LPAD(SPLIT_PART(...)) の替わりに ip_addr::inet でソートする
+"""
+
+# 符号なし32ビット整数の配列型コード
+ARRAY_TYPECODE: str = 'L'
+
+
+def ip_to_int(ip_addr: str) -> int:
+    # inet_pton は "1.2" などの省略形式を受け付けない
+    return int.from_bytes(socket.inet_pton(socket.AF_INET, ip_addr), 'big')
+
+
+def int_to_ip(ip_int: int) -> str:
+    return socket.inet_ntop(socket.AF_INET, ip_int.to_bytes(4, 'big'))
+
+
+def sorted_ip_list(ip_list: Iterable[str], unique: bool = False) -> List[str]:
+    # 整数値をキーにIPアドレスの昇順でソートする
+    if unique:
+        ip_list = set(ip_list)
+    return sorted(ip_list, key=ip_to_int)
+
+
+def packed_ip_list(ip_list: Iterable[str]) -> bytes:
+    # IPアドレスを4バイトずつ連結したバイト列
+    return b"".join(socket.inet_pton(socket.AF_INET, ip_addr) for ip_addr in ip_list)
+
+
+def to_int_array(ip_list: List[str]) -> array:
+    # 連結したバイト列を一括でアンパックする
+    packed: bytes = packed_ip_list(ip_list)
+    return array(ARRAY_TYPECODE, struct.unpack(f">{len(ip_list)}I", packed))
+
+
+def from_int_array(ip_ints: Iterable[int]) -> List[str]:
+    return [int_to_ip(int(ip_int)) for ip_int in ip_ints]
+
+
+def to_int_ndarray(ip_list: List[str]) -> Any:
+    # NumPyがインストールされている場合のみ利用可能 ※未インストールなら ImportError
+    import numpy as np
+
+    # ビッグエンディアンの4バイト符号なし整数として一括変換し、ネイティブのバイトオーダーに変換する
+    return np.frombuffer(packed_ip_list(ip_list), dtype='>u4').astype(np.uint32)
+
+
+def from_int_ndarray(ip_ints: Any) -> List[str]:
+    import numpy as np
+
+    # ネイティブのバイトオーダーの配列をビッグエンディアンのバイト列に変換して4バイトずつ復元する
+    packed: bytes = np.asarray(ip_ints, dtype='>u4').tobytes()
+    return [socket.inet_ntop(socket.AF_INET, packed[i:i + 4])
+            for i in range(0, len(packed), 4)]
@@ -11,7 +11,7 @@ from psycopg2.extensions import connection
 from db import pgdatabase
 from dao.unauth_ip_addr import bulk_exists_ip_addr
 from dao.ssh_auth_error import (
-    bulk_insert_values, bulk_insert_batch, bulk_insert_many
+    bulk_insert_values, bulk_insert_batch, bulk_insert_many, bulk_insert_copy
 )
 
 """
@@ -63,8 +63,8 @@ if __name__ == '__main__':
                         help="処理する CSVファイル数 ※未指定なら指定されたディレクトリのすべてのファイル")
     # 一括処理関数型:
     parser.add_argument("--insert-type", type=str,
-                        choices=["batch", "many", "values"], default="values",
-                        help="Bulk insert: 'batch'|'values'|'many', default 'values'.")
+                        choices=["batch", "many", "values", "copy"], default="values",
+                        help="Bulk insert: 'batch'|'values'|'many'|'copy', default 'values'.")
     # ホスト名: 任意 (例) hp-z820 ※末尾に ".local"はつけない
     parser.add_argument("--db-host", type=str, help="Other database hostname.")
     args: argparse.Namespace = parser.parse_args()
@@ -150,6 +150,10 @@ if __name__ == '__main__':
                 bulk_insert_batch(
                     conn, tuple(param_list), logger=app_logger
                 )
+            elif insert_type == "copy":
+                bulk_insert_copy(
+                    conn, tuple(param_list), logger=app_logger
+                )
             else:
                 bulk_insert_values(
                     conn, tuple(param_list), logger=app_logger
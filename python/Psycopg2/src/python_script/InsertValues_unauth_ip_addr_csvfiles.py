@@ -10,12 +10,13 @@ from psycopg2.extensions import connection
 
 from db import pgdatabase
 from dao.unauth_ip_addr import (
-    bulk_exists_ip_addr, 
-    bulk_insert_values_with_fetch
+    bulk_insert_copy_with_fetch, bulk_upsert_ip_addr_with_fetch
 )
 
 """
 Qiita投稿用: 指定したディレクトリ内の複数のCSVファイルから一括登録する
+ --insert-type upsert: 登録済みを含む全てのIPアドレスのIDを取得する (既定値)
+ --insert-type copy: COPY FROM STDIN で転送して登録し、新規登録したIPアドレスのIDのみ取得する
 """
 
 
@@ -62,6 +63,10 @@ if __name__ == '__main__':
                         help="処理する CSVファイル数 ※未指定なら指定されたディレクトリのすべてのファイル")
     # ホスト名: 任意 (例) hp-z820 ※末尾に ".local"はつけない
     parser.add_argument("--db-host", type=str, help="Other database hostname.")
+    # 一括登録方式
+    parser.add_argument("--insert-type", type=str,
+                        choices=["upsert", "copy"], default="upsert",
+                        help="Bulk insert: 'upsert'|'copy', default 'upsert'.")
     args: argparse.Namespace = parser.parse_args()
     # 処理するファイル数
     file_limit: Optional[int] = args.file_limit
@@ -104,50 +109,29 @@ if __name__ == '__main__':
         for csv_file in csv_files:
             csv_lines: List[str] = read_csv(csv_file)
             app_logger.info(f"{os.path.basename(csv_file)}: {len(csv_lines)} lines")
-            # CSVから取得したIPアドレス(2列目)が登録済みかチェック
-            ip_list: List[str] = [csv_line.split(",")[1] for csv_line in csv_lines]
-            exists_ip_dict: Dict[str, int] = bulk_exists_ip_addr(
-                conn, ip_list, logger=None
-            )
-            app_logger.info(f"exists_ip_dict.size: {len(exists_ip_dict)}")
-
-            # 登録済みIPアドレスを除外した追加登録用のレコードリストを作成
+            # CSVの1列目(登録日)と2列目(IPアドレス)から登録用のレコードリストを作成
             reg_datas: List[RegUnauthIpAddr] = []
-            fields: List[str]
-            if len(exists_ip_dict) > 0:
-                registered_cnt: int = 0
-                for csv_line in csv_lines:
-                    fields = csv_line.split(",")
-                    key: str = fields[1]
-                    registered_id: Optional[int] = exists_ip_dict.get(key)
-                    if registered_id is None:
-                        reg_datas.append(
-                            RegUnauthIpAddr(ip_addr=key, reg_date=fields[0])
-                        )
-                    else:
-                        registered_cnt += 1
-                app_logger.info(f"Registered.count: {registered_cnt}")
-            else:
-                # 登録済みレコードがない場合はすべて登録
-                for csv_line in csv_lines:
-                    fields = csv_line.split(",")
-                    reg_datas.append(
-                        RegUnauthIpAddr(ip_addr=fields[1], reg_date=fields[0])
-                    )
-
-            # 追加登録用のレコードリストがあれば登録する
-            ret_ids: Dict[str, int]
-            if len(reg_datas) > 0:
-                # dataclassを辞書のタプルに変換
-                params: Tuple[Dict[str, Any], ...] = tuple(
-                    [dict(asdict(rec)) for rec in reg_datas]
-                )
-                ret_ids = bulk_insert_values_with_fetch(
-                    conn, params, logger=app_logger
+            for csv_line in csv_lines:
+                fields: List[str] = csv_line.split(",")
+                reg_datas.append(
+                    RegUnauthIpAddr(ip_addr=fields[1], reg_date=fields[0])
                 )
-                app_logger.info(f"registered ids.size: {len(ret_ids)}")
-            else:
+            if len(reg_datas) == 0:
                 app_logger.info("No registered record.")
+                continue
+
+            # dataclassを辞書のタプルに変換
+            params: Tuple[Dict[str, Any], ...] = tuple(
+                [dict(asdict(rec)) for rec in reg_datas]
+            )
+            ret_ids: Dict[str, int]
+            if args.insert_type == "copy":
+                # 未登録のIPアドレスのみ登録し、登録したIPアドレスのIDを取得する
+                ret_ids = bulk_insert_copy_with_fetch(conn, params, logger=None)
+            else:
+                # 未登録のIPアドレスのみ登録し、登録済みを含む全てのIPアドレスのIDを取得する
+                ret_ids = bulk_upsert_ip_addr_with_fetch(conn, params, logger=None)
+            app_logger.info(f"ip_addr ids.size: {len(ret_ids)}")
 
         conn.commit()
     except Exception as exp:
@@ -1,3 +1,5 @@
+import csv
+import io
 from logging import Logger
 from typing import Any, Dict, List, Optional, Tuple
 
@@ -178,3 +180,46 @@ INSERT INTO mainte2.ssh_auth_error(log_date, ip_id, appear_count)
                 logger.info(f"cur.rowcount: {cur.rowcount}")
     except (Exception, psycopg2.DatabaseError) as err:
         raise err
+
+
+# COPY FROM STDIN でステージングテーブルに一括転送し、INSERT ... SELECT で登録する
+def bulk_insert_copy(
+        conn: connection,
+        qry_params: tuple[Dict[str, Any], ...],
+        logger: Optional[Logger] = None) -> None:
+    if logger is not None:
+        logger.debug(f"qry_params: \n{qry_params}")
+    # 登録データをメモリ上のCSVバッファに書き込む
+    buffer: io.StringIO = io.StringIO()
+    writer = csv.writer(buffer, dialect='unix', quoting=csv.QUOTE_MINIMAL)
+    for param in qry_params:
+        writer.writerow((param['log_date'], param['ip_id'], param['appear_count']))
+    buffer.seek(0)
+    try:
+        cur: cursor
+        with conn.cursor() as cur:
+            # トランザクション終了時に削除される一時テーブル
+            cur.execute("""
+CREATE TEMP TABLE IF NOT EXISTS tmp_ssh_auth_error(
+   LIKE mainte2.ssh_auth_error
+) ON COMMIT DROP""")
+            cur.execute("TRUNCATE tmp_ssh_auth_error")
+            cur.copy_expert(
+                "COPY tmp_ssh_auth_error(log_date, ip_id, appear_count)"
+                " FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+            if logger is not None:
+                logger.info(f"copy.rowcount: {cur.rowcount}")
+            # 登録済みのレコード(log_date, ip_id)は無視する
+            cur.execute("""
+INSERT INTO mainte2.ssh_auth_error(log_date, ip_id, appear_count)
+ SELECT log_date, ip_id, appear_count FROM tmp_ssh_auth_error
+ ON CONFLICT DO NOTHING""")
+            if logger is not None:
+                if cur.query is not None:
+                    logger.debug(f"{cur.query.decode('utf-8')}")
+                # 登録済み処理件数 ※ログレベルをINFO
+                logger.info(f"cur.rowcount: {cur.rowcount}")
+    except (Exception, psycopg2.DatabaseError) as err:
+        raise err
@@ -1,3 +1,5 @@
+import csv
+import io
 from logging import Logger
 from typing import Any, Dict, List, Optional, Tuple
 
@@ -162,3 +164,105 @@ FROM mainte2.unauth_ip_addr
             return result_dict
     except (Exception, psycopg2.DatabaseError) as err:
         raise err
+
+
+# 登録済みチェックと登録を1回のクエリーで実行する (ON CONFLICT DO NOTHING)
+#  bulk_exists_ip_addr() + bulk_insert_values_with_fetch() の替わり
+def bulk_upsert_ip_addr_with_fetch(
+        conn: connection,
+        qry_params: tuple[Dict[str, Any], ...],
+        logger: Optional[Logger] = None) -> Dict[str, int]:
+    if logger is not None:
+        logger.debug(f"qry_params: \n{qry_params}")
+    try:
+        cur: cursor
+        with conn.cursor() as cur:
+            # 未登録のIPアドレスを登録し、登録したIPアドレスと登録済みのIPアドレスのIDを返却する
+            #  ※ UNION ALL の後半は INSERT 前のスナップショットを参照するため登録済みのみが該当する
+            rows: List[Tuple[Any, ...]] = execute_values(
+                cur,
+                """
+WITH params(ip_addr, reg_date) AS (
+   VALUES %s
+), ins AS (
+   INSERT INTO mainte2.unauth_ip_addr(ip_addr, reg_date)
+    SELECT ip_addr, reg_date::DATE FROM params
+    ON CONFLICT (ip_addr) DO NOTHING
+    RETURNING id,ip_addr
+)
+SELECT id,ip_addr FROM ins
+UNION ALL
+SELECT
+   uia.id, uia.ip_addr
+FROM
+   mainte2.unauth_ip_addr uia
+   INNER JOIN params ON params.ip_addr = uia.ip_addr""",
+                qry_params,
+                template="(%(ip_addr)s, %(reg_date)s)",
+                # 1回のクエリーで実行する
+                page_size=max(len(qry_params), 1),
+                fetch=True
+            )
+            # 実行されたSQLを出力
+            if logger is not None:
+                if cur.query is not None:
+                    logger.debug(f"{cur.query.decode('utf-8')}")
+                logger.debug(f"rows: {rows}")
+
+            # 戻り値: IPアドレスをキーとするIPのIDの辞書
+            result_dict: Dict[str, int] = {ip_addr: ip_id for (ip_id, ip_addr) in rows}
+            return result_dict
+    except (Exception, psycopg2.DatabaseError) as err:
+        raise err
+
+
+# COPY FROM STDIN でステージングテーブルに一括転送し、INSERT ... SELECT で登録する
+def bulk_insert_copy_with_fetch(
+        conn: connection,
+        qry_params: tuple[Dict[str, Any], ...],
+        logger: Optional[Logger] = None) -> Dict[str, int]:
+    if logger is not None:
+        logger.debug(f"qry_params: \n{qry_params}")
+    # 登録データをメモリ上のCSVバッファに書き込む
+    buffer: io.StringIO = io.StringIO()
+    writer = csv.writer(buffer, dialect='unix', quoting=csv.QUOTE_MINIMAL)
+    for param in qry_params:
+        writer.writerow((param['ip_addr'], param['reg_date']))
+    buffer.seek(0)
+    try:
+        cur: cursor
+        with conn.cursor() as cur:
+            # トランザクション終了時に削除される一時テーブル
+            cur.execute("""
+CREATE TEMP TABLE IF NOT EXISTS tmp_unauth_ip_addr(
+   ip_addr VARCHAR(15) NOT NULL,
+   reg_date DATE NOT NULL
+) ON COMMIT DROP""")
+            cur.execute("TRUNCATE tmp_unauth_ip_addr")
+            cur.copy_expert(
+                "COPY tmp_unauth_ip_addr(ip_addr, reg_date) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+            if logger is not None:
+                logger.info(f"copy.rowcount: {cur.rowcount}")
+            # 登録済みのIPアドレスは無視する
+            cur.execute("""
+INSERT INTO mainte2.unauth_ip_addr(ip_addr, reg_date)
+ SELECT ip_addr, reg_date FROM tmp_unauth_ip_addr
+ ON CONFLICT (ip_addr) DO NOTHING
+ RETURNING id,ip_addr""")
+            if logger is not None:
+                if cur.query is not None:
+                    logger.debug(f"{cur.query.decode('utf-8')}")
+                # 登録済み処理件数 ※ログレベルをINFO
+                logger.info(f"cur.rowcount: {cur.rowcount}")
+            # 戻り値を取得する
+            rows: List[Tuple[Any, ...]] = cur.fetchall()
+            if logger is not None:
+                logger.debug(f"rows: {rows}")
+
+            # 戻り値: IPアドレスをキーとするIPのIDの辞書
+            result_dict: Dict[str, int] = {ip_addr: ip_id for (ip_id, ip_addr) in rows}
+            return result_dict
+    except (Exception, psycopg2.DatabaseError) as err:
+        raise err
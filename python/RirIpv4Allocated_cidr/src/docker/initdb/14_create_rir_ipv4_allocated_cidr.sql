@@ -40,3 +40,6 @@ ALTER TABLE mainte2.RIR_ipv4_allocated_cidr ADD CONSTRAINT fk_RIR_ipv4_allocated
 ALTER TABLE mainte2.RIR_registory_mst OWNER TO developer;
 ALTER TABLE mainte2.RIR_ipv4_allocated_cidr OWNER TO developer;
 
+-- ネットワークアドレスの包含検索(inet << cidr)用GiSTインデックス
+CREATE INDEX idx_RIR_ipv4_allocated_cidr_gist ON mainte2.RIR_ipv4_allocated_cidr
+  USING gist (network_addr inet_ops);
@@ -2,13 +2,14 @@ import argparse
 import csv
 import logging
 import os
-import typing
 from typing import Iterator, List, Optional, Tuple
 
 from ipaddress import (
-    ip_address, summarize_address_range, IPv4Address, IPv4Network
+    summarize_address_range, IPv4Address, IPv4Network
 )
 
+from iputil import ipv4
+
 
 """
 RIR ipv4 allocated CSV file to cidr network.
@@ -43,11 +44,12 @@ def get_file_writer(file_name: str):
 
 
 def ip_start_to_cidr_network(csv_lines: List[List]) -> List[str]:
-    @typing.no_type_check
     def get_cidr_list(ip_start: str,
                       ip_count: int) -> List[str]:
-        addr_first: IPv4Address = ip_address(ip_start)
-        addr_last: IPv4Address = addr_first + ip_count - 1
+        # 開始IPとブロードキャストアドレスを整数値で計算する
+        ip_first: int = ipv4.ip_to_int(ip_start)
+        addr_first: IPv4Address = IPv4Address(ip_first)
+        addr_last: IPv4Address = IPv4Address(ip_first + ip_count - 1)
         cidr_ite: Iterator[IPv4Network] = summarize_address_range(addr_first, addr_last)
         return [str(network) for network in cidr_ite]
 
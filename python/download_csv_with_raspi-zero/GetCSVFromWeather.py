@@ -1,11 +1,16 @@
 import argparse
 import logging
 import os
-from typing import Optional
-from db.weatherdb import WeatherFinder
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from db.weatherdb import FMT_ISO8601_DATE, WeatherFinder, ensure_weather_index
 
 """
 Export t_weather to CSV file.
+ 複数デバイス (--device-name を複数指定) または月単位に分割 (--split-monthly) した期間を
+ --workers で指定したプロセス数で並列にエクスポートする ※ワーカーごとに読み込み専用接続を使用
 for python 3.7.x
 """
 
@@ -15,6 +20,82 @@ PATH_WEATHER_DB: str = os.environ.get("PATH_WEATHER_DB", "~/db/weather.db")
 OUTPUT_CSV_PATH: str = os.environ.get("OUTPUT_CSV_PATH", "~/Downloads/csv/")
 
 
+# (デバイス名, 検索開始日, 検索終了日)
+ExportTask = Tuple[str, str, str]
+# (CSVファイルパス, レコード件数, 処理時間(秒), ワーカープロセスID)
+ExportResult = Tuple[str, int, float, int]
+
+
+def split_monthly(date_from: str, date_to: str) -> List[Tuple[str, str]]:
+    """
+    Split date range to monthly ranges.
+    (例) 2023-11-15, 2024-01-10 -> [(2023-11-15, 2023-11-30), (2023-12-01, 2023-12-31),
+                                   (2024-01-01, 2024-01-10)]
+    """
+    d_from: date = date.fromisoformat(date_from)
+    d_to: date = date.fromisoformat(date_to)
+    ranges: List[Tuple[str, str]] = []
+    while d_from <= d_to:
+        # 翌月1日の前日が月末日
+        next_month: date = (d_from.replace(day=1) + timedelta(days=32)).replace(day=1)
+        month_end: date = min(next_month - timedelta(days=1), d_to)
+        ranges.append(
+            (d_from.strftime(FMT_ISO8601_DATE), month_end.strftime(FMT_ISO8601_DATE))
+        )
+        d_from = next_month
+    return ranges
+
+
+def export_task(db_path: str, output_dir: str, task: ExportTask,
+                compress: bool, logger: Optional[logging.Logger] = None) -> ExportResult:
+    """
+    Export one task with own read-only connection.
+    ※ProcessPoolExecutor から呼び出すため、モジュールレベルの関数とする
+    """
+    device_name, date_from, date_to = task
+    start: float = time.perf_counter()
+    finder: WeatherFinder = WeatherFinder(db_path, logger=logger)
+    try:
+        csv_file: str = finder.export_csv(
+            device_name, date_from=date_from, date_to=date_to,
+            output_dir=output_dir, compress=compress
+        )
+        return csv_file, finder.row_count, time.perf_counter() - start, os.getpid()
+    finally:
+        finder.close()
+
+
+def export_parallel(db_path: str, output_dir: str, tasks: List[ExportTask],
+                    compress: bool, workers: int, logger: logging.Logger) -> None:
+    # ワーカープロセスごとの (レコード件数, 処理時間)
+    worker_stats: Dict[int, List[float]] = {}
+    start: float = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures: Dict[Future, ExportTask] = {
+            executor.submit(export_task, db_path, output_dir, task, compress): task
+            for task in tasks
+        }
+        for future in as_completed(futures):
+            try:
+                csv_file, row_count, elapsed, pid = future.result()
+            except Exception as e:
+                logger.warning("Export error {}: {}".format(futures[future], e))
+                continue
+            logger.info("Saved Weather CSV: {}, rows: {}, {:.3f} sec, {:,.0f} rows/sec".format(
+                csv_file, row_count, elapsed, row_count / elapsed if elapsed > 0 else 0.))
+            stats: List[float] = worker_stats.setdefault(pid, [0, 0.])
+            stats[0] += row_count
+            stats[1] += elapsed
+    total_rows: int = 0
+    for pid, (rows, busy) in sorted(worker_stats.items()):
+        total_rows += int(rows)
+        logger.info("worker[{}]: rows: {}, {:.3f} sec, {:,.0f} rows/sec".format(
+            pid, int(rows), busy, rows / busy if busy > 0 else 0.))
+    total_elapsed: float = time.perf_counter() - start
+    logger.info("Total: tasks: {}, rows: {}, {:.3f} sec, {:,.0f} rows/sec".format(
+        len(tasks), total_rows, total_elapsed, total_rows / total_elapsed))
+
+
 if __name__ == '__main__':
     logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
     app_logger: logging.Logger = logging.getLogger(__name__)
@@ -23,37 +104,53 @@ if __name__ == '__main__':
     app_logger.info(f"OUTPUT_CSV_PATH: {OUTPUT_CSV_PATH}")
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("--device-name", type=str, required=True,
-                        help="Device name with t_device name.")
+    parser.add_argument("--device-name", type=str, required=True, nargs="+",
+                        help="Device name with t_device name, multiple names allowed.")
     parser.add_argument("--date-from", type=str, required=True,
                         help="Date from with t_weather.measurement_time.")
     parser.add_argument("--date-to", type=str, required=True,
                         help="Date to with t_weather.measurement_time.")
+    # 検索用のインデックスを確認し、なければ作成する ※初回のみ (データベースへの書き込み権限が必要)
+    parser.add_argument("--create-index", action="store_true",
+                        help="Create index (did, measurement_time) of t_weather if not used.")
+    # gzip圧縮したCSVファイル (*.csv.gz) を出力する
+    parser.add_argument("--gzip", action="store_true",
+                        help="Output gzip compressed CSV file.")
+    # 検索期間を月単位のCSVファイルに分割する
+    parser.add_argument("--split-monthly", action="store_true",
+                        help="Split date range into monthly CSV files.")
+    # 並列実行するワーカープロセス数 ※1 なら従来通りこのプロセスで順番に出力する
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Export worker processes, default 1.")
     args: argparse.Namespace = parser.parse_args()
     app_logger.info(args)
 
-    weather_finder: Optional[WeatherFinder] = None
     db_path: str = os.path.expanduser(PATH_WEATHER_DB)
+    output_dir: str = os.path.expanduser(OUTPUT_CSV_PATH)
+    date_ranges: List[Tuple[str, str]]
+    if args.split_monthly:
+        date_ranges = split_monthly(args.date_from, args.date_to)
+    else:
+        date_ranges = [(args.date_from, args.date_to)]
+    export_tasks: List[ExportTask] = [
+        (device_name, d_from, d_to)
+        for device_name in args.device_name for (d_from, d_to) in date_ranges
+    ]
+    app_logger.info("export tasks: {}".format(len(export_tasks)))
     try:
-        weather_finder = WeatherFinder(db_path, logger=app_logger)
-        app_logger.info(weather_finder)
-        # from t_weather to csv
-        csv_iterable = weather_finder.find(
-            args.device_name, date_from=args.date_from, date_to=args.date_to
-        )
-        app_logger.info(f"type(csv_iterable): {type(csv_iterable)}")
-        # filename: build "" + "device name" + "date_from" + "date_to" + "date now" + ".csv"
-        csv_file: str = os.path.join(
-            os.path.expanduser(OUTPUT_CSV_PATH), weather_finder.csv_filename
-        )
-        with open(csv_file, 'w', newline='') as fp:
-            fp.write(WeatherFinder.CSV_WEATHER_HEADER)
-            if csv_iterable is not None:
-                for line in csv_iterable:
-                    fp.write(line + "\n")
-        app_logger.info("Saved Weather CSV: {}".format(csv_file))
+        if args.create_index:
+            ensure_weather_index(db_path, logger=app_logger)
+        if args.workers > 1 and len(export_tasks) > 1:
+            export_parallel(db_path, output_dir, export_tasks, args.gzip,
+                            workers=args.workers, logger=app_logger)
+        else:
+            # from t_weather to csv: fetchmany の一定件数ごとにファイルに書き込む
+            # filename: build "" + "device name" + "date_from" + "date_to" + "date now" + ".csv"
+            for export in export_tasks:
+                csv_file, row_count, elapsed, _ = export_task(
+                    db_path, output_dir, export, args.gzip, logger=app_logger
+                )
+                app_logger.info("Record count: {}, {:.3f} sec".format(row_count, elapsed))
+                app_logger.info("Saved Weather CSV: {}".format(csv_file))
     except Exception as e:
         app_logger.warning("WeatherFinder error: {}".format(e))
-    finally:
-        if weather_finder is not None:
-            weather_finder.close()
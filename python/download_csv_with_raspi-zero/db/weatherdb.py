@@ -1,7 +1,9 @@
+import gzip
 import logging
+import os
 import sqlite3
-from datetime import date, datetime, timedelta
-from typing import List, Optional, Tuple
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, TextIO, Tuple
 
 """
 Weather database CRUD functions, Finder class
@@ -9,6 +11,22 @@ for python 3.7.x
 """
 
 FMT_ISO8601_DATE: str = "%Y-%m-%d"
+# 測定時刻(unixepoch)の検索条件の日付のタイムゾーン ※従来のSQLの strftime('%s', ?, '-9 hours') と同じ
+TZ_MEASUREMENT: timezone = timezone(timedelta(hours=9))
+
+# CSV書き込みバッファサイズ
+CSV_WRITE_BUFFER_SIZE: int = 1024 * 1024
+# gzip圧縮レベル
+GZIP_COMPRESS_LEVEL: int = 6
+
+# 検索用の (did, measurement_time) インデックス
+# ※主キー (did, measurement_time) の自動インデックスがあれば作成しない
+INDEX_WEATHER_NAME: str = "idx_weather_did_time"
+CREATE_INDEX_WEATHER: str = """
+CREATE INDEX IF NOT EXISTS idx_weather_did_time ON t_weather(did, measurement_time)
+"""
+# 検索の実行計画で (did, measurement_time) のインデックスが範囲検索に使われていること
+PLAN_WEATHER_INDEX_SEARCH: str = "(did=? AND measurement_time>?"
 
 
 def get_connection(db_path: str,
@@ -61,40 +79,91 @@ def get_next_iso8601date(s_date: str) -> str:
         raise e
 
 
+# ISO8601形式文字列の日付の午前0時を unixepoch に変換する
+def to_epoch(s_date: str) -> int:
+    dt_obj: datetime = datetime.strptime(s_date, FMT_ISO8601_DATE)
+    return int(dt_obj.replace(tzinfo=TZ_MEASUREMENT).timestamp())
+
+
+def explain_weather_plan(conn: sqlite3.Connection, sql: str) -> List[str]:
+    """
+    Get EXPLAIN QUERY PLAN details of weather query.
+    :param conn: sqlite3 connection
+    :param sql: weather query with (did, from_epoch, to_epoch) parameters
+    :return: plan detail list (e.g. 'SEARCH t_weather USING INDEX ...')
+    """
+    cur: sqlite3.Cursor = conn.execute("EXPLAIN QUERY PLAN " + sql, (0, 0, 0))
+    # (id, parent, notused, detail)
+    details: List[str] = [row[3] for row in cur.fetchall()]
+    cur.close()
+    return details
+
+
+def uses_weather_index(details: List[str]) -> bool:
+    """ Check that query plan searches t_weather with (did, measurement_time) index. """
+    return any(PLAN_WEATHER_INDEX_SEARCH in detail for detail in details)
+
+
+def ensure_weather_index(db_path: str, logger: Optional[logging.Logger] = None) -> None:
+    """
+    Create (did, measurement_time) index of t_weather if query does not use index.
+    ※主キーの自動インデックスで検索できる場合は作成しない
+    ※読み込み専用接続ではインデックスを作成できないため書き込み可能な接続で作成する
+    :param db_path: weather database path
+    :param logger: application logger or None
+    """
+    conn: sqlite3.Connection = get_connection(db_path, logger=logger)
+    try:
+        details: List[str] = explain_weather_plan(conn, WeatherFinder._SELECT_WEATHER)
+        if uses_weather_index(details):
+            if logger is not None:
+                logger.info("Index already used: {}".format(details))
+            return
+
+        with conn:
+            conn.execute(CREATE_INDEX_WEATHER)
+        if logger is not None:
+            logger.info("Created index: {}".format(INDEX_WEATHER_NAME))
+    except sqlite3.Error as err:
+        if logger is not None:
+            logger.error(err)
+        raise err
+    finally:
+        conn.close()
+
+
+def open_csv_file(file_path: str, compress: bool = False) -> TextIO:
+    """
+    Open CSV file for write.
+    :param file_path: CSV file path
+    :param compress: if True then gzip compressed text file
+    :return: text file object
+    """
+    if compress:
+        # ラズパイゼロのCPU負荷を考慮して圧縮レベルを下げる
+        return gzip.open(file_path, 'wt', compresslevel=GZIP_COMPRESS_LEVEL, newline='')
+    return open(file_path, 'w', buffering=CSV_WRITE_BUFFER_SIZE, newline='')
+
+
 class WeatherFinder:
     # Private constants
-    _SELECT_WEATHER_COUNT: str = """
-SELECT
-   COUNT(*)
-FROM
-   t_weather
-WHERE
-   did = ?
-   AND (
-      measurement_time >= strftime('%s', ? ,'-9 hours')
-      AND
-      measurement_time < strftime('%s', ? ,'-9 hours')
-   )
-"""
     _SELECT_WEATHER: str = """
 SELECT
-   did, datetime(measurement_time, 'unixepoch', 'localtime'), temp_out, temp_in, humid, pressure
+   did, datetime(measurement_time, 'unixepoch', 'localtime'),
+   IFNULL(temp_out, ''), IFNULL(temp_in, ''), IFNULL(humid, ''), IFNULL(pressure, '')
 FROM
    t_weather
 WHERE
    did = ?
-   AND (
-      measurement_time >= strftime('%s', ? ,'-9 hours')
-      AND
-      measurement_time < strftime('%s', ? ,'-9 hours')
-   )
+   AND measurement_time >= ? AND measurement_time < ?
 ORDER BY measurement_time;
     """
-    # if record count > GENERATOR_THRETHOLD then CSV Generator else CSV list
-    _GENERATOR_WEATHER_THRESHOLD: int = 10000
+    # 件数を事前に確認せずに常に fetchmany で一定件数ずつ取得する
     _GENERATOR_WEATHER_BATCH_SIZE: int = 1000
     # CSV constants
     _FMT_WEATHER_CSV_LINE: str = '{},"{}",{},{},{},{}'
+    # NULL値はSQLで空文字に変換済み
+    _FMT_WEATHER_CSV_ROW: str = _FMT_WEATHER_CSV_LINE + "\n"
     # Public const
     # CSV t_weather Header
     CSV_WEATHER_HEADER: str = '"did","measurement_time","temp_out","temp_in","humid","pressure"\n'
@@ -110,6 +179,8 @@ ORDER BY measurement_time;
         self.conn: Optional[sqlite3.Connection] = None
         self.cursor: Optional[sqlite3.Cursor] = None
         self._csv_name: Optional[str] = None
+        # CSV出力済みのレコード件数 ※ジェネレータを最後まで取得した時点で確定する
+        self.row_count: int = 0
 
     def close(self):
         """ Close cursor and connection close """
@@ -130,80 +201,100 @@ ORDER BY measurement_time;
           (*) temp_out,temp_in,humid, pressure: if filedValue is None then empty string
         :return: Record generator
         """
+        for batch_records in self._fetch_batches():
+            for rec in batch_records:
+                yield self._FMT_WEATHER_CSV_LINE.format(*rec)
+
+    def _fetch_batches(self):
+        """ Generate record list of _GENERATOR_WEATHER_BATCH_SIZE """
         while True:
-            batch_resords: Optional[List[tuple]] = self.cursor.fetchmany(
+            batch_records: Optional[List[tuple]] = self.cursor.fetchmany(
                 self._GENERATOR_WEATHER_BATCH_SIZE)
-            if not batch_resords:
+            if not batch_records:
                 break
-            for rec in batch_resords:
-                yield self._FMT_WEATHER_CSV_LINE.format(rec[0],
-                                                        rec[1],
-                                                        rec[2] if rec[2] is not None else '',
-                                                        rec[3] if rec[3] is not None else '',
-                                                        rec[4] if rec[4] is not None else '',
-                                                        rec[5] if rec[5] is not None else '')
-
-    def _csv_list(self) -> List[str]:
+            self.row_count += len(batch_records)
+            yield batch_records
+
+    def _execute(self, device_name: str, date_from: str, date_to: str) -> bool:
         """
-        Get CSV list
-          line: did, "YYYY-mm-DD HH:MM:SS(measurement_time)",temp_out,temp_in,humid,pressure
-          (*) temp_out,temp_in,humid, pressure: if filedValue is None then empty string
-        :return: Record list, if no record then blank list
+        Execute weather query.
+        :return: if device not found then False
         """
-        return [self._FMT_WEATHER_CSV_LINE.format(rec[0],
-                                                  rec[1],
-                                                  rec[2] if rec[2] is not None else '',
-                                                  rec[3] if rec[3] is not None else '',
-                                                  rec[4] if rec[4] is not None else '',
-                                                  rec[5] if rec[5] is not None else '') for rec in self.cursor]
-
-    # 戻り値の型は python3.8以上では Generator(or Iterator or Iterable) [str] | List[str] ですが
-    # 実行環境のラズパイゼロのpython3.7がジェネレータの型をサポートしていないため
-    # TypeError: unsupported operand type(s) for |: '_GenericAlias' and '_GenericAlias'
-    # この関数の戻り値を定義しないことにしました
-    def find(self, device_name: str, date_from: str, date_to: str):
         # Build csv filename suffix
         date_part: date = date.today()
         name_suffix: str = "{}_{}_{}".format(
             device_name, date_from.replace("-", ""), date_to.replace("-", "")
         )
         self._csv_name = name_suffix + "_" + date_part.strftime("%Y%m%d")
+        self.row_count = 0
 
         if self.conn is None:
             self.conn = get_connection(self.db_path, read_only=True, logger=self.logger)
         did: Optional[int] = find_device(self.conn, device_name, logger=self.logger)
         if did is None:
-            return []
+            return False
 
         # 検索終了日の翌日
         exclude_to_date: str = get_next_iso8601date(date_to)
         # 検索開始日 <= 測定時刻 < 検索終了日の翌日　※検索開始日〜検索終了日のデータ取得
-        params: Tuple = (did, date_from, exclude_to_date)
+        # 範囲の unixepoch を事前に計算しておき、インデックスの範囲検索とする
+        params: Tuple = (did, to_epoch(date_from), to_epoch(exclude_to_date))
         if self.logger is not None:
             self.logger.info("params: {}".format(params))
         try:
-            # Check record count
+            self._check_index()
+            # 件数の確認はせずに1回の検索で取得する
+            if self.cursor is not None:
+                self.cursor.close()
             self.cursor = self.conn.cursor()
-            self.cursor.execute(self._SELECT_WEATHER_COUNT, params)
-            # fetchone() return tuple (?,)
-            row_count: int = self.cursor.fetchone()[0]
-            if self.logger is not None:
-                self.logger.info("Record count: {}".format(row_count))
-            if row_count == 0:
-                return []
-
-            # Get record
             self.cursor.execute(self._SELECT_WEATHER, params)
-            if row_count > self._GENERATOR_WEATHER_THRESHOLD:
-                if self.logger is not None:
-                    self.logger.info("Return CSV Generator")
-                # make generator
-                return self._csv_iterator()
-            else:
-                if self.logger is not None:
-                    self.logger.info("Return CSV list")
-                return self._csv_list()
+            return True
         except sqlite3.Error as err:
             if self.logger is not None:
                 self.logger.warning("criteria: {}\nerror:{}".format(params, err))
             raise err
+
+    # 戻り値はCSV行のジェネレータ (デバイス未登録なら空リスト)
+    # 実行環境のラズパイゼロのpython3.7の型定義に合わせて、この関数の戻り値を定義しないことにしました
+    def find(self, device_name: str, date_from: str, date_to: str):
+        if not self._execute(device_name, date_from, date_to):
+            return []
+
+        return self._csv_iterator()
+
+    def export_csv(self, device_name: str, date_from: str, date_to: str,
+                   output_dir: str, compress: bool = False) -> str:
+        """
+        Export t_weather to CSV file.
+          fetchmany() の一定件数ごとにCSV行を連結して書き込む ※メモリ使用量は件数に依存しない
+        :param device_name: t_device name
+        :param date_from: ISO8601 date from
+        :param date_to: ISO8601 date to
+        :param output_dir: CSV output directory
+        :param compress: if True then gzip compressed file (*.csv.gz)
+        :return: saved CSV file path, record count is row_count
+        """
+        found: bool = self._execute(device_name, date_from, date_to)
+        csv_file: str = os.path.join(output_dir, self.csv_filename)
+        if compress:
+            csv_file += ".gz"
+        with open_csv_file(csv_file, compress=compress) as fp:
+            fp.write(self.CSV_WEATHER_HEADER)
+            if found:
+                fmt: str = self._FMT_WEATHER_CSV_ROW
+                for batch_records in self._fetch_batches():
+                    fp.write("".join([fmt.format(*rec) for rec in batch_records]))
+        return csv_file
+
+    def _check_index(self) -> None:
+        """ Check that weather query uses (did, measurement_time) index. """
+        details: List[str] = explain_weather_plan(self.conn, self._SELECT_WEATHER)
+        if self.logger is None:
+            return
+        if self.isLogLevelDebug:
+            self.logger.debug("query plan: {}".format(details))
+        if not uses_weather_index(details):
+            self.logger.warning(
+                "(did, measurement_time) index not used, run with --create-index: {}".format(
+                    details)
+            )
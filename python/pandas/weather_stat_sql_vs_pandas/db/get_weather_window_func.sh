@@ -25,11 +25,9 @@ FROM
   t_weather tw INNER JOIN t_device td ON tw.did = td.id
 WHERE
   td.name = '${device_name}'
-  AND (
-    datetime(measurement_time, 'unixepoch', 'localtime') >= '${from_date}' 
-    AND 
-    datetime(measurement_time, 'unixepoch', 'localtime') < '${eclude_to_date}'
-  )
+  -- 検索日(ローカル時刻)を unixepoch に変換した値と比較する ※主キーのインデックスで範囲検索
+  AND tw.measurement_time >= CAST(strftime('%s', '${from_date}', 'utc') AS INTEGER)
+  AND tw.measurement_time < CAST(strftime('%s', '${eclude_to_date}', 'utc') AS INTEGER)
 -- 降順でソート ※最低気温と最高気温は指定範囲に複数出現するが、直近レコードを取得値とする  
 ORDER BY measurement_time DESC
 ), min_temp_out_records AS (
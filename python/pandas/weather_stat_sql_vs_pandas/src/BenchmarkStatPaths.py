@@ -0,0 +1,390 @@
+import argparse
+import os
+import platform
+import sqlite3
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from plot_weather.dao import daily_stat_sqlite, windowfunc_sqlite
+from plot_weather.dao.sqlite_util import to_epoch
+from plot_weather.dataloader import tempout_loader_sqlite
+from plot_weather.dataloader.tempout_loader_sqlite import fetch_rows, to_dataframe
+from plot_weather.dataloader.tempout_stat import get_daily_temp_out_stat_dict
+from batch_common import date_add_days, to_title_date, save_html, OUT_HTML
+
+"""
+外気温統計情報の集計方式 (SQL Window function / pandas) のベンチマーク
+ 指定日数 (1日〜10年) x 指定デバイス数の t_weather を持つ合成データベースを生成し、
+ 検索日から遡った集計日数分の統計情報をHTMLに出力するまでの処理時間を計測する
+ (1) sqlite-func: TempOutStatHtml_sqliteFunc.py と同じ 1日ごとに Window function のSQLで集計
+ (2) pandas: TempOutStatHtml_pandas.py と同じ 集計日数分を1回の検索で取得し pandas で集計
+ (3) daily-stat: 日ごとの統計情報テーブル (t_weather_daily_stat) を読み込む
+     ※合成データベースのテーブルが集計対象日を集計済みの場合のみ計測する
+      python ../../../sqlite_timestamp/weather_daily_stat.py --db-path bench/weather_3650d_1dev.db
+[計測項目]
+ 処理段階ごとの時間 (query, dataframe, stat, html) と全体の時間 ※繰り返し回数の最速値
+ ピークメモリ (tracemalloc) ※Pythonのメモリ割当のみ (SQLiteのページキャッシュは含まない)
+ 結果は標準出力とレポートファイル (Markdown) に出力する
+"""
+
+# 処理段階 ※sqlite-func は集計もSQLで実行するため query に含まれる
+STAGES: Tuple[str, ...] = ("query", "dataframe", "stat", "html")
+# 合成データのデバイス名
+DEVICE_NAME_FMT: str = "esp8266_{}"
+SECONDS_PER_DAY: int = 24 * 60 * 60
+
+CREATE_DEVICE: str = """
+CREATE TABLE t_device(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR NOT NULL,
+    CONSTRAINT unq_name UNIQUE(name)
+)
+"""
+
+CREATE_WEATHER: str = """
+CREATE TABLE t_weather(
+    did INTEGER NOT NULL,
+    measurement_time INTEGER NOT NULL,
+    temp_out real,
+    temp_in real,
+    humid real,
+    pressure real,
+    PRIMARY KEY (did, measurement_time),
+    FOREIGN KEY (did) REFERENCES t_devices (id) ON DELETE CASCADE
+)
+"""
+
+# (測定日, 最低気温の出現時刻, 最低気温, 最高気温の出現時刻, 最高気温) ※出現時刻は "時:分"
+DayMinMax = Tuple[str, str, float, str, float]
+
+
+class StageTimer:
+    """ 処理段階ごとの経過時間を累積する """
+
+    def __init__(self):
+        self.elapsed: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.elapsed[name] = self.elapsed.get(name, 0.) + time.perf_counter() - start
+
+
+@dataclass
+class PathResult:
+    name: str
+    total: float = 0.
+    stages: Dict[str, float] = field(default_factory=dict)
+    peak_memory: int = 0
+    days: List[DayMinMax] = field(default_factory=list)
+
+
+@dataclass
+class DatabaseInfo:
+    days: int
+    devices: int
+    rows: int
+    file_size: int
+    index_used: Dict[str, bool]
+    has_daily_stat: bool
+    results: List[PathResult] = field(default_factory=list)
+
+
+def generate_database(db_path: str, end_date: str, days: int, devices: int,
+                      interval_sec: int, seed: int) -> int:
+    """
+    終了日から遡った指定日数分の合成気象データベースを生成する
+     外気温は年周期と日周期の正弦波に乱数を加え小数点第一位に丸める (同じ気温が1日に複数回出現する)
+    :return: t_weather row count
+    """
+    rng: np.random.Generator = np.random.default_rng(seed)
+    start_epoch: int = to_epoch(end_date) - (days - 1) * SECONDS_PER_DAY
+    end_epoch: int = to_epoch(date_add_days(end_date))
+    # ローカル時刻の時差 (秒)
+    utc_offset: float = datetime.now().astimezone().utcoffset().total_seconds()
+
+    conn: sqlite3.Connection = sqlite3.connect(db_path)
+    try:
+        # 生成時のみ同期書き込みを無効にする
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(CREATE_DEVICE)
+        conn.execute(CREATE_WEATHER)
+        rows: int = 0
+        for did in range(1, devices + 1):
+            conn.execute("INSERT INTO t_device(name) VALUES (?)", (DEVICE_NAME_FMT.format(did),))
+            # 測定間隔に数秒のずれを加える
+            times: np.ndarray = np.arange(start_epoch, end_epoch, interval_sec, dtype=np.int64)
+            times += rng.integers(0, max(interval_sec // 10, 1), size=times.size)
+            times = times[times < end_epoch]
+            local_sec: np.ndarray = times + utc_offset
+            year_phase: np.ndarray = 2 * np.pi * (local_sec / SECONDS_PER_DAY / 365.25 - 0.3)
+            day_phase: np.ndarray = 2 * np.pi * ((local_sec % SECONDS_PER_DAY) / SECONDS_PER_DAY - 0.375)
+            temp_out: np.ndarray = np.round(
+                10. + 10. * np.sin(year_phase) + 5. * np.sin(day_phase)
+                + rng.normal(0., 0.5, size=times.size), 1)
+            temp_in: np.ndarray = np.round(18. + 0.3 * temp_out, 1)
+            humid: np.ndarray = np.round(rng.uniform(40., 80., size=times.size), 1)
+            pressure: np.ndarray = np.round(rng.uniform(995., 1025., size=times.size), 1)
+            with conn:
+                conn.executemany(
+                    "INSERT INTO t_weather VALUES (?,?,?,?,?,?)",
+                    zip([did] * times.size, times.tolist(), temp_out.tolist(),
+                        temp_in.tolist(), humid.tolist(), pressure.tolist())
+                )
+            rows += times.size
+        return rows
+    finally:
+        conn.close()
+
+
+def to_day_min_max(measurement_day: str, min_time: str, min_temper: float,
+                   max_time: str, max_temper: float) -> DayMinMax:
+    return measurement_day, min_time[11:16], min_temper, max_time[11:16], max_temper
+
+
+def render_html(find_date: str, before_date: str, days: List[DayMinMax], save_path: str):
+    """ 検索日と前日の統計情報のHTMLを出力する ※レコードなしの日は "-" """
+    day_dict: Dict[str, DayMinMax] = {day[0]: day for day in days}
+    html_dict: Dict = {}
+    for (key, date) in (("find", find_date), ("before", before_date)):
+        day: DayMinMax = day_dict.get(date, (date, "-", "-", "-", "-"))
+        html_dict[f"{key}_day"] = to_title_date(date)
+        html_dict[f"{key}_min_time"] = day[1]
+        html_dict[f"{key}_min_temper"] = day[2]
+        html_dict[f"{key}_max_time"] = day[3]
+        html_dict[f"{key}_max_temper"] = day[4]
+    save_html(save_path, OUT_HTML.format(**html_dict))
+
+
+def path_sqlite_func(conn: sqlite3.Connection, device_name: str,
+                     target_days: List[str], save_path: str, timer: StageTimer
+                     ) -> List[DayMinMax]:
+    result: List[DayMinMax] = []
+    for day in target_days:
+        with timer.stage("query"):
+            stat: List[windowfunc_sqlite.TempOut] = windowfunc_sqlite.get_temp_out_stat(
+                conn, device_name, day, date_add_days(day)
+            )
+        if len(stat) > 0:
+            result.append(to_day_min_max(day, stat[0].appear_time, stat[0].temper,
+                                         stat[1].appear_time, stat[1].temper))
+    with timer.stage("html"):
+        render_html(target_days[0], date_add_days(target_days[0], add_days=-1), result, save_path)
+    return result
+
+
+def path_pandas(conn: sqlite3.Connection, device_name: str,
+                target_days: List[str], save_path: str, timer: StageTimer
+                ) -> List[DayMinMax]:
+    # 集計日数分を1回の検索で取得する ※target_days は降順
+    with timer.stage("query"):
+        rows: List[Tuple[str, float]] = fetch_rows(
+            conn, device_name, target_days[-1], date_add_days(target_days[0])
+        )
+    with timer.stage("dataframe"):
+        df: pd.DataFrame = to_dataframe(rows)
+    with timer.stage("stat"):
+        stat_dict = get_daily_temp_out_stat_dict(df)
+    result: List[DayMinMax] = [
+        to_day_min_max(day, stat_dict[day].min.appear_time, stat_dict[day].min.temper,
+                       stat_dict[day].max.appear_time, stat_dict[day].max.temper)
+        for day in target_days if day in stat_dict
+    ]
+    with timer.stage("html"):
+        render_html(target_days[0], date_add_days(target_days[0], add_days=-1), result, save_path)
+    return result
+
+
+def path_daily_stat(conn: sqlite3.Connection, device_name: str,
+                    target_days: List[str], save_path: str, timer: StageTimer
+                    ) -> List[DayMinMax]:
+    with timer.stage("query"):
+        stat_dict = daily_stat_sqlite.get_daily_temp_out_stats(
+            conn, device_name, target_days[-1], date_add_days(target_days[0])
+        )
+    result: List[DayMinMax] = [
+        to_day_min_max(day, stat_dict[day].min.appear_time, stat_dict[day].min.temper,
+                       stat_dict[day].max.appear_time, stat_dict[day].max.temper)
+        for day in target_days if day in stat_dict
+    ]
+    with timer.stage("html"):
+        render_html(target_days[0], date_add_days(target_days[0], add_days=-1), result, save_path)
+    return result
+
+
+PathFunc = Callable[[sqlite3.Connection, str, List[str], str, StageTimer], List[DayMinMax]]
+
+
+def measure(name: str, func: PathFunc, conn: sqlite3.Connection, device_name: str,
+            target_days: List[str], save_path: str, repeat: int) -> PathResult:
+    # 最も速かった実行時間とその処理段階ごとの時間を採用する
+    result: PathResult = PathResult(name, total=float("inf"))
+    for _ in range(repeat):
+        timer: StageTimer = StageTimer()
+        start: float = time.perf_counter()
+        days: List[DayMinMax] = func(conn, device_name, target_days, save_path, timer)
+        elapsed: float = time.perf_counter() - start
+        if elapsed < result.total:
+            result.total, result.stages, result.days = elapsed, timer.elapsed, days
+    # ピークメモリは計測のオーバーヘッドがあるため別に実行する
+    tracemalloc.start()
+    try:
+        func(conn, device_name, target_days, save_path, StageTimer())
+        result.peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result
+
+
+def benchmark_database(db_path: str, device_name: str, target_days: List[str],
+                       work_dir: str, repeat: int) -> Tuple[List[PathResult], Dict[str, bool], bool]:
+    conn: sqlite3.Connection = sqlite3.connect(db_path)
+    try:
+        index_used: Dict[str, bool] = {
+            "sqlite-func": windowfunc_sqlite.is_index_used(conn),
+            "pandas": tempout_loader_sqlite.is_index_used(conn),
+        }
+        has_daily_stat: bool = daily_stat_sqlite.is_daily_stat_ready(
+            conn, target_days[-1], date_add_days(target_days[0])
+        )
+        benchmarks: List[Tuple[str, PathFunc]] = [
+            ("sqlite-func", path_sqlite_func),
+            ("pandas", path_pandas),
+        ]
+        if has_daily_stat:
+            benchmarks.append(("daily-stat", path_daily_stat))
+        results: List[PathResult] = [
+            measure(name, func, conn, device_name, target_days,
+                    os.path.join(work_dir, f"{name}.html"), repeat)
+            for (name, func) in benchmarks
+        ]
+        return results, index_used, has_daily_stat
+    finally:
+        conn.close()
+
+
+def format_report(infos: List[DatabaseInfo], find_date: str, stat_days: int, repeat: int) -> str:
+    lines: List[str] = [
+        "# 外気温統計情報 集計方式ベンチマーク",
+        "",
+        f"- 実行日時: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        f"- 環境: Python {platform.python_version()}, SQLite {sqlite3.sqlite_version}, "
+        f"pandas {pd.__version__}, NumPy {np.__version__}, {platform.machine()} {platform.system()}",
+        f"- 検索日: {find_date}, 集計日数: {stat_days}, 繰り返し回数: {repeat} (最速値)",
+        "- 時間の単位はミリ秒, ratio は sqlite-func に対する速度比, match は sqlite-func との結果の一致",
+        "",
+    ]
+    for info in infos:
+        lines.append(f"## {info.days}日 x {info.devices}デバイス "
+                     f"({info.rows:,} rows, {info.file_size / 1024 / 1024:.1f} MB)")
+        lines.append("")
+        index_text: str = ", ".join(f"{name}: {used}" for name, used in info.index_used.items())
+        lines.append(f"- インデックスによる範囲検索: {index_text}")
+        if not info.has_daily_stat:
+            lines.append("- daily-stat: t_weather_daily_stat なし (またはバックフィル前) のため未計測")
+        lines.append("")
+        lines.append("| path | " + " | ".join(STAGES) + " | total | ratio | peak memory | match |")
+        lines.append("|---" * (len(STAGES) + 5) + "|")
+        base: PathResult = info.results[0]
+        for res in info.results:
+            stage_cols: List[str] = [
+                f"{res.stages[stage] * 1000:.2f}" if stage in res.stages else "-" for stage in STAGES
+            ]
+            lines.append(
+                f"| {res.name} | " + " | ".join(stage_cols)
+                + f" | {res.total * 1000:.2f} | x{base.total / res.total:.2f}"
+                + f" | {res.peak_memory / 1024:,.0f} KiB | {res.days == base.days} |"
+            )
+        lines.append("")
+
+    # データベースのサイズごとの最速の集計方式
+    lines.append("## まとめ")
+    lines.append("")
+    for info in infos:
+        fastest: PathResult = min(info.results, key=lambda res: res.total)
+        smallest: PathResult = min(info.results, key=lambda res: res.peak_memory)
+        lines.append(f"- {info.days}日 x {info.devices}デバイス: 最速 {fastest.name}, "
+                     f"最小メモリ {smallest.name}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    parser: argparse.ArgumentParser = argparse.ArgumentParser()
+    # 合成データベースの日数 (1日〜10年)
+    parser.add_argument("--days", type=int, nargs="+", default=[1, 30, 365, 3650],
+                        help="Synthetic database days, default 1 30 365 3650.")
+    parser.add_argument("--devices", type=int, default=1,
+                        help="Synthetic device count, default 1.")
+    # 合成データの最終日 ※検索日
+    parser.add_argument("--end-date", type=str, default="2024-01-13",
+                        help="ISO8601 format, default 2024-01-13.")
+    parser.add_argument("--interval", type=int, default=600,
+                        help="Measurement interval seconds, default 600.")
+    # 検索日から遡って集計する日数 ※TempOutStatHtml_*.py は当日と前日の2日
+    parser.add_argument("--stat-days", type=int, default=2,
+                        help="Stat days (find date include), default 2.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Repeat count, default 5.")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Random seed, default 1.")
+    # 合成データベースとHTML, レポートの出力先
+    parser.add_argument("--work-dir", type=str, default="bench",
+                        help="Work directory, default bench.")
+    parser.add_argument("--report", type=str, default="BenchmarkStatPaths.md",
+                        help="Report file name in work directory.")
+    # 既存の合成データベースを作り直す
+    parser.add_argument("--regenerate", action="store_true",
+                        help="Regenerate synthetic databases.")
+    args: argparse.Namespace = parser.parse_args()
+
+    work_dir: str = os.path.expanduser(args.work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    # 検索日から遡った集計対象日 (降順)
+    target_days: List[str] = [date_add_days(args.end_date, add_days=-i) for i in range(args.stat_days)]
+    # 集計対象のデバイスは先頭のデバイス
+    device_name: str = DEVICE_NAME_FMT.format(1)
+
+    infos: List[DatabaseInfo] = []
+    for days in args.days:
+        db_path: str = os.path.join(work_dir, f"weather_{days}d_{args.devices}dev.db")
+        if args.regenerate and os.path.exists(db_path):
+            os.remove(db_path)
+        if not os.path.exists(db_path):
+            gen_start: float = time.perf_counter()
+            generate_database(db_path, args.end_date, days, args.devices, args.interval, args.seed)
+            print(f"generated: {db_path}, {time.perf_counter() - gen_start:.1f} sec")
+        conn_count: sqlite3.Connection = sqlite3.connect(db_path)
+        try:
+            row_count: int = conn_count.execute("SELECT count(*) FROM t_weather").fetchone()[0]
+        finally:
+            conn_count.close()
+
+        results, index_used, has_daily_stat = benchmark_database(
+            db_path, device_name, target_days, work_dir, args.repeat
+        )
+        info: DatabaseInfo = DatabaseInfo(days, args.devices, row_count, os.path.getsize(db_path),
+                                          index_used, has_daily_stat, results)
+        infos.append(info)
+        print(f"{days} days x {args.devices} devices, rows: {row_count}")
+        for res in results:
+            stage_text: str = ", ".join(f"{name}: {sec * 1000:.2f}" for name, sec in res.stages.items())
+            print(f"{res.name:>12}: {res.total * 1000:.2f} ms ({stage_text}),"
+                  f" peak: {res.peak_memory / 1024:,.0f} KiB, match: {res.days == results[0].days}")
+
+    report: str = format_report(infos, args.end_date, args.stat_days, args.repeat)
+    report_path: str = os.path.join(work_dir, args.report)
+    with open(report_path, 'w') as fp:
+        fp.write(report)
+    print(report_path)
@@ -0,0 +1,136 @@
+import argparse
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.core.frame import DataFrame
+from pandas.core.series import Series
+
+from plot_weather.dataloader.tempout_days import split_by_day
+from plot_weather.dataloader.tempout_loader_sqlite import (
+    COL_TIME, COL_TEMP_OUT, get_dataframe
+)
+from plot_weather.dataloader.tempout_stat import (
+    get_daily_temp_out_stats, get_temp_out_stat, TempOut, TempOutStat
+)
+from batch_common import get_connection, date_add_days
+
+"""
+外気温の日ごとの統計情報計算のベンチマーク
+ データベースの検索期間のデータを指定倍数の日数に拡大し、計算方式ごとの処理時間を計測する
+ (1) per-day-mask: 日ごとに分割して最低・最高気温をブールインデックスで抽出 (従来方式)
+ (2) per-day: 日ごとに分割して get_temp_out_stat を呼び出す
+ (3) daily-stats: get_daily_temp_out_stats で全ての日をまとめて計算
+"""
+
+
+def get_temp_out_stat_mask(df_desc: DataFrame) -> TempOutStat:
+    # 従来方式: tempout_stat.get_temp_out_stat (変更前)
+    def get_measurement_time(pd_timestamp: pd.Timestamp) -> str:
+        py_datetime: datetime = pd_timestamp.to_pydatetime()
+        return py_datetime.strftime("%Y-%m-%d %H:%M")
+
+    temp_out_ser: Series = df_desc[COL_TEMP_OUT]
+    min_temper: np.float64 = temp_out_ser.min()
+    max_temper: np.float64 = temp_out_ser.max()
+    df_min_all: DataFrame = df_desc[temp_out_ser <= min_temper]
+    df_max_all: pd.DataFrame = df_desc[temp_out_ser >= max_temper]
+    min_first: Series = df_min_all.iloc[0]
+    max_first: Series = df_max_all.iloc[0]
+    min_measurement_time: str = get_measurement_time(min_first[COL_TIME])
+    measurement_day: str = min_measurement_time[:10]
+    min_data: TempOut = TempOut(min_measurement_time, float(min_first[COL_TEMP_OUT]))
+    max_measurement_time: str = get_measurement_time(max_first[COL_TIME])
+    max_data: TempOut = TempOut(max_measurement_time, float(max_first[COL_TEMP_OUT]))
+    return TempOutStat(measurement_day, min=min_data, max=max_data)
+
+
+def per_day_mask(df_desc: DataFrame) -> List[TempOutStat]:
+    return [get_temp_out_stat_mask(df_day) for df_day in split_by_day(df_desc).values()]
+
+
+def per_day(df_desc: DataFrame) -> List[TempOutStat]:
+    return [get_temp_out_stat(df_day) for df_day in split_by_day(df_desc).values()]
+
+
+def make_scaled_dataframe(df_desc: DataFrame, scale: int) -> DataFrame:
+    """ 検索期間の日数単位でずらしたデータを連結して指定倍数に拡大する (測定時刻の降順) """
+    days: int = (df_desc[COL_TIME].max().normalize()
+                 - df_desc[COL_TIME].min().normalize()).days + 1
+    frames: List[DataFrame] = []
+    for i in range(scale):
+        df_shift: DataFrame = df_desc.copy()
+        df_shift[COL_TIME] += pd.Timedelta(days=days * i)
+        frames.append(df_shift)
+    return pd.concat(frames[::-1], ignore_index=True)
+
+
+def to_min_max(stats: List[TempOutStat]) -> List[Tuple[str, TempOut, TempOut]]:
+    # 従来方式は平均気温なし、日付の降順
+    return sorted(((stat.measurement_day, stat.min, stat.max) for stat in stats),
+                  key=lambda rec: rec[0])
+
+
+def measure(func: Callable[[DataFrame], List[TempOutStat]], df: DataFrame,
+            repeat: int) -> Tuple[float, List[TempOutStat]]:
+    # 最も速かった実行時間を採用する
+    best: float = float("inf")
+    result: List[TempOutStat] = []
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        result = func(df)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == '__main__':
+    parser: argparse.ArgumentParser = argparse.ArgumentParser()
+    # データペースパス: ~/db/weather.db
+    parser.add_argument("--db-path", type=str, required=True,
+                        help="SQLite3 Database path.")
+    # デバイス名: esp8266_1
+    parser.add_argument("--device-name", type=str, required=True,
+                        help="device name in t_device.")
+    parser.add_argument("--date-from", type=str, default="2023-11-01",
+                        help="ISO8601 format, default 2023-11-01.")
+    parser.add_argument("--date-to", type=str, default="2024-01-12",
+                        help="ISO8601 format, default 2024-01-12.")
+    parser.add_argument("--scale", type=int, default=10,
+                        help="Data scale (days), default 10.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Repeat count, default 3.")
+    args: argparse.Namespace = parser.parse_args()
+
+    conn: Optional[sqlite3.Connection] = None
+    try:
+        conn = get_connection(os.path.expanduser(args.db_path))
+        df_src: DataFrame = get_dataframe(
+            conn, args.device_name, args.date_from, date_add_days(args.date_to)
+        )
+    finally:
+        if conn is not None:
+            conn.close()
+    if df_src.shape[0] == 0:
+        print("該当レコードなし")
+        exit(1)
+
+    df_scaled: DataFrame = make_scaled_dataframe(df_src, args.scale)
+    benchmarks: List[Tuple[str, Callable[[DataFrame], List[TempOutStat]]]] = [
+        ("per-day-mask", per_day_mask),
+        ("per-day", per_day),
+        ("daily-stats", get_daily_temp_out_stats),
+    ]
+    base_time: float = 0.
+    expected: List[Tuple[str, TempOut, TempOut]] = []
+    for (name, func) in benchmarks:
+        elapsed, stats = measure(func, df_scaled, args.repeat)
+        if name == "per-day-mask":
+            base_time, expected = elapsed, to_min_max(stats)
+            print(f"rows: {df_scaled.shape[0]}, days: {len(stats)}, repeat: {args.repeat}")
+        # 従来方式と同じ最低・最高気温と出現時刻であること
+        matched: bool = to_min_max(stats) == expected
+        print(f"{name:>12}: {elapsed:.3f} sec, x{base_time / elapsed:.2f}, match: {matched}")
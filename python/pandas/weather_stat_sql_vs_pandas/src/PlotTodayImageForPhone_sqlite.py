@@ -4,14 +4,12 @@ import sqlite3
 
 from typing import List, Optional
 
-from pandas.core.frame import DataFrame
-
-from plot_weather.dataloader.tempout_loader_sqlite import (
-    get_dataframe
+from plot_weather.dataloader.tempout_days import (
+    load_days, TempOutDay
 )
 from plot_weather.plotter.plotterweather_sqlite import gen_plot_image
 from batch_common import (
-    get_connection, date_add_days, save_html
+    get_connection, save_html
 )
 
 """
@@ -61,15 +59,16 @@ if __name__ == '__main__':
     conn: Optional[sqlite3.Connection] = None
     try:
         conn = get_connection(db_full_path)
-        # 検索日の観測データのDataFrame取得
-        exclude_to_date: str = date_add_days(find_date)
-        df_find: DataFrame = get_dataframe(conn, device_name, find_date, exclude_to_date)
-        # 前日の観測データのDataFrame取得
-        before_date: str = date_add_days(find_date, add_days=-1)
-        df_before: DataFrame = get_dataframe(conn, device_name, before_date, find_date)
-        if df_find.shape[0] > 0 and df_before.shape[0] > 0:
-            # 画像取得
-            html_img_src: str = gen_plot_image(df_find, df_before, phone_size=phone_size)
+        # 検索日と前日の観測データを1回の検索で取得し日ごとに分割する
+        find_day: TempOutDay
+        before_day: TempOutDay
+        find_day, before_day = load_days(conn, device_name, find_date, days=2)
+        if find_day.stat is not None and before_day.stat is not None:
+            # 画像取得 ※統計情報は取得済みの値を使用する
+            html_img_src: str = gen_plot_image(
+                find_day.df, before_day.df, phone_size=phone_size,
+                curr_stat=find_day.stat, before_stat=before_day.stat
+            )
             # プロット結果をPNG形式でファイル保存
             script_names: List[str] = script_name.split(".")
             save_name = f"{script_names[0]}.html"
@@ -3,14 +3,11 @@ import os
 import sqlite3
 from typing import Dict, List, Optional
 
-from pandas.core.frame import DataFrame
-
-from plot_weather.dataloader.tempout_loader_sqlite import (
-    get_dataframe
-)
-from plot_weather.dataloader.tempout_stat import (
-    get_temp_out_stat, TempOutStat, TempOut
+from plot_weather.dao import daily_stat_sqlite
+from plot_weather.dataloader.tempout_days import (
+    load_days, TempOutDay
 )
+from plot_weather.dataloader.tempout_stat import TempOut, TempOutStat
 from batch_common import (
     get_connection, date_add_days, to_title_date, save_html, OUT_HTML
 )
@@ -19,6 +16,8 @@ from batch_common import (
 外気温の当日データと前日データの統計情報をHTMLに出力
 [DB] sqlite3 気象データ
 [集計方法] pandas
+ ※当日と前日のデータは1回の検索で取得する
+ ※--use-daily-stat 指定時は日ごとの統計情報テーブル (t_weather_daily_stat) から2日分を1回の検索で取得する
 """
 
 # スクリプト名
@@ -36,6 +35,9 @@ if __name__ == '__main__':
     # 検索日: 2023-11-01
     parser.add_argument("--find-date", type=str, required=True,
                         help="ISO8601 format.")
+    # 日ごとの統計情報テーブルを使う
+    parser.add_argument("--use-daily-stat", action="store_true",
+                        help="Read t_weather_daily_stat table.")
     args: argparse.Namespace = parser.parse_args()
     # SQLite3 気象データペースファイルパス
     db_full_path: str = os.path.expanduser(args.db_path)
@@ -45,15 +47,37 @@ if __name__ == '__main__':
     find_date: str = args.find_date
 
     html_dict: Dict = {}
-    exclude_to_date: str
+    before_date: str = date_add_days(find_date, add_days=-1)
+    find_stat: Optional[TempOutStat]
+    before_stat: Optional[TempOutStat]
     conn: Optional[sqlite3.Connection] = None
     try:
         conn = get_connection(db_full_path)
-        # 指定日の翌日 (含まない)
-        exclude_to_date = date_add_days(find_date)
-        df_find: DataFrame = get_dataframe(conn, device_name, find_date, exclude_to_date)
-        # 外気温統計データ
-        find_stat: TempOutStat = get_temp_out_stat(df_find)
+        use_daily_stat: bool = False
+        if args.use_daily_stat:
+            # 統計情報テーブルが前日と検索日を集計済みでなければ t_weather から集計する
+            use_daily_stat = daily_stat_sqlite.is_daily_stat_ready(
+                conn, before_date, date_add_days(find_date)
+            )
+            if not use_daily_stat:
+                print("t_weather_daily_stat is not ready, run weather_daily_stat.py (backfill)."
+                      " Use t_weather.")
+        if use_daily_stat:
+            # 指定日と前日の2日分の統計情報レコードを取得する
+            stat_dict: Dict[str, TempOutStat] = daily_stat_sqlite.get_daily_temp_out_stats(
+                conn, device_name, before_date, date_add_days(find_date)
+            )
+            find_stat, before_stat = stat_dict.get(find_date), stat_dict.get(before_date)
+        else:
+            # 指定日と前日の2日分を取得し、日ごとの外気温統計データを取得する
+            find_day: TempOutDay
+            before_day: TempOutDay
+            find_day, before_day = load_days(conn, device_name, find_date, days=2)
+            find_stat, before_stat = find_day.stat, before_day.stat
+        if find_stat is None or before_stat is None:
+            print("該当レコードなし")
+            exit(1)
+
         find_day_min: TempOut = find_stat.min
         find_day_max: TempOut = find_stat.max
         print(f"today_min: {find_day_min}, today_max: {find_day_max}")
@@ -65,9 +89,6 @@ if __name__ == '__main__':
         html_dict["find_max_temper"] = find_day_max.temper
 
         # 前日の統計情報
-        before_date: str = date_add_days(find_date, add_days=-1)
-        df_before: DataFrame = get_dataframe(conn, device_name, before_date, find_date)
-        before_stat: TempOutStat = get_temp_out_stat(df_before)
         before_day_min: TempOut = before_stat.min
         before_day_max: TempOut = before_stat.max
         print(f"before_min: {before_day_min}, before_max: {before_day_max}")
@@ -1,8 +1,9 @@
 import argparse
 import os
 import sqlite3
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 
+from plot_weather.dao import daily_stat_sqlite
 from plot_weather.dao.windowfunc_sqlite import (
     get_temp_out_stat, TempOut
 )
@@ -14,6 +15,7 @@ from batch_common import (
 外気温の当日データと前日データの統計情報をHTMLに出力
 [DB] sqlite3 気象データ
 [集計方法] SQL Window function
+ ※--use-daily-stat 指定時は日ごとの統計情報テーブル (t_weather_daily_stat) の1レコードを読み込む
 """
 
 # スクリプト名
@@ -31,6 +33,9 @@ if __name__ == '__main__':
     # 検索日: 2023-11-01
     parser.add_argument("--find-date", type=str, required=True,
                         help="ISO8601 format.")
+    # 日ごとの統計情報テーブルを使う
+    parser.add_argument("--use-daily-stat", action="store_true",
+                        help="Read t_weather_daily_stat table.")
     args: argparse.Namespace = parser.parse_args()
     # SQLite3 気象データペースファイルパス
     db_full_path: str = os.path.expanduser(args.db_path)
@@ -44,9 +49,18 @@ if __name__ == '__main__':
     conn: Optional[sqlite3.Connection] = None
     try:
         conn = get_connection(db_full_path)
-        # 検索日のデータ
         exclude_to_date = date_add_days(find_date)
-        stat_data: List[TempOut] = get_temp_out_stat(
+        before_date: str = date_add_days(find_date, add_days=-1)
+        stat_func: Callable[[sqlite3.Connection, str, str, str], List[TempOut]] = get_temp_out_stat
+        if args.use_daily_stat:
+            # 統計情報テーブルが前日と検索日を集計済みでなければ t_weather から集計する
+            if daily_stat_sqlite.is_daily_stat_ready(conn, before_date, exclude_to_date):
+                stat_func = daily_stat_sqlite.get_temp_out_stat
+            else:
+                print("t_weather_daily_stat is not ready, run weather_daily_stat.py (backfill)."
+                      " Use t_weather.")
+        # 検索日のデータ
+        stat_data: List[TempOut] = stat_func(
             conn, device_name, find_date, exclude_to_date
         )
         find_day_min: TempOut = stat_data[0]
@@ -60,8 +74,7 @@ if __name__ == '__main__':
         html_dict["find_max_temper"] = find_day_max.temper
 
         # 前日の統計情報
-        before_date: str = date_add_days(find_date, add_days=-1)
-        stat_data: List[TempOut] = get_temp_out_stat(
+        stat_data: List[TempOut] = stat_func(
             conn, device_name, before_date, find_date
         )
         before_day_min: TempOut = stat_data[0]
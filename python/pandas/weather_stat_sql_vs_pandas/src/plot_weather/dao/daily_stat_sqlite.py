@@ -0,0 +1,118 @@
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from plot_weather.dao.windowfunc_sqlite import TempOut
+from plot_weather.dataloader import tempout_stat
+
+"""
+SQLite3 気象データベースの日ごとの統計情報テーブル (t_weather_daily_stat) から外気温統計情報を取得するモジュール
+ t_weather の登録時に更新済みの1日1レコードを読み込む ※t_weather の集計は不要
+ ※テーブルはUDPモニター (weather_daily_stat.py) が作成し、既存データは同モジュールでバックフィルする
+ ※読み込む前に is_daily_stat_ready() で検索期間が集計済みであることを確認する
+   集計済みの期間は同モジュールが t_weather_daily_stat_meta (1レコード) に記録する
+"""
+
+FMT_ISO8601_DATE: str = "%Y-%m-%d"
+
+_EXISTS_QUERY: str = """
+SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = ?
+"""
+
+# トリガー作成日とバックフィル済みの期間
+_META_QUERY: str = """
+SELECT trigger_from, backfill_from, backfill_to FROM t_weather_daily_stat_meta WHERE id = 1
+"""
+
+_DAILY_STAT_QUERY: str = """
+SELECT
+  measurement_day,
+  strftime('%Y-%m-%d %H:%M:%S', min_time, 'unixepoch', 'localtime'), min_temp_out,
+  strftime('%Y-%m-%d %H:%M:%S', max_time, 'unixepoch', 'localtime'), max_temp_out,
+  ROUND(sum_temp_out / temp_out_count, 1), record_count
+FROM
+  t_weather_daily_stat ds INNER JOIN t_device td ON ds.did = td.id
+WHERE
+  td.name = ?
+  AND ds.measurement_day >= ? AND ds.measurement_day < ?
+  AND ds.temp_out_count > 0
+ORDER BY measurement_day DESC
+"""
+
+
+def exists_daily_stat(conn: sqlite3.Connection,
+                      table_name: str = "t_weather_daily_stat") -> bool:
+    with conn:
+        cursor: sqlite3.Cursor = conn.execute(_EXISTS_QUERY, (table_name,))
+        return cursor.fetchone()[0] > 0
+
+
+def is_daily_stat_ready(conn: sqlite3.Connection,
+                        from_date: str, exclude_to_date: str) -> bool:
+    """
+    統計情報テーブルが検索期間の t_weather の全レコードを集計済みか確認する
+     トリガー作成日の翌日以降は集計済み、トリガー作成日以前はバックフィル済みの期間のみ集計済み
+     テーブルなし、またはバックフィル前の期間なら False
+    """
+    if not exists_daily_stat(conn, "t_weather_daily_stat_meta"):
+        return False
+
+    with conn:
+        cursor: sqlite3.Cursor = conn.execute(_META_QUERY)
+        row: Optional[Tuple[str, Optional[str], Optional[str]]] = cursor.fetchone()
+    if row is None:
+        return False
+
+    trigger_from, backfill_from, backfill_to = row
+    if from_date > trigger_from:
+        return True
+
+    # 検索期間のうちトリガー作成日までがバックフィル済みの期間に含まれること
+    to_date: str = (
+        datetime.strptime(exclude_to_date, FMT_ISO8601_DATE) - timedelta(days=1)
+    ).strftime(FMT_ISO8601_DATE)
+    if backfill_from is None or backfill_to is None:
+        return False
+    return backfill_from <= from_date and min(to_date, trigger_from) <= backfill_to
+
+
+def _fetch_daily_stat(conn: sqlite3.Connection, device_name: str,
+                      from_date: str, exclude_to_date: str) -> List[Tuple]:
+    params: Tuple[str, str, str] = (device_name, from_date, exclude_to_date,)
+    with conn:
+        cursor: sqlite3.Cursor = conn.execute(_DAILY_STAT_QUERY, params)
+        return cursor.fetchall()
+
+
+def get_temp_out_stat(conn: sqlite3.Connection,
+                      device_name: str,
+                      from_date: str, exclude_to_date: str) -> List[TempOut]:
+    """
+    windowfunc_sqlite.get_temp_out_stat と同じ [最低気温, 最高気温] を取得する
+    ※検索期間は1日分 (複数日の場合は直近の測定日)
+    """
+    rows: List[Tuple] = _fetch_daily_stat(conn, device_name, from_date, exclude_to_date)
+    if len(rows) == 0:
+        return []
+
+    row: Tuple = rows[0]
+    return [TempOut(row[1], row[2]), TempOut(row[3], row[4])]
+
+
+def get_daily_temp_out_stats(conn: sqlite3.Connection,
+                             device_name: str, from_date: str, exclude_to_date: str
+                             ) -> Dict[str, tempout_stat.TempOutStat]:
+    """
+    測定日をキーとする日ごとの外気温の統計情報 (pandas版と同じ TempOutStat) を取得する
+    ※出現時刻は "時:分"まで
+    """
+    rows: List[Tuple] = _fetch_daily_stat(conn, device_name, from_date, exclude_to_date)
+    return {
+        row[0]: tempout_stat.TempOutStat(
+            row[0],
+            min=tempout_stat.TempOut(row[1][:16], row[2]),
+            max=tempout_stat.TempOut(row[3][:16], row[4]),
+            average_temper=row[5],
+            count=row[6]
+        ) for row in rows
+    }
@@ -0,0 +1,52 @@
+import sqlite3
+from datetime import datetime
+from typing import List, Sequence, Tuple
+
+"""
+SQLite3 気象データベース検索条件の共通関数
+ 測定時刻 (unixepoch) の列を関数で変換せずに検索するための検索範囲の変換と実行計画の確認
+"""
+
+FMT_ISO8601_DATE: str = "%Y-%m-%d"
+
+
+def to_epoch(iso8601_date: str) -> int:
+    """ ISO8601日付文字列 (ローカル時刻の午前0時) を unixepoch に変換する """
+    # タイムゾーン情報なしの datetime はローカル時刻 ※SQLの 'localtime' と同じ
+    return int(datetime.strptime(iso8601_date, FMT_ISO8601_DATE).timestamp())
+
+
+def to_epoch_range(from_date: str, exclude_to_date: str) -> Tuple[int, int]:
+    """
+    検索範囲 [検索開始日, 検索終了日(含まない)) を unixepoch の範囲に変換する
+    :param from_date: ISO8601 date from
+    :param exclude_to_date: ISO8601 date to (exclude)
+    :return: (from epoch, exclude to epoch)
+    """
+    return to_epoch(from_date), to_epoch(exclude_to_date)
+
+
+def explain_query_plan(conn: sqlite3.Connection,
+                       query: str, params: Sequence) -> List[str]:
+    """
+    Get EXPLAIN QUERY PLAN details.
+    (例) ['SEARCH tw USING INDEX sqlite_autoindex_t_weather_1
+           (did=? AND measurement_time>? AND measurement_time<?)']
+    """
+    cursor: sqlite3.Cursor = conn.execute("EXPLAIN QUERY PLAN " + query, params)
+    # (id, parent, notused, detail)
+    details: List[str] = [row[3] for row in cursor.fetchall()]
+    cursor.close()
+    return details
+
+
+def is_time_range_search(details: List[str], table_alias: str) -> bool:
+    """ 指定テーブルの測定時刻がインデックスの範囲検索になっているか """
+    # SQLite 3.36 より前は "SEARCH TABLE t_weather AS tw USING ..." 形式
+    targets: Tuple[str, str] = (f"SEARCH {table_alias} ", f" AS {table_alias} ")
+    for detail in details:
+        if not detail.startswith("SEARCH") or "measurement_time>" not in detail:
+            continue
+        if any(target in detail for target in targets):
+            return True
+    return False
@@ -2,6 +2,10 @@ import sqlite3
 from dataclasses import dataclass
 from typing import List, Tuple
 
+from plot_weather.dao.sqlite_util import (
+    explain_query_plan, is_time_range_search, to_epoch_range
+)
+
 """
 SQLite3 気象データベースから外気温統計情報を取得するモジュール
 SQL window function with CTE
@@ -30,11 +34,7 @@ FROM
   t_weather tw INNER JOIN t_device td ON tw.did = td.id
 WHERE
   td.name = ?
-  AND (
-    datetime(measurement_time, 'unixepoch', 'localtime') >= ? 
-    AND 
-    datetime(measurement_time, 'unixepoch', 'localtime') < ?
-  )
+  AND tw.measurement_time >= ? AND tw.measurement_time < ?
 -- 降順でソート ※最低気温と最高気温は指定範囲に複数出現するが、直近レコードを取得値とする  
 ORDER BY measurement_time DESC
 ), min_temp_out_records AS (
@@ -63,7 +63,8 @@ SELECT * FROM max_temp_out_records
 def get_temp_out_stat(conn: sqlite3.Connection,
                       device_name: str,
                       from_date: str, exclude_to_date: str) -> List[TempOut]:
-    params: Tuple[str, str, str] = (device_name, from_date, exclude_to_date,)
+    # 検索範囲は unixepoch に変換して測定時刻の列をそのまま比較する
+    params: Tuple[str, int, int] = (device_name, *to_epoch_range(from_date, exclude_to_date),)
     result: List[TempOut] = []
     with conn:
         cursor: sqlite3.Cursor = conn.execute(_STAT_QUERY, params)
@@ -75,3 +76,9 @@ def get_temp_out_stat(conn: sqlite3.Connection,
                 rec: TempOut = TempOut(measurement_time, temp_out)
                 result.append(rec)
     return result
+
+
+def is_index_used(conn: sqlite3.Connection) -> bool:
+    """ 統計情報SQLが t_weather のインデックスで範囲検索するか実行計画で確認する """
+    details: List[str] = explain_query_plan(conn, _STAT_QUERY, ("", 0, 0))
+    return is_time_range_search(details, "tw")
@@ -0,0 +1,78 @@
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import pandas as pd
+from pandas.core.frame import DataFrame
+
+from plot_weather.dataloader.tempout_loader_sqlite import (
+    COL_TIME, get_dataframe
+)
+from plot_weather.dataloader.tempout_stat import (
+    get_daily_temp_out_stat_dict, TempOutStat
+)
+
+"""
+SQLite3 気象データの複数日分の外気温ロードモジュール
+ 検索日から遡ったN日分を1回のSQLで取得し、pandas の groupby で日ごとに分割する
+ ※統計情報はN日分をまとめて計算する
+ (例) 当日と前日 (N=2), 1週間 (N=7)
+"""
+
+FMT_ISO8601_DATE: str = "%Y-%m-%d"
+
+
+@dataclass
+class TempOutDay:
+    """ 1日分の外気温データ """
+    # 測定日 (ISO8601)
+    measurement_day: str
+    # 測定時刻の降順の外気温データ ※レコードなしなら空の DataFrame
+    df: DataFrame
+    # 外気温統計情報 ※レコードなしなら None
+    stat: Optional[TempOutStat]
+
+
+def split_by_day(df_desc: DataFrame) -> Dict[str, DataFrame]:
+    """
+    測定時刻の降順の DataFrame を日ごとに分割する
+    :param df_desc: DataFrame (measurement_time DESC)
+    :return: {'YYYY-mm-dd': DataFrame} ※各 DataFrame の並び順は元の降順のまま
+    """
+    if df_desc.shape[0] == 0:
+        return {}
+
+    days: pd.Series = df_desc[COL_TIME].dt.normalize()
+    return {
+        day.strftime(FMT_ISO8601_DATE): df_day.reset_index(drop=True)
+        for day, df_day in df_desc.groupby(days, sort=False)
+    }
+
+
+def load_days(conn: sqlite3.Connection, device_name: str, find_date: str,
+              days: int = 2) -> List[TempOutDay]:
+    """
+    検索日から遡った指定日数分の外気温データと統計情報を取得する
+    :param conn: sqlite3 connection
+    :param device_name: device name in t_device
+    :param find_date: ISO8601 find date
+    :param days: day count (find_date include)
+    :return: TempOutDay list, [find_date, find_date - 1, ...]
+    """
+    dt_find: datetime = datetime.strptime(find_date, FMT_ISO8601_DATE)
+    from_date: str = (dt_find - timedelta(days=days - 1)).strftime(FMT_ISO8601_DATE)
+    exclude_to_date: str = (dt_find + timedelta(days=1)).strftime(FMT_ISO8601_DATE)
+    # N日分を1回の検索で取得
+    df_all: DataFrame = get_dataframe(conn, device_name, from_date, exclude_to_date)
+    day_dict: Dict[str, DataFrame] = split_by_day(df_all)
+    stat_dict: Dict[str, TempOutStat] = get_daily_temp_out_stat_dict(df_all)
+
+    result: List[TempOutDay] = []
+    for i in range(days):
+        day: str = (dt_find - timedelta(days=i)).strftime(FMT_ISO8601_DATE)
+        df_day: Optional[DataFrame] = day_dict.get(day)
+        if df_day is None:
+            df_day = df_all.iloc[0:0]
+        result.append(TempOutDay(day, df_day, stat_dict.get(day)))
+    return result
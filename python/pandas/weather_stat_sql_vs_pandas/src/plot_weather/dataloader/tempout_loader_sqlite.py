@@ -1,16 +1,23 @@
 import sqlite3
-from typing import Tuple
+from typing import List, Tuple
 
 import pandas as pd
 from pandas.core.frame import DataFrame
 
+from plot_weather.dao.sqlite_util import (
+    explain_query_plan, is_time_range_search, to_epoch_range
+)
+
 """
 SQLite3 気象データの外気温ロードモジュール
+ ※ベンチマークで検索と DataFrame 生成を個別に計測できるように処理を分けている
 """
 
 
 COL_TIME: str = "measurement_time"
 COL_TEMP_OUT: str = "temp_out"
+# SQLの datetime() 関数の出力書式
+FMT_SQLITE_DATETIME: str = "%Y-%m-%d %H:%M:%S"
 
 
 _QUERY: str = """
@@ -21,21 +28,38 @@ FROM
    t_weather tw INNER JOIN t_device td ON tw.did=td.id
 WHERE
    td.name = ?
-   AND (
-       datetime(measurement_time,'unixepoch', 'localtime') >= ?
-       AND
-       datetime(measurement_time,'unixepoch', 'localtime') < ?
-   )
-ORDER BY measurement_time DESC;
+   AND tw.measurement_time >= ? AND tw.measurement_time < ?
+ORDER BY tw.measurement_time DESC;
 """
 
 
+def fetch_rows(conn: sqlite3.Connection,
+               device_name: str, from_date: str, exclude_to_date: str
+               ) -> List[Tuple[str, float]]:
+    """ 外気温レコード (測定時刻, 外気温) を測定時刻の降順に取得する """
+    # 検索範囲は unixepoch に変換して測定時刻の列をそのまま比較する ※主キーのインデックスで範囲検索
+    params: Tuple = (device_name, *to_epoch_range(from_date, exclude_to_date))
+    cursor: sqlite3.Cursor = conn.execute(_QUERY, params)
+    try:
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def to_dataframe(rows: List[Tuple[str, float]]) -> DataFrame:
+    """ 外気温レコードから DataFrame を生成する ※測定時刻は datetime 型に変換 """
+    df: DataFrame = pd.DataFrame(rows, columns=[COL_TIME, COL_TEMP_OUT])
+    df[COL_TIME] = pd.to_datetime(df[COL_TIME], format=FMT_SQLITE_DATETIME)
+    return df
+
+
 def get_dataframe(conn: sqlite3.Connection,
                   device_name: str, from_date: str, exclude_to_date
                   ) -> DataFrame:
-    params: Tuple = (device_name, from_date, exclude_to_date)
-    try:
-        read_df = pd.read_sql(_QUERY, conn, params=params, parse_dates=[COL_TIME])
-        return read_df
-    except Exception as err:
-        raise err
+    return to_dataframe(fetch_rows(conn, device_name, from_date, exclude_to_date))
+
+
+def is_index_used(conn: sqlite3.Connection) -> bool:
+    """ 外気温検索SQLが t_weather のインデックスで範囲検索するか実行計画で確認する """
+    details: List[str] = explain_query_plan(conn, _QUERY, ("", 0, 0))
+    return is_time_range_search(details, "tw")
@@ -1,10 +1,9 @@
 from dataclasses import dataclass
-from datetime import datetime
+from typing import Dict, List, Optional
 
 import numpy as np
 import pandas as pd
 from pandas.core.frame import DataFrame
-from pandas.core.series import Series
 
 from plot_weather.dataloader.tempout_loader_sqlite import (
     COL_TIME, COL_TEMP_OUT
@@ -12,8 +11,15 @@ from plot_weather.dataloader.tempout_loader_sqlite import (
 
 """
 外気温集計モジュール by pandas
+ 日ごとの最低・最高・平均気温と最低・最高気温の直近の出現時刻を複数日分まとめて計算する
+ ※DataFrame のコピーを作らずに NumPy 配列のソート (lexsort) で日ごとの先頭レコードを取得する
 """
 
+# 1日のナノ秒 ※測定時刻はタイムゾーンなしのローカル時刻
+NS_PER_DAY: int = 24 * 60 * 60 * 10 ** 9
+# 出現時刻の書式 ※時刻部分は "時:分"までとする
+FMT_APPEAR_TIME: str = "%Y-%m-%d %H:%M"
+
 
 @dataclass
 class TempOut:
@@ -30,34 +36,74 @@ class TempOutStat:
     min: TempOut
     # 最高外気温情報
     max: TempOut
+    # 平均外気温 ※小数点第一位に四捨五入
+    average_temper: Optional[float] = None
+    # レコード件数
+    count: int = 0
+
+
+def _group_first(days: np.ndarray, order: np.ndarray) -> np.ndarray:
+    """ 日付順にソートしたインデックスから日ごとの先頭のインデックスを取得する """
+    sorted_days: np.ndarray = days[order]
+    starts: np.ndarray = np.flatnonzero(np.r_[True, sorted_days[1:] != sorted_days[:-1]])
+    return order[starts]
+
+
+def _calc_temp_out_stats(df: DataFrame, by_day: bool) -> List[TempOutStat]:
+    times: np.ndarray = df[COL_TIME].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    temps: np.ndarray = df[COL_TEMP_OUT].to_numpy(dtype=np.float64)
+    # 外気温が NULL (NaN) のレコードは除外する
+    valid: np.ndarray = ~np.isnan(temps)
+    if not valid.all():
+        times, temps = times[valid], temps[valid]
+    if times.size == 0:
+        return []
+
+    # 集計単位: 日ごと または 全レコード
+    days: np.ndarray = times // NS_PER_DAY if by_day else np.zeros(times.size, dtype=np.int64)
+    # 日付の昇順 > 外気温の[昇順|降順] > 測定時刻の降順 でソートした日ごとの先頭レコード
+    # ※np.lexsort は最後のキーが第1ソートキー
+    min_idx: np.ndarray = _group_first(days, np.lexsort((-times, temps, days)))
+    max_idx: np.ndarray = _group_first(days, np.lexsort((-times, -temps, days)))
+    # 日ごとの件数と平均気温
+    unique_days, day_pos, counts = np.unique(days, return_inverse=True, return_counts=True)
+    averages: np.ndarray = np.bincount(day_pos, weights=temps) / counts
+
+    min_times: pd.DatetimeIndex = pd.to_datetime(times[min_idx])
+    max_times: pd.DatetimeIndex = pd.to_datetime(times[max_idx])
+    result: List[TempOutStat] = []
+    for i in range(unique_days.size):
+        min_time: str = min_times[i].strftime(FMT_APPEAR_TIME)
+        result.append(TempOutStat(
+            # 測定日は先頭 10桁分(年月日)
+            min_time[:10],
+            min=TempOut(min_time, float(temps[min_idx[i]])),
+            max=TempOut(max_times[i].strftime(FMT_APPEAR_TIME), float(temps[max_idx[i]])),
+            average_temper=round(float(averages[i]), 1),
+            count=int(counts[i])
+        ))
+    return result
+
+
+def get_daily_temp_out_stats(df: DataFrame) -> List[TempOutStat]:
+    """
+    日ごとの外気温の統計情報を取得する
+     最低気温と最高気温が1日に複数回出現する場合は直近(時刻が最も遅い)の時刻とする
+    :param df: DataFrame (measurement_time, temp_out) ※並び順は問わない
+    :return: TempOutStat list, 測定日の昇順 ※外気温が NULL のみの日は含まない
+    """
+    return _calc_temp_out_stats(df, by_day=True)
+
+
+def get_daily_temp_out_stat_dict(df: DataFrame) -> Dict[str, TempOutStat]:
+    """ 測定日をキーとする日ごとの外気温の統計情報 """
+    return {stat.measurement_day: stat for stat in get_daily_temp_out_stats(df)}
 
 
 def get_temp_out_stat(df_desc: DataFrame) -> TempOutStat:
     """ 外気温の統計情報 ([最低気温|最高気温] の気温とその出現時刻) を取得する """
+    stats: List[TempOutStat] = _calc_temp_out_stats(df_desc, by_day=False)
+    if len(stats) == 0:
+        raise ValueError("No temp_out records.")
 
-    def get_measurement_time(pd_timestamp: pd.Timestamp) -> str:
-        py_datetime: datetime = pd_timestamp.to_pydatetime()
-        # 時刻部分は "時:分"までとする
-        return py_datetime.strftime("%Y-%m-%d %H:%M")
-
-    # 外気温列
-    temp_out_ser: Series = df_desc[COL_TEMP_OUT]
-    # 外気温列から最低・最高・平均気温を取得
-    min_temper: np.float64 = temp_out_ser.min()
-    max_temper: np.float64 = temp_out_ser.max()
-    # 全ての最低気温を取得する
-    df_min_all: DataFrame = df_desc[temp_out_ser <= min_temper]
-    # 全ての最高気温を取得する
-    df_max_all: pd.DataFrame = df_desc[temp_out_ser >= max_temper]
-    # それぞれ直近の１レコードのみ取得
-    min_first: Series = df_min_all.iloc[0]
-    max_first: Series = df_max_all.iloc[0]
-    # 測定日は先頭 10桁分(年月日)
-    min_measurement_time: str = get_measurement_time(min_first[COL_TIME])
-    measurement_day: str = min_measurement_time[:10]
-    # 最低気温情報
-    min_data: TempOut = TempOut(min_measurement_time, float(min_first[COL_TEMP_OUT]))
-    # 最高気温情報
-    max_measurement_time: str = get_measurement_time(max_first[COL_TIME])
-    max_data: TempOut = TempOut(max_measurement_time, float(max_first[COL_TEMP_OUT]))
-    return TempOutStat(measurement_day, min=min_data, max=max_data)
+    return stats[0]
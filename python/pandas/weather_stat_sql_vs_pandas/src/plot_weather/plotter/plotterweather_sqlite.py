@@ -1,7 +1,7 @@
 import base64
 from io import BytesIO
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from pandas.core.frame import DataFrame
 
@@ -17,7 +17,7 @@ from matplotlib.text import Text
 from plot_weather.dataloader.tempout_loader_sqlite import (
     COL_TIME, COL_TEMP_OUT
 )
-from plot_weather.dataloader.pandas_statistics import (
+from plot_weather.dataloader.tempout_stat import (
     get_temp_out_stat, TempOutStat, TempOut
 )
 
@@ -84,15 +84,20 @@ def sub_graph(ax: Axes, title: str, df: DataFrame, temp_stat: TempOutStat):
 
 
 def gen_plot_image(
-        curr_df: DataFrame, before_df: DataFrame, phone_size: str = None) -> str:
+        curr_df: DataFrame, before_df: DataFrame, phone_size: str = None,
+        curr_stat: Optional[TempOutStat] = None, before_stat: Optional[TempOutStat] = None
+) -> str:
     """
     観測データの画像を生成する
+    ※統計情報が未指定なら DataFrame から計算する
     """
 
     # 検索日の統計情報
-    curr_stat: TempOutStat = get_temp_out_stat(curr_df)
+    if curr_stat is None:
+        curr_stat = get_temp_out_stat(curr_df)
     # 前日の統計情報
-    before_stat: TempOutStat = get_temp_out_stat(before_df)
+    if before_stat is None:
+        before_stat = get_temp_out_stat(before_df)
 
     # 端末に応じたサイズのプロット領域枠(Figure)を生成する
     fig: Figure
@@ -1,15 +1,33 @@
 import argparse
+import asyncio
 import os
 import logging
+import queue
+import signal
 import socket
 import sqlite3
+import threading
 import time
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from udp_stats import UdpStatsReporter, set_recv_buffer
+from weather_packet import WeatherPacket, decode_packet
+from weather_daily_stat import create_daily_stat
 
 """
 UDP packet monitor from ESP Weather sensors With Insert weather_db on SQlite3 database
 [UDP port] 2222
+[一括登録] 受信したレコードをバッファリングし、件数または経過時間の上限で1トランザクションで登録する
+ ※ジャーナルモードは WAL, 停止時(SIGTERM)はバッファのレコードを登録してから終了する
+ ※データベースのロックなどで登録に失敗したレコードは保持して次回の登録で再試行する
+[asyncio受信] --use-asyncio
+ asyncio の DatagramProtocol で受信したレコードを上限付きのキューに追加し、登録は別スレッドで行う
+ ※キューが満杯の場合は破棄し、受信数・破棄数・キューの待ち数を定期的に出力する
+[パケット形式] テキスト形式とバイナリ形式(固定長)のどちらも受信可能 ※weather_packet 参照
+[受信状況] --stats-interval 秒ごとにカーネルのドロップ数とデバイスごとの到着間隔を出力する
+ ※受信バッファサイズは --rcvbuf で指定する
+[日ごとの統計情報] t_weather_daily_stat は登録トリガーで更新する ※weather_daily_stat 参照
 """
 
 # ログフォーマット
@@ -17,6 +35,7 @@ LOG_FMT: str = '%(levelname)s %(message)s'
 
 # SQL定義
 FIND_DEVICE: str = "SELECT id FROM t_device WHERE name = ?"
+SELECT_DEVICES: str = "SELECT id, name FROM t_device"
 INSERT_WEATHER: str = """
 INSERT INTO t_weather(did, measurement_time, temp_out, temp_in, humid, pressure) 
  VALUES (?, ?, ?, ?, ?, ?)  
@@ -24,10 +43,21 @@ INSERT INTO t_weather(did, measurement_time, temp_out, temp_in, humid, pressure)
 
 # UDP受信ポート
 WEATHER_UDP_PORT: int = 2222
-# UDP受信バッファ
+# UDP受信バッファ (1パケットの最大受信サイズ)
 BUFF_SIZE: int = 1024
+# デバイスごとの到着間隔の警告閾値(秒) ※ESPの送信間隔は約10分
+GAP_THRESHOLD: float = 15. * 60
 # UDP packet receive timeout 12 minutes
 RECV_TIMEOUT: float = 12. * 60
+# 一括登録の件数と経過時間(秒)の上限 (既定値)
+BATCH_SIZE: int = 50
+FLUSH_INTERVAL: float = 5.
+# 登録失敗時に保持する登録待ちレコードの上限 ※超えた場合は古いレコードから破棄する
+PENDING_LIMIT: int = 10000
+# asyncio受信: キューの上限 (既定値)
+QUEUE_SIZE: int = 1000
+# 統計情報の出力間隔(秒) (既定値)
+STATS_INTERVAL: float = 60.
 
 F_DATETIME: str = "%Y-%m-%d %H:%M:%S"
 
@@ -41,27 +71,15 @@ F_DATETIME: str = "%Y-%m-%d %H:%M:%S"
 #   (3) INTEGER as Unix Time, the number of seconds since 1970-01-01 00:00:00 UTC.
 
 
-def to_float(s_value: str) -> Optional[float]:
-    """
-    Numeric string convert to float value
-    :param s_value: Numeric string
-    :return: float value or if ValueError, None
-    """
-    try:
-        val = float(s_value)
-    except ValueError:
-        val = None
-    return val
-
-
 def get_connection(db_file_path: str, auto_commit: bool = False, read_only: bool = False,
-                   logger: Optional[logging.Logger] = None) -> sqlite3.Connection:
+                   logger: Optional[logging.Logger] = None,
+                   check_same_thread: bool = True) -> sqlite3.Connection:
     try:
         if read_only:
             db_uri = "file://{}?mode=ro".format(db_file_path)
-            connection = sqlite3.connect(db_uri, uri=True)
+            connection = sqlite3.connect(db_uri, uri=True, check_same_thread=check_same_thread)
         else:
-            connection = sqlite3.connect(db_file_path)
+            connection = sqlite3.connect(db_file_path, check_same_thread=check_same_thread)
             if auto_commit:
                 connection.isolation_level = None
     except sqlite3.Error as e:
@@ -96,84 +114,321 @@ def find_device(conn: sqlite3.Connection, device_name: str,
     return None
 
 
-def insert(device_name: str, temp_out: str, temp_in: str, humid: str, pressure: str,
-           measurement_time: float, logger: Optional[logging.Logger] = None) -> None:
+def load_devices(conn: sqlite3.Connection) -> Dict[str, int]:
+    """
+    Load all device name and id in t_device.
+    :param conn: Weather database connection
+    :return: dict {device name: device ID}
+    """
+    cur: sqlite3.Cursor = conn.execute(SELECT_DEVICES)
+    return {name: did for (did, name) in cur.fetchall()}
+
+
+# 登録レコード: (did, measurement_time, temp_out, temp_in, humid, pressure)
+WeatherRecord = Tuple[int, int, Optional[float], Optional[float], Optional[float], Optional[float]]
+
+
+class WeatherWriter(object):
     """
     Insert weather sensor data to t_weather
-    :param device_name: device name (required)
-    :param temp_out: Outdoor Temperature (float or None)
-    :param temp_in: Indoor Temperature (float or None)
-    :param humid: humidity (float or None)
-    :param pressure: pressure (float or None)
-    :param measurement_time: unix epoch at local time
-    :param logger: application logger or None
+    プロセス起動中は同一の接続を使い続ける
+     ※sqlite3モジュールは接続ごとにコンパイル済みのSQL文をキャッシュするため同じSQL文字列を使う
+    レコードは batch_size 件たまるか、最初のレコードから flush_interval 秒経過したら一括で登録する
+    ※asyncio受信では check_same_thread=False で生成し、登録スレッドのみで使用する
     """
-    log_level_debug: bool = False
-    if logger is not None:
-        log_level_debug = logger.getEffectiveLevel() <= logging.DEBUG
-    conn: sqlite3.Connection = get_connection(weather_db, logger=logger)
-    did: Optional[int] = find_device(conn, device_name, logger=logger)
-    if did is None:
-        warning: str = f"{device_name} not found!"
+    def __init__(self, db_file_path: str,
+                 batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL,
+                 logger: Optional[logging.Logger] = None, check_same_thread: bool = True):
+        self.logger = logger
+        self.log_level_debug: bool = False
+        if logger is not None:
+            self.log_level_debug = logger.getEffectiveLevel() <= logging.DEBUG
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        # 登録待ちのレコード
+        self.pending: List[WeatherRecord] = []
+        # 登録待ちの先頭レコードの追加時刻 (time.monotonic)
+        self.pending_since: float = 0.
+        self.conn: sqlite3.Connection = get_connection(
+            db_file_path, logger=logger, check_same_thread=check_same_thread
+        )
+        # 書き込み中も読み込みをブロックせず、コミット毎の同期書き込みを減らす
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # 外気温の日ごとの統計情報テーブルと登録トリガー
+        create_daily_stat(self.conn, logger=logger)
+        # デバイス名とデバイスIDの対応をメモリに保持する
+        self.devices: Dict[str, int] = load_devices(self.conn)
         if logger is not None:
-            logger.warning(warning)
+            logger.info(f"devices: {self.devices}")
+
+    def get_device_id(self, device_name: str) -> Optional[int]:
+        did: Optional[int] = self.devices.get(device_name)
+        if did is None:
+            # 起動後に追加されたデバイスの場合があるのでテーブルを検索する
+            did = find_device(self.conn, device_name,
+                              logger=self.logger, log_level_debug=self.log_level_debug)
+            if did is not None:
+                self.devices[device_name] = did
+        return did
+
+    def has_device_id(self, did: int) -> bool:
+        if did in self.devices.values():
+            return True
+        # 起動後に追加されたデバイスの場合があるので再読み込みする
+        self.devices = load_devices(self.conn)
+        return did in self.devices.values()
+
+    def insert(self, packet: WeatherPacket, measurement_time: float) -> None:
+        """
+        Insert weather sensor data to t_weather
+        :param packet: decoded packet (device name or device ID is required)
+        :param measurement_time: unix epoch at local time
+        """
+        did: Optional[int]
+        if packet.device_id is not None:
+            # バイナリ形式のパケットはデバイスIDを含む ※t_device に存在するIDのみ登録する
+            did = packet.device_id
+            if not self.has_device_id(did):
+                self._warning(f"device_id: {did} not found!")
+                return
+        else:
+            did = self.get_device_id(packet.device_name)
+            if did is None:
+                self._warning(f"{packet.device_name} not found!")
+                return
+
+        rec: WeatherRecord = (
+            did,
+            int(measurement_time),
+            packet.temp_out,
+            packet.temp_in,
+            packet.humid,
+            packet.pressure
+        )
+        if self.logger is not None and self.log_level_debug:
+            self.logger.debug(rec)
+        if len(self.pending) == 0:
+            self.pending_since = time.monotonic()
+        self.pending.append(rec)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self) -> None:
+        if len(self.pending) > 0 and \
+                time.monotonic() - self.pending_since >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if len(self.pending) == 0:
+            return
+
+        recs: List[WeatherRecord] = list(self.pending)
+        inserted: int = 0
+        try:
+            # 1トランザクションで登録 ※重複などのエラーレコードのみスキップする
+            with self.conn:
+                for rec in recs:
+                    try:
+                        self.conn.execute(INSERT_WEATHER, rec)
+                        inserted += 1
+                    except sqlite3.IntegrityError as db_err:
+                        self._warning(f"rec: {rec}\nerror:{db_err}")
+        except sqlite3.Error as db_err:
+            # ロールバックされたレコードは保持して flush_interval 秒後に再試行する
+            self._warning(f"recs: {len(recs)}, retry later\nerror:{db_err}")
+            self.pending_since = time.monotonic()
+            if len(self.pending) > PENDING_LIMIT:
+                discard: int = len(self.pending) - PENDING_LIMIT
+                self._warning(f"pending over {PENDING_LIMIT}, discard: {discard}")
+                del self.pending[:discard]
+            return
+
+        # コミット後に登録待ちから取り除く
+        del self.pending[:len(recs)]
+        if self.logger is not None and self.log_level_debug:
+            self.logger.debug(f"flush: {inserted}/{len(recs)}")
+
+    def _warning(self, warning: str) -> None:
+        if self.logger is not None:
+            self.logger.warning(warning)
         else:
             print(warning)
-        return
-
-    rec: Tuple[int, int, Optional[float], Optional[float], Optional[float], Optional[float]] = (
-        did,
-        int(measurement_time),
-        to_float(temp_out),
-        to_float(temp_in),
-        to_float(humid),
-        to_float(pressure)
+
+    def close(self) -> None:
+        # 登録待ちのレコードを登録してから閉じる
+        self.flush()
+        if len(self.pending) > 0:
+            self._warning(f"not inserted: {len(self.pending)}")
+        self.conn.close()
+
+
+def measurement_now() -> float:
+    # Insert weather DB with local time
+    # unix time ※こちらのほうが精度が高い
+    # curr_time: float = time.time()
+    # local time (UTC + 9H) -> unix time
+    local_time: time.struct_time = time.localtime()
+    curr_time: float = time.mktime(local_time)
+    # これは確認用
+    dt: datetime = datetime.fromtimestamp(curr_time)
+    app_logger.debug(f"{curr_time} ({dt.strftime(F_DATETIME)})")
+    return curr_time
+
+
+class WeatherDatagramProtocol(asyncio.DatagramProtocol):
+    """
+    UDPパケットを受信して登録待ちキューに追加する
+    ※イベントループ内で実行されるためブロックする処理 (DB登録) は行わない
+    """
+    def __init__(self, record_queue: queue.Queue, reporter: UdpStatsReporter):
+        self.record_queue: queue.Queue = record_queue
+        self.reporter: UdpStatsReporter = reporter
+        self.server_ip: str = ''
+        self.last_received: float = time.monotonic()
+        # 統計情報
+        self.received: int = 0
+        self.dropped: int = 0
+        self.max_depth: int = 0
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        self.received += 1
+        self.last_received = time.monotonic()
+        if self.server_ip != addr:
+            self.server_ip = addr
+            app_logger.info("server ip: {}".format(self.server_ip))
+        try:
+            packet: WeatherPacket = decode_packet(data)
+            self.reporter.record(packet.device_key, packet.seq)
+            self.record_queue.put_nowait((packet, measurement_now()))
+        except queue.Full:
+            # 登録が追いつかない場合は破棄する
+            self.dropped += 1
+            return
+        except ValueError as err:
+            app_logger.warning(f"{addr}: {err}")
+            return
+        self.max_depth = max(self.max_depth, self.record_queue.qsize())
+
+    def error_received(self, exc: Exception) -> None:
+        app_logger.warning(exc)
+
+
+def writer_worker(writer: WeatherWriter, record_queue: queue.Queue,
+                  stop_event: threading.Event, flush_interval: float):
+    # 接続はスレッド開始前に生成済み ※以降はこのスレッドのみで使用する
+    try:
+        # 停止要求後もキューに残っているレコードを全て登録する
+        while not stop_event.is_set() or not record_queue.empty():
+            try:
+                packet, curr_time = record_queue.get(timeout=max(flush_interval, 0.1))
+            except queue.Empty:
+                writer.flush_if_due()
+                continue
+            writer.insert(packet, measurement_time=curr_time)
+    except Exception as err:
+        # 受信側 (report_stats) はスレッドの終了を検知して停止する
+        app_logger.error(f"weather_writer: {err}")
+    finally:
+        writer.close()
+
+
+async def report_stats(protocol: WeatherDatagramProtocol, record_queue: queue.Queue,
+                       writer_thread: threading.Thread):
+    while True:
+        await asyncio.sleep(protocol.reporter.stats_interval)
+        # 登録スレッドが異常終了した場合は受信を停止する
+        if not writer_thread.is_alive():
+            raise RuntimeError("weather_writer thread stopped")
+        app_logger.info(
+            f"received: {protocol.received}, dropped: {protocol.dropped}"
+            f", queue depth: {record_queue.qsize()} (max: {protocol.max_depth})"
+        )
+        protocol.reporter.report()
+        protocol.max_depth = record_queue.qsize()
+        if time.monotonic() - protocol.last_received >= RECV_TIMEOUT:
+            raise socket.timeout("timed out")
+
+
+async def monitor_async(client: socket.socket, db_file_path: str,
+                        queue_size: int, batch_size: int, flush_interval: float,
+                        reporter: UdpStatsReporter):
+    record_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop_event: threading.Event = threading.Event()
+    # データベースの接続エラーは受信を開始する前に呼び出し元に通知する
+    writer: WeatherWriter = WeatherWriter(
+        db_file_path, batch_size=batch_size, flush_interval=flush_interval,
+        logger=app_logger, check_same_thread=False
+    )
+    writer_thread: threading.Thread = threading.Thread(
+        target=writer_worker, name="weather_writer",
+        args=(writer, record_queue, stop_event, flush_interval)
+    )
+    writer_thread.start()
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    # サービス停止時は統計情報の出力タスクをキャンセルして登録スレッドの終了を待つ
+    main_task: Optional[asyncio.Task] = asyncio.current_task()
+    if main_task is not None:
+        loop.add_signal_handler(signal.SIGTERM, main_task.cancel)
+    transport: asyncio.BaseTransport
+    protocol: WeatherDatagramProtocol
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: WeatherDatagramProtocol(record_queue, reporter), sock=client
     )
-    if logger is not None and log_level_debug:
-        logger.debug(rec)
     try:
-        with conn:
-            conn.execute(INSERT_WEATHER, rec)
-    except sqlite3.Error as db_err:
-        error: str = f"rec: {rec}\nerror:{db_err}"
-        if logger is not None:
-            logger.warning(error)
-        else:
-            print(error)
+        await report_stats(protocol, record_queue, writer_thread)
     finally:
-        if conn is not None:
-            conn.close()
+        transport.close()
+        stop_event.set()
+        # 登録スレッドの終了を待つ間もイベントループをブロックしない
+        await loop.run_in_executor(None, writer_thread.join)
+        app_logger.info(
+            f"received: {protocol.received}, dropped: {protocol.dropped}"
+        )
 
 
-def loop(client: socket.socket):
+# 停止要求 (SIGTERM) ※登録中に中断せず、受信ループを抜けてから finally 節で登録して閉じる
+stop_requested: threading.Event = threading.Event()
+
+
+def detect_signal(signum, frame):
+    app_logger.info(f"signum: {signum}")
+    stop_requested.set()
+
+
+def loop(client: socket.socket, writer: WeatherWriter, reporter: UdpStatsReporter,
+         recv_size: int):
     server_ip: str = ''
     # Timeout setting
-    client.settimeout(RECV_TIMEOUT)
+    #  一括登録の経過時間を確認するため受信タイムアウトは登録間隔とし、受信なしの継続時間を別に判定する
+    client.settimeout(min(max(writer.flush_interval, 0.1), RECV_TIMEOUT))
+    last_received: float = time.monotonic()
     data: bytes
     address: str
-    while True:
+    while not stop_requested.is_set():
         try:
-            data, addr = client.recvfrom(BUFF_SIZE)
+            data, addr = client.recvfrom(recv_size)
+            last_received = time.monotonic()
             if server_ip != addr:
                 server_ip = addr
                 app_logger.info("server ip: {}".format(server_ip))
 
-            # from ESP output: device_name, temp_out, temp_in, humid, pressure
-            line: str = data.decode("utf-8")
-            record: List[str] = line.split(",")
-            # Insert weather DB with local time
-            # unix time ※こちらのほうが精度が高い
-            # curr_time: float = time.time()
-            # local time (UTC + 9H) -> unix time
-            local_time: time.struct_time = time.localtime()
-            curr_time: float = time.mktime(local_time)
-            # これは確認用
-            dt: datetime = datetime.fromtimestamp(curr_time)
-            app_logger.debug(f"{curr_time} ({dt.strftime(F_DATETIME)})")
             # レコード登録
-            insert(record[0], record[1], record[2], record[3], record[4],
-                   measurement_time=curr_time, logger=app_logger)
+            try:
+                packet: WeatherPacket = decode_packet(data)
+            except ValueError as err:
+                app_logger.warning(f"{addr}: {err}")
+                continue
+            reporter.record(packet.device_key, packet.seq)
+            writer.insert(packet, measurement_time=measurement_now())
+            reporter.report_if_due()
         except socket.timeout as timeout:
+            writer.flush_if_due()
+            reporter.report_if_due()
+            if time.monotonic() - last_received < RECV_TIMEOUT:
+                continue
             app_logger.warning(timeout)
             raise timeout
 
@@ -188,6 +443,25 @@ if __name__ == '__main__':
     #  for localtime:~/db/weather.db
     parser.add_argument("--sqlite3-db", type=str, required=True,
                         help="QLite3 データベースパス")
+    # 一括登録の件数と経過時間(秒)の上限
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help=f"一括登録するレコード数 (既定値: {BATCH_SIZE})")
+    parser.add_argument("--flush-interval", type=float, default=FLUSH_INTERVAL,
+                        help=f"一括登録までの最大待ち時間(秒) (既定値: {FLUSH_INTERVAL})")
+    # asyncioで受信し、別スレッドで登録する
+    parser.add_argument("--use-asyncio", action="store_true",
+                        help="asyncio で受信し別スレッドで登録する")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help=f"登録待ちキューの上限 (既定値: {QUEUE_SIZE})")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL,
+                        help=f"統計情報の出力間隔(秒) (既定値: {STATS_INTERVAL})")
+    # カーネルの受信バッファサイズ ※未指定(0)ならOSの既定値
+    parser.add_argument("--rcvbuf", type=int, default=0,
+                        help="SO_RCVBUF (bytes), 既定値(=0) はOSの既定値")
+    parser.add_argument("--recv-size", type=int, default=BUFF_SIZE,
+                        help=f"1パケットの最大受信サイズ (既定値: {BUFF_SIZE})")
+    parser.add_argument("--gap-threshold", type=float, default=GAP_THRESHOLD,
+                        help=f"到着間隔の警告閾値(秒) (既定値: {GAP_THRESHOLD})")
     args: argparse.Namespace = parser.parse_args()
     # データベースパス
     weather_db: str = os.path.expanduser(args.sqlite3_db)
@@ -201,12 +475,31 @@ if __name__ == '__main__':
     # UDP client
     udp_client: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     app_logger.info(f"udp_client: {udp_client}")
+    set_recv_buffer(udp_client, args.rcvbuf, logger=app_logger)
     udp_client.bind(broad_address)
+    udp_reporter: UdpStatsReporter = UdpStatsReporter(
+        WEATHER_UDP_PORT, args.stats_interval, args.gap_threshold, app_logger
+    )
+    weather_writer: Optional[WeatherWriter] = None
     try:
-        loop(udp_client)
-    except KeyboardInterrupt:
+        if args.use_asyncio:
+            asyncio.run(
+                monitor_async(udp_client, weather_db, args.queue_size, args.batch_size,
+                              args.flush_interval, udp_reporter)
+            )
+        else:
+            weather_writer = WeatherWriter(
+                weather_db, batch_size=args.batch_size, flush_interval=args.flush_interval,
+                logger=app_logger
+            )
+            # サービス停止時もバッファのレコードを登録する ※finally 節で登録して閉じる
+            signal.signal(signal.SIGTERM, detect_signal)
+            loop(udp_client, weather_writer, udp_reporter, args.recv_size)
+    except (KeyboardInterrupt, asyncio.CancelledError):
         pass
     except Exception as err:
         app_logger.error(err)
     finally:
+        if weather_writer is not None:
+            weather_writer.close()
         udp_client.close()
@@ -0,0 +1,257 @@
+import argparse
+import logging
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+"""
+外気温の日ごとの統計情報テーブル (t_weather_daily_stat)
+ デバイスごと・測定日(ローカル時刻)ごとの最低・最高気温と直近の出現時刻、平均気温算出用の合計と件数
+[登録時の更新] t_weather の登録トリガーで1レコードずつ更新する
+ ※UDPモニターはデータベース接続時に create_daily_stat() でテーブルとトリガーを作成する (バックフィルはしない)
+[バックフィル] 既存の t_weather から指定期間を再集計する
+ python weather_daily_stat.py --db-path ~/db/weather.db [--date-from 2023-11-01 --date-to 2024-01-13]
+ ※t_weather のレコードを更新・削除した場合も該当期間をバックフィルする
+[集計済み期間] t_weather_daily_stat_meta (1レコード) に記録する
+ trigger_from: トリガー作成日 ※翌日以降はトリガーで全レコードを集計済み
+ backfill_from, backfill_to: バックフィル済みの期間 ※トリガー作成日以前はこの期間のみ集計済み
+"""
+
+FMT_ISO8601_DATE: str = "%Y-%m-%d"
+
+CREATE_DAILY_STAT: str = """
+CREATE TABLE IF NOT EXISTS t_weather_daily_stat(
+    did INTEGER NOT NULL,
+    measurement_day TEXT NOT NULL,
+    min_temp_out real,
+    min_time INTEGER,
+    max_temp_out real,
+    max_time INTEGER,
+    sum_temp_out real NOT NULL DEFAULT 0,
+    temp_out_count INTEGER NOT NULL DEFAULT 0,
+    record_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (did, measurement_day)
+);
+"""
+
+# 外気温が NULL のレコードは件数のみ加算する
+# 最低・最高気温が同じ値なら時刻の遅いほうに更新する ※SET句の右辺は全て更新前の値
+CREATE_DAILY_STAT_TRIGGER: str = """
+CREATE TRIGGER IF NOT EXISTS trg_weather_daily_stat AFTER INSERT ON t_weather
+BEGIN
+    INSERT OR IGNORE INTO t_weather_daily_stat(did, measurement_day)
+     VALUES (NEW.did, date(NEW.measurement_time, 'unixepoch', 'localtime'));
+    UPDATE t_weather_daily_stat SET
+      min_temp_out = CASE
+        WHEN NEW.temp_out IS NOT NULL
+          AND (min_temp_out IS NULL OR NEW.temp_out < min_temp_out)
+        THEN NEW.temp_out ELSE min_temp_out END,
+      min_time = CASE
+        WHEN NEW.temp_out IS NOT NULL
+          AND (min_temp_out IS NULL OR NEW.temp_out < min_temp_out
+               OR (NEW.temp_out = min_temp_out AND NEW.measurement_time > min_time))
+        THEN NEW.measurement_time ELSE min_time END,
+      max_temp_out = CASE
+        WHEN NEW.temp_out IS NOT NULL
+          AND (max_temp_out IS NULL OR NEW.temp_out > max_temp_out)
+        THEN NEW.temp_out ELSE max_temp_out END,
+      max_time = CASE
+        WHEN NEW.temp_out IS NOT NULL
+          AND (max_temp_out IS NULL OR NEW.temp_out > max_temp_out
+               OR (NEW.temp_out = max_temp_out AND NEW.measurement_time > max_time))
+        THEN NEW.measurement_time ELSE max_time END,
+      sum_temp_out = sum_temp_out + IFNULL(NEW.temp_out, 0),
+      temp_out_count = temp_out_count + (NEW.temp_out IS NOT NULL),
+      record_count = record_count + 1
+    WHERE
+      did = NEW.did AND measurement_day = date(NEW.measurement_time, 'unixepoch', 'localtime');
+END;
+"""
+
+CREATE_DAILY_STAT_META: str = """
+CREATE TABLE IF NOT EXISTS t_weather_daily_stat_meta(
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    trigger_from TEXT NOT NULL,
+    backfill_from TEXT,
+    backfill_to TEXT
+);
+"""
+
+# トリガー作成日 ※作成済みなら更新しない
+INSERT_DAILY_STAT_META: str = """
+INSERT OR IGNORE INTO t_weather_daily_stat_meta(id, trigger_from)
+ VALUES (1, date('now', 'localtime'))
+"""
+
+# バックフィル済みの期間と連続していれば期間を広げ、離れていれば置き換える
+# ※SET句の右辺は全て更新前の値
+UPDATE_DAILY_STAT_META: str = """
+UPDATE t_weather_daily_stat_meta SET
+  backfill_from = CASE
+    WHEN backfill_from IS NULL
+      OR backfill_to < date(:date_from, '-1 day') OR backfill_from > date(:date_to, '+1 day')
+    THEN :date_from ELSE MIN(backfill_from, :date_from) END,
+  backfill_to = CASE
+    WHEN backfill_from IS NULL
+      OR backfill_to < date(:date_from, '-1 day') OR backfill_from > date(:date_to, '+1 day')
+    THEN :date_to ELSE MAX(backfill_to, :date_to) END
+WHERE id = 1
+"""
+
+EXISTS_DAILY_STAT: str = """
+SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = 't_weather_daily_stat'
+"""
+
+DELETE_DAILY_STAT: str = """
+DELETE FROM t_weather_daily_stat WHERE measurement_day >= ? AND measurement_day < ?
+"""
+
+# 測定日ごとに最低・最高気温の直近の1レコードを ROW_NUMBER で特定して再集計する
+# ※外気温が NULL のレコードは最低気温の並び順で末尾にする (SQLiteの NULL は最小値)
+BACKFILL_DAILY_STAT: str = """
+INSERT INTO t_weather_daily_stat(
+  did, measurement_day, min_temp_out, min_time, max_temp_out, max_time,
+  sum_temp_out, temp_out_count, record_count)
+WITH day_records AS (
+  SELECT
+    did, measurement_time, temp_out,
+    date(measurement_time, 'unixepoch', 'localtime') AS measurement_day
+  FROM
+    t_weather
+  WHERE
+    measurement_time >= ? AND measurement_time < ?
+), ranked AS (
+  SELECT
+    did, measurement_day, measurement_time, temp_out,
+    ROW_NUMBER() OVER (
+      PARTITION BY did, measurement_day
+      ORDER BY temp_out IS NULL, temp_out, measurement_time DESC
+    ) AS min_rank,
+    ROW_NUMBER() OVER (
+      PARTITION BY did, measurement_day
+      ORDER BY temp_out DESC, measurement_time DESC
+    ) AS max_rank
+  FROM
+    day_records
+)
+SELECT
+  did, measurement_day,
+  MIN(temp_out),
+  MAX(CASE WHEN min_rank = 1 AND temp_out IS NOT NULL THEN measurement_time END),
+  MAX(temp_out),
+  MAX(CASE WHEN max_rank = 1 AND temp_out IS NOT NULL THEN measurement_time END),
+  IFNULL(SUM(temp_out), 0), COUNT(temp_out), COUNT(*)
+FROM
+  ranked
+GROUP BY
+  did, measurement_day
+"""
+
+SELECT_TIME_RANGE: str = "SELECT MIN(measurement_time), MAX(measurement_time) FROM t_weather"
+
+
+def _create_table_and_trigger(conn: sqlite3.Connection) -> bool:
+    """ テーブルとトリガーを作成する ※テーブルを新規作成した場合は True """
+    exists: bool = conn.execute(EXISTS_DAILY_STAT).fetchone()[0] > 0
+    # テーブル -> トリガーの順に作成する ※バックフィルはトリガー作成後に実行する
+    conn.execute(CREATE_DAILY_STAT)
+    conn.execute(CREATE_DAILY_STAT_META)
+    conn.execute(CREATE_DAILY_STAT_TRIGGER)
+    with conn:
+        conn.execute(INSERT_DAILY_STAT_META)
+    return not exists
+
+
+def create_daily_stat(conn: sqlite3.Connection,
+                      logger: Optional[logging.Logger] = None) -> None:
+    """
+    Create t_weather_daily_stat table and insert trigger if not exists.
+     作成前に登録済みのレコードはバックフィル (コマンドライン) で集計する
+     ※集計済みかどうかは読み込み側が t_weather_daily_stat_meta で判定する
+    """
+    if _create_table_and_trigger(conn) and logger is not None:
+        logger.info("t_weather_daily_stat created, run weather_daily_stat.py to backfill.")
+
+
+def to_epoch(iso8601_date: str) -> int:
+    # ローカル時刻の午前0時
+    return int(datetime.strptime(iso8601_date, FMT_ISO8601_DATE).timestamp())
+
+
+def _backfill(conn: sqlite3.Connection, date_from: Optional[str], date_to: Optional[str],
+              logger: Optional[logging.Logger] = None) -> int:
+    if date_from is None or date_to is None:
+        time_range: Tuple[Optional[int], Optional[int]] = conn.execute(
+            SELECT_TIME_RANGE).fetchone()
+        if time_range[0] is None:
+            return 0
+        if date_from is None:
+            date_from = datetime.fromtimestamp(time_range[0]).strftime(FMT_ISO8601_DATE)
+        if date_to is None:
+            # 最終レコード以降 当日までは登録済みのレコードがないので集計済みとする
+            date_to = max(datetime.fromtimestamp(time_range[1]).strftime(FMT_ISO8601_DATE),
+                          datetime.now().strftime(FMT_ISO8601_DATE))
+    exclude_to_date: str = (
+        datetime.strptime(date_to, FMT_ISO8601_DATE) + timedelta(days=1)
+    ).strftime(FMT_ISO8601_DATE)
+
+    # 1トランザクションで削除して再集計する
+    with conn:
+        conn.execute(DELETE_DAILY_STAT, (date_from, exclude_to_date))
+        cur: sqlite3.Cursor = conn.execute(
+            BACKFILL_DAILY_STAT, (to_epoch(date_from), to_epoch(exclude_to_date))
+        )
+        day_count: int = cur.rowcount
+        conn.execute(UPDATE_DAILY_STAT_META, {"date_from": date_from, "date_to": date_to})
+    if logger is not None:
+        logger.info(f"backfill: {date_from} - {date_to}, days: {day_count}")
+    return day_count
+
+
+def backfill_daily_stat(conn: sqlite3.Connection,
+                        date_from: Optional[str] = None, date_to: Optional[str] = None,
+                        logger: Optional[logging.Logger] = None) -> int:
+    """
+    Rebuild t_weather_daily_stat from t_weather.
+    :param conn: Weather database connection
+    :param date_from: ISO8601 date from, None is first record date
+    :param date_to: ISO8601 date to (include), None is last record date or today
+    :param logger: application logger or None
+    :return: backfill day count (all devices)
+    """
+    _create_table_and_trigger(conn)
+    return _backfill(conn, date_from, date_to, logger=logger)
+
+
+def batch_main():
+    logging.basicConfig(format='%(levelname)s %(message)s')
+    app_logger: logging.Logger = logging.getLogger(__name__)
+    app_logger.setLevel(level=logging.INFO)
+
+    parser: argparse.ArgumentParser = argparse.ArgumentParser()
+    parser.add_argument("--db-path", type=str, required=True,
+                        help="SQLite3 Database path.")
+    parser.add_argument("--date-from", type=str,
+                        help="ISO8601 date from, default first record date.")
+    parser.add_argument("--date-to", type=str,
+                        help="ISO8601 date to, default last record date or today.")
+    args: argparse.Namespace = parser.parse_args()
+
+    db_path: str = os.path.expanduser(args.db_path)
+    if not os.path.exists(db_path):
+        app_logger.error(f"FileNotFound: {db_path}")
+        exit(1)
+
+    conn: sqlite3.Connection = sqlite3.connect(db_path)
+    try:
+        backfill_daily_stat(conn, args.date_from, args.date_to, logger=app_logger)
+    except sqlite3.Error as db_err:
+        app_logger.error(db_err)
+        exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    batch_main()
@@ -1,19 +1,31 @@
-import io
 import logging
 import os
 import signal
 import socket
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from log import logsetting
+from udp_stats import UdpStatsReporter, set_recv_buffer
+from weather_packet import WeatherPacket, decode_packet
+from sink.base import FanOutSink, WeatherRecord, WeatherSink
+from sink.csv_sink import CsvSink
 
 """
-UDP packet Monitor from ESP Weather sensors With export CSV
+UDP packet Monitor from ESP Weather sensors With export CSV, SQLite3, PostgreSQL
 [UDP port] 2222
 
 For ubuntu permit 2222/udp
 $ sudo firewall-cmd --add-port=2222/udp --permanent
 success
+
+[受信状況] UDP_STATS_INTERVAL 秒ごとにカーネルのドロップ数とデバイスごとの到着間隔をログに出力する
+ ※受信バッファサイズは WEATHER_UDP_RCVBUF で指定する
+[パケット形式] テキスト形式とバイナリ形式(固定長)のどちらも受信可能 ※weather_packet 参照
+ バイナリ形式のデバイスIDは WEATHER_DEVICE_NAMES ("ID=デバイス名" のカンマ区切り) でデバイス名に変換する
+[出力先] WEATHER_SINKS にカンマ区切りで指定した全ての出力先に同じレコードを出力する
+ csv: CSVファイル, sqlite: SQLite3データベース, postgresql: PostgreSQLデータベース (COPY)
+ binlog: バイナリ形式の追記ログ (sink.binlog_sink)
+ ※各出力先は SINK_BATCH_SIZE 件ごと、または SINK_FLUSH_INTERVAL 秒ごとにまとめて出力する
 """
 
 # args option default
@@ -21,8 +33,37 @@ success
 WEATHER_UDP_PORT: str = os.environ.get("WEATHER_UDP_PORT", "2222")
 CSV_OUTPUT_PATH: str =  os.environ.get("CSV_OUTPUT_PATH", "~/Documents/csv")
 CSV_FILE: str = "udp_weather.csv"
-CSV_HEADER: str = '"measurement_time","device_name","temp_out","temp_in","humid","pressure"\r\n'
-BUFF_SIZE: int = 1024
+# バイナリ形式の追記ログファイル
+BINLOG_FILE: str = "udp_weather.wlog"
+# 出力先 (カンマ区切り): csv,sqlite,postgresql,binlog
+WEATHER_SINKS: str = os.environ.get("WEATHER_SINKS", "csv")
+# 一括出力の件数と経過時間(秒)の上限
+SINK_BATCH_SIZE: str = os.environ.get("SINK_BATCH_SIZE", "50")
+SINK_FLUSH_INTERVAL: str = os.environ.get("SINK_FLUSH_INTERVAL", "5")
+# CSVファイルの書き込み間隔(秒) ※"0" ならレコード毎に書き込む
+CSV_FLUSH_INTERVAL: str = os.environ.get("CSV_FLUSH_INTERVAL", SINK_FLUSH_INTERVAL)
+# CSVファイルのローテーション: "daily" なら日付が変わったら切り替える
+CSV_ROTATE: str = os.environ.get("CSV_ROTATE", "")
+# CSVファイルのローテーションサイズ(バイト) ※"0" ならサイズで切り替えない
+CSV_MAX_BYTES: str = os.environ.get("CSV_MAX_BYTES", "0")
+# ローテーションしたCSVファイルを gzip 圧縮する ("1")
+CSV_COMPRESS: str = os.environ.get("CSV_COMPRESS", "0")
+# SQLite3データベースファイル
+SQLITE_DB_PATH: str = os.environ.get("SQLITE_DB_PATH", "~/db/weather.db")
+# PostgreSQL接続情報
+PG_CONF_FILE: str = os.environ.get(
+    "PG_CONF_FILE", os.path.join(os.environ.get("HOME", "/home/pi"), "bin/pigpio/conf/db_conn.json")
+)
+# 1パケットの最大受信サイズ
+BUFF_SIZE: int = int(os.environ.get("WEATHER_UDP_RECV_SIZE", "1024"))
+# カーネルの受信バッファサイズ ※"0" ならOSの既定値
+WEATHER_UDP_RCVBUF: str = os.environ.get("WEATHER_UDP_RCVBUF", "0")
+# 受信状況の出力間隔(秒)
+UDP_STATS_INTERVAL: str = os.environ.get("UDP_STATS_INTERVAL", "600")
+# デバイスごとの到着間隔の警告閾値(秒) ※ESPの送信間隔は約10分
+UDP_GAP_THRESHOLD: str = os.environ.get("UDP_GAP_THRESHOLD", "900")
+# バイナリ形式のパケットのデバイスIDとデバイス名 (例) "1=esp8266_1,2=esp8266_2"
+WEATHER_DEVICE_NAMES: str = os.environ.get("WEATHER_DEVICE_NAMES", "")
 isLogLevelDebug: bool = False
 
 
@@ -42,34 +83,104 @@ def detect_signal(signum, frame):
 
 
 def cleanup():
-    global csv_fp
-    if csv_fp is not None:
-        csv_fp.close()
+    global weather_sinks
+    if weather_sinks is not None:
+        # バッファのレコードを出力してから閉じる
+        weather_sinks.close()
+        weather_sinks = None
     udp_client.close()
 
 
-def loop(client: socket.socket, fp: io.TextIOWrapper):
+def create_sinks(sink_names: List[str]) -> List[WeatherSink]:
+    batch_size: int = int(SINK_BATCH_SIZE)
+    flush_interval: float = float(SINK_FLUSH_INTERVAL)
+    sinks: List[WeatherSink] = []
+    for sink_name in sink_names:
+        if sink_name == "csv":
+            output_filepath: str = os.path.join(os.path.expanduser(CSV_OUTPUT_PATH), CSV_FILE)
+            sinks.append(
+                CsvSink(output_filepath, batch_size, float(CSV_FLUSH_INTERVAL),
+                        rotate_daily=CSV_ROTATE == "daily", max_bytes=int(CSV_MAX_BYTES),
+                        compress=CSV_COMPRESS == "1", logger=logger)
+            )
+        elif sink_name == "sqlite":
+            from sink.sqlite_sink import SqliteSink
+
+            sinks.append(
+                SqliteSink(os.path.expanduser(SQLITE_DB_PATH), batch_size, flush_interval,
+                           logger=logger)
+            )
+        elif sink_name == "postgresql":
+            from sink.pg_sink import PgCopySink
+
+            sinks.append(
+                PgCopySink(os.path.expanduser(PG_CONF_FILE), batch_size, flush_interval,
+                           logger=logger)
+            )
+        elif sink_name == "binlog":
+            from sink.binlog_sink import BinLogSink
+
+            binlog_filepath: str = os.path.join(os.path.expanduser(CSV_OUTPUT_PATH), BINLOG_FILE)
+            sinks.append(BinLogSink(binlog_filepath, batch_size, flush_interval, logger=logger))
+        else:
+            raise ValueError(f"Unknown sink: {sink_name}")
+        logger.info(f"sink: {sink_name}")
+    return sinks
+
+
+def parse_device_names(device_names: str) -> Dict[int, str]:
+    result: Dict[int, str] = {}
+    for item in device_names.split(","):
+        if "=" in item:
+            did, name = item.split("=", 1)
+            result[int(did)] = name.strip()
+    return result
+
+
+def loop(client: socket.socket, sinks: FanOutSink, reporter: UdpStatsReporter):
+    device_names: Dict[int, str] = parse_device_names(WEATHER_DEVICE_NAMES)
     server_ip = ''
     data: bytes
     addr: str
+    # 受信がなくても受信状況の出力と一括出力を行うため短い方の間隔でタイムアウトさせる
+    client.settimeout(
+        max(min(reporter.stats_interval, float(SINK_FLUSH_INTERVAL), float(CSV_FLUSH_INTERVAL)), 1.)
+    )
     while True:
-        data, addr = client.recvfrom(BUFF_SIZE)
+        try:
+            data, addr = client.recvfrom(BUFF_SIZE)
+        except socket.timeout:
+            sinks.flush_if_due()
+            reporter.report_if_due()
+            continue
         if server_ip != addr:
             server_ip = addr
             logger.info(f"server ip: {server_ip}")
 
-        # from ESP output: device_name, temp_out, temp_in, humid, pressure
-        line: str = data.decode("utf-8")
-        record: List = line.split(",")
-        # Insert weather DB with local time
+        try:
+            packet: WeatherPacket = decode_packet(data)
+        except ValueError as err:
+            logger.warning(f"{addr}: {err}")
+            continue
+        reporter.record(packet.device_key, packet.seq)
         if isLogLevelDebug:
-            logger.debug(line)
-        # 到着時刻
-        now_timestamp: datetime = datetime.now()
-        s_timestamp: str = now_timestamp.strftime("%Y-%m-%d %H:%M:%S")
-        line: str = f'"{s_timestamp}","{record[0]}",{record[1]},{record[2]},{record[3]},{record[4]}\r\n'
-        fp.write(line)
-        fp.flush()
+            logger.debug(packet)
+        device_name: str
+        if packet.device_name is not None:
+            device_name = packet.device_name
+        else:
+            device_name = device_names.get(packet.device_id, f"device_{packet.device_id}")
+        # 到着時刻 ※秒未満は切り捨てる
+        now_timestamp: datetime = datetime.now().replace(microsecond=0)
+        sinks.write(
+            WeatherRecord(
+                measurement_time=now_timestamp, device_name=device_name,
+                temp_out=packet.temp_out, temp_in=packet.temp_in,
+                humid=packet.humid, pressure=packet.pressure
+            )
+        )
+        reporter.report_if_due()
+
 
 if __name__ == '__main__':
     logger: logging.Logger = logsetting.create_logger("service_weather")
@@ -84,29 +195,20 @@ if __name__ == '__main__':
     logger.info(f"{hostname}: {broad_address}")
     # UDP client
     udp_client: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    set_recv_buffer(udp_client, int(WEATHER_UDP_RCVBUF), logger=logger)
     udp_client.bind(broad_address)
+    udp_reporter: UdpStatsReporter = UdpStatsReporter(
+        int(WEATHER_UDP_PORT), float(UDP_STATS_INTERVAL), float(UDP_GAP_THRESHOLD), logger
+    )
 
-    # 出力先ディレクトリが存在しなければ作成する
-    output_full_path: str = os.path.expanduser(CSV_OUTPUT_PATH)
-    if not os.path.exists(output_full_path):
-        os.makedirs(output_full_path)
-    output_filepath: str = os.path.join(output_full_path, CSV_FILE)
-    # CSVファイル TextIOオブジェクト定義
-    csv_fp: Optional[io.TextIOWrapper] = None
+    weather_sinks: Optional[FanOutSink] = None
     try:
-        if os.path.exists(output_filepath):
-            # 新規なら追記モード
-            csv_fp = open(output_filepath, 'a', encoding="utf-8")
-        else:
-            # 既存ファイルなら新規゜書き込みモード
-            csv_fp = open(output_filepath, 'w', encoding="utf-8")
-            # ヘッダー追記
-            csv_fp.write(CSV_HEADER)
-            csv_fp.flush()
-
+        weather_sinks = FanOutSink(
+            create_sinks([name.strip() for name in WEATHER_SINKS.split(",") if name.strip()]),
+            logger=logger
+        )
         # UDPモニターループ
-        logger.info(f"type(csv_fp): {type(csv_fp)}")
-        loop(udp_client, csv_fp)
+        loop(udp_client, weather_sinks, udp_reporter)
     except KeyboardInterrupt:
         logger.info("KeyboardInterrupted!")
     finally:
@@ -0,0 +1,122 @@
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+"""
+気象センサーレコードの出力先(シンク)の基底クラス
+ write() で受け取ったレコードをバッファリングし、件数または経過時間の上限で flush() する
+ ※出力に失敗したレコードは保持して flush_interval 秒後に再試行する
+"""
+
+# 出力失敗時に保持する出力待ちレコードの上限 ※超えた場合は古いレコードから破棄する
+PENDING_LIMIT: int = 10000
+
+
+@dataclass(frozen=True)
+class WeatherRecord:
+    # 到着時刻 (ローカル時刻)
+    measurement_time: datetime
+    device_name: str
+    temp_out: Optional[float]
+    temp_in: Optional[float]
+    humid: Optional[float]
+    pressure: Optional[float]
+
+
+class WeatherSink(object):
+    def __init__(self, name: str, batch_size: int, flush_interval: float,
+                 logger: Optional[logging.Logger] = None):
+        self.name: str = name
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self.logger = logger
+        self.pending: List[WeatherRecord] = []
+        # 出力待ちの先頭レコードの追加時刻 (time.monotonic)
+        self.pending_since: float = 0.
+
+    def write(self, rec: WeatherRecord) -> None:
+        if len(self.pending) == 0:
+            self.pending_since = time.monotonic()
+        self.pending.append(rec)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self) -> None:
+        if len(self.pending) > 0 and \
+                time.monotonic() - self.pending_since >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if len(self.pending) == 0:
+            return
+
+        recs: List[WeatherRecord] = list(self.pending)
+        try:
+            self.write_records(recs)
+        except Exception:
+            # 出力できなかったレコードは保持して flush_interval 秒後に再試行する
+            self.pending_since = time.monotonic()
+            if len(self.pending) > PENDING_LIMIT:
+                discard: int = len(self.pending) - PENDING_LIMIT
+                self._warning(f"pending over {PENDING_LIMIT}, discard: {discard}")
+                del self.pending[:discard]
+            raise
+
+        # 出力後に出力待ちから取り除く
+        del self.pending[:len(recs)]
+
+    def write_records(self, recs: List[WeatherRecord]) -> None:
+        # サブクラスで実装する
+        raise NotImplementedError
+
+    def _warning(self, warning: str) -> None:
+        if self.logger is not None:
+            self.logger.warning(f"[{self.name}] {warning}")
+
+    def close(self) -> None:
+        # 出力できなかった場合もサブクラスのリソースは閉じる
+        try:
+            self.flush()
+        except Exception as err:
+            self._warning(f"flush: {err}")
+        if len(self.pending) > 0:
+            self._warning(f"not written: {len(self.pending)}")
+
+
+class FanOutSink(object):
+    """
+    同じレコードを複数のシンクに出力する
+    ※1つのシンクでエラーが発生しても他のシンクへの出力は継続する
+    """
+    def __init__(self, sinks: List[WeatherSink], logger: Optional[logging.Logger] = None):
+        self.sinks: List[WeatherSink] = sinks
+        self.logger = logger
+
+    def write(self, rec: WeatherRecord) -> None:
+        for sink in self.sinks:
+            try:
+                sink.write(rec)
+            except Exception as err:
+                self._error(sink, err)
+
+    def flush_if_due(self) -> None:
+        for sink in self.sinks:
+            try:
+                sink.flush_if_due()
+            except Exception as err:
+                self._error(sink, err)
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as err:
+                self._error(sink, err)
+
+    def _error(self, sink: WeatherSink, err: Exception) -> None:
+        if self.logger is not None:
+            self.logger.error(f"[{sink.name}] {err}")
@@ -0,0 +1,141 @@
+import logging
+import math
+import os
+import struct
+import time
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from .base import WeatherRecord, WeatherSink
+
+"""
+バイナリ形式の追記ログ出力シンク
+[ファイル形式] リトルエンディアン
+ ヘッダー: b"WLOG" version(B)
+ デバイス定義: b"D" index(H) 名前のバイト数(B) デバイス名(UTF-8) ※ファイル内で初出のデバイスのみ
+ 測定レコード: b"W" measurement_time(I) index(H) temp_out(f) temp_in(f) humid(f) pressure(f)
+  ※measurement_time はローカル時刻のunixエポック秒, 欠測値は NaN
+ 1レコード23バイト固定のためCSV(約55バイト)より小さく、読み込み時の文字列変換も不要
+"""
+
+FILE_MAGIC: bytes = b"WLOG"
+FILE_VERSION: int = 1
+HEADER_STRUCT: struct.Struct = struct.Struct("<4sB")
+DEVICE_STRUCT: struct.Struct = struct.Struct("<cHB")
+RECORD_STRUCT: struct.Struct = struct.Struct("<cIH4f")
+TYPE_DEVICE: bytes = b"D"
+TYPE_RECORD: bytes = b"W"
+
+
+def _none_to_nan(value: Optional[float]) -> float:
+    return math.nan if value is None else value
+
+
+def _nan_to_none(value: float) -> Optional[float]:
+    # 単精度浮動小数点数の有効桁数(7桁)に丸める
+    return None if math.isnan(value) else float(f"{value:.7g}")
+
+
+def _scan(fp: BinaryIO,
+          devices: Dict[int, str]) -> Iterator[Tuple[Optional[WeatherRecord], int]]:
+    # ヘッダーの次から読み込み、デバイス定義は devices に追加する
+    # 戻り値: (測定レコード ※デバイス定義なら None, 読み込み済みの終端位置)
+    while True:
+        type_byte: bytes = fp.read(1)
+        if type_byte == TYPE_DEVICE:
+            head: bytes = type_byte + fp.read(DEVICE_STRUCT.size - 1)
+            if len(head) < DEVICE_STRUCT.size:
+                return
+            _, index, name_len = DEVICE_STRUCT.unpack(head)
+            name: bytes = fp.read(name_len)
+            if len(name) < name_len:
+                return
+            devices[index] = name.decode("utf-8")
+            yield None, fp.tell()
+        elif type_byte == TYPE_RECORD:
+            body: bytes = type_byte + fp.read(RECORD_STRUCT.size - 1)
+            if len(body) < RECORD_STRUCT.size:
+                return
+            _, epoch, index, temp_out, temp_in, humid, pressure = RECORD_STRUCT.unpack(body)
+            yield WeatherRecord(
+                measurement_time=datetime.fromtimestamp(epoch),
+                device_name=devices[index],
+                temp_out=_nan_to_none(temp_out), temp_in=_nan_to_none(temp_in),
+                humid=_nan_to_none(humid), pressure=_nan_to_none(pressure)
+            ), fp.tell()
+        else:
+            # ファイル終端 または 書き込み途中で停止した不完全なレコード
+            return
+
+
+def read_binlog(file_path: str) -> Iterator[WeatherRecord]:
+    """
+    Read all records of binary append log.
+    :param file_path: binary log file path
+    :return: WeatherRecord iterator
+    """
+    with open(file_path, 'rb') as fp:
+        magic, version = HEADER_STRUCT.unpack(fp.read(HEADER_STRUCT.size))
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            raise ValueError(f"Invalid binary log: {file_path}")
+        for rec, _ in _scan(fp, {}):
+            if rec is not None:
+                yield rec
+
+
+class BinLogSink(WeatherSink):
+    def __init__(self, file_path: str, batch_size: int, flush_interval: float,
+                 logger: Optional[logging.Logger] = None):
+        super().__init__("binlog", batch_size, flush_interval, logger=logger)
+        self.file_path: str = file_path
+        # デバイス名とファイル内のインデックス
+        self.device_index: Dict[str, int] = {}
+        self.fp: BinaryIO = self.open_file(file_path)
+
+    def open_file(self, file_path: str) -> BinaryIO:
+        dir_path: str = os.path.dirname(file_path)
+        if dir_path and not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+        if not os.path.exists(file_path):
+            fp: BinaryIO = open(file_path, 'wb')
+            fp.write(HEADER_STRUCT.pack(FILE_MAGIC, FILE_VERSION))
+            fp.flush()
+            return fp
+
+        # 既存ファイル: デバイス定義を読み込み、不完全な末尾のレコードは切り捨てる
+        fp = open(file_path, 'r+b')
+        magic, version = HEADER_STRUCT.unpack(fp.read(HEADER_STRUCT.size))
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            fp.close()
+            raise ValueError(f"Invalid binary log: {file_path}")
+        devices: Dict[int, str] = {}
+        valid_end: int = fp.tell()
+        for _, valid_end in _scan(fp, devices):
+            pass
+        fp.truncate(valid_end)
+        fp.seek(valid_end)
+        self.device_index = {name: index for index, name in devices.items()}
+        return fp
+
+    def write_records(self, recs: List[WeatherRecord]) -> None:
+        chunks: List[bytes] = []
+        for rec in recs:
+            index: Optional[int] = self.device_index.get(rec.device_name)
+            if index is None:
+                # 初出のデバイスは定義を追加する
+                index = len(self.device_index)
+                self.device_index[rec.device_name] = index
+                name: bytes = rec.device_name.encode("utf-8")
+                chunks.append(DEVICE_STRUCT.pack(TYPE_DEVICE, index, len(name)) + name)
+            epoch: int = int(time.mktime(rec.measurement_time.timetuple()))
+            chunks.append(RECORD_STRUCT.pack(
+                TYPE_RECORD, epoch, index,
+                _none_to_nan(rec.temp_out), _none_to_nan(rec.temp_in),
+                _none_to_nan(rec.humid), _none_to_nan(rec.pressure)
+            ))
+        self.fp.write(b"".join(chunks))
+        self.fp.flush()
+
+    def close(self) -> None:
+        super().close()
+        self.fp.close()
@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+"""
+CSVファイルのセグメント(ローテーション済みファイル)管理
+ マニフェストファイル (JSON) にセグメントごとの測定時刻の範囲と行数を保存する
+ ※期間を指定して読み込む場合は select_segments() で該当するファイルのみを取得する
+[マニフェスト]
+ {"segments": [{"file": "udp_weather_20240101000005.csv.gz",
+                "from": "2024-01-01 00:00:05", "to": "2024-01-01 23:59:02", "rows": 1440}, ...]}
+"""
+
+F_DATETIME: str = "%Y-%m-%d %H:%M:%S"
+MANIFEST_SUFFIX: str = "_manifest.json"
+
+# マニフェストの読み込みと更新はローテーションと圧縮スレッドから行われる
+_manifest_lock: threading.Lock = threading.Lock()
+
+
+def manifest_path(csv_path: str) -> str:
+    base, _ = os.path.splitext(csv_path)
+    return f"{base}{MANIFEST_SUFFIX}"
+
+
+def load_manifest(csv_path: str) -> List[Dict[str, Any]]:
+    path: str = manifest_path(csv_path)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as fp:
+        return json.load(fp)["segments"]
+
+
+def _save_manifest(csv_path: str, segments: List[Dict[str, Any]]) -> None:
+    path: str = manifest_path(csv_path)
+    # 書き込み途中で停止しても壊れないように一時ファイルから置き換える
+    tmp_path: str = f"{path}.tmp"
+    with open(tmp_path, 'w') as fp:
+        json.dump({"segments": segments}, fp, indent=1)
+    os.replace(tmp_path, path)
+
+
+def add_segment(csv_path: str, file_name: str,
+                from_time: datetime, to_time: datetime, rows: int) -> None:
+    with _manifest_lock:
+        segments: List[Dict[str, Any]] = load_manifest(csv_path)
+        segments.append({
+            "file": file_name,
+            "from": from_time.strftime(F_DATETIME),
+            "to": to_time.strftime(F_DATETIME),
+            "rows": rows
+        })
+        _save_manifest(csv_path, segments)
+
+
+def rename_segment(csv_path: str, old_name: str, new_name: str) -> None:
+    with _manifest_lock:
+        segments: List[Dict[str, Any]] = load_manifest(csv_path)
+        for segment in segments:
+            if segment["file"] == old_name:
+                segment["file"] = new_name
+        _save_manifest(csv_path, segments)
+
+
+def read_time_range(csv_path: str) -> Tuple[Optional[datetime], Optional[datetime], int]:
+    """
+    Read first and last measurement_time of active csv file.
+    :param csv_path: csv file path
+    :return: (first time, last time, rows) ※データ行がなければ (None, None, 0)
+    """
+    with open(csv_path, 'rb') as fp:
+        # ヘッダーと先頭のデータ行
+        fp.readline()
+        first_line: bytes = fp.readline()
+        if len(first_line) == 0:
+            return None, None, 0
+
+        # 行数はファイル全体の改行数から求める ※ヘッダーを除く
+        fp.seek(0)
+        rows: int = sum(chunk.count(b"\n") for chunk in iter(lambda: fp.read(65536), b"")) - 1
+        # 最終行はファイル末尾から読み込む
+        size: int = fp.seek(0, os.SEEK_END)
+        fp.seek(max(size - 1024, 0))
+        last_line: bytes = fp.read().rstrip(b"\r\n").rsplit(b"\n", 1)[-1]
+
+    def line_time(line: bytes) -> datetime:
+        # "measurement_time","device_name",...
+        return datetime.strptime(line.decode("utf-8").split(",")[0].strip('"'), F_DATETIME)
+
+    return line_time(first_line), line_time(last_line), rows
+
+
+def select_segments(csv_path: str, from_time: datetime, to_time: datetime) -> List[str]:
+    """
+    Select segment files overlapping [from_time, to_time] and active csv file.
+    :param csv_path: active csv file path
+    :param from_time: from measurement_time
+    :param to_time: to measurement_time
+    :return: file path list (oldest first)
+    """
+    csv_dir: str = os.path.dirname(csv_path)
+    s_from: str = from_time.strftime(F_DATETIME)
+    s_to: str = to_time.strftime(F_DATETIME)
+    result: List[str] = [
+        os.path.join(csv_dir, segment["file"]) for segment in load_manifest(csv_path)
+        if segment["from"] <= s_to and segment["to"] >= s_from
+    ]
+    # 出力中のファイルはマニフェストに含まれないので範囲を確認する
+    if os.path.exists(csv_path):
+        first, last, _ = read_time_range(csv_path)
+        if first is not None and first <= to_time and last >= from_time:
+            result.append(csv_path)
+    return result
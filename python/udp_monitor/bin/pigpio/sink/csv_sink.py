@@ -0,0 +1,138 @@
+import gzip
+import io
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime
+from typing import List, Optional
+
+from .base import WeatherRecord, WeatherSink
+from .csv_segments import add_segment, read_time_range, rename_segment
+
+"""
+CSVファイル出力シンク
+ flush_interval 秒ごと(または batch_size 件ごと)にまとめて書き込む
+ ※flush_interval=0 ならレコード毎に書き込む
+[ローテーション]
+ rotate_daily: 日付が変わったら, max_bytes: ファイルサイズが上限を超えたら
+ 出力中のファイルを "{ファイル名}_{先頭の測定時刻}.csv" に変更して新しいファイルに出力する
+ ※compress=True ならローテーションしたファイルをバックグラウンドで gzip 圧縮する
+ ローテーションしたファイルの測定時刻の範囲はマニフェストファイルに記録する (csv_segments)
+"""
+
+CSV_HEADER: str = '"measurement_time","device_name","temp_out","temp_in","humid","pressure"\r\n'
+
+
+def format_value(value: Optional[float]) -> str:
+    return "" if value is None else str(value)
+
+
+def to_csv_line(rec: WeatherRecord) -> str:
+    s_timestamp: str = rec.measurement_time.strftime("%Y-%m-%d %H:%M:%S")
+    return (f'"{s_timestamp}","{rec.device_name}",{format_value(rec.temp_out)}'
+            f',{format_value(rec.temp_in)},{format_value(rec.humid)}'
+            f',{format_value(rec.pressure)}\r\n')
+
+
+class CsvSink(WeatherSink):
+    def __init__(self, file_path: str, batch_size: int, flush_interval: float,
+                 rotate_daily: bool = False, max_bytes: int = 0, compress: bool = False,
+                 logger: Optional[logging.Logger] = None):
+        super().__init__("csv", batch_size, flush_interval, logger=logger)
+        self.file_path: str = file_path
+        self.rotate_daily: bool = rotate_daily
+        self.max_bytes: int = max_bytes
+        self.compress: bool = compress
+        # 圧縮中のスレッド
+        self.compress_threads: List[threading.Thread] = []
+        # 出力中のファイルの測定時刻の範囲と行数
+        self.first_time: Optional[datetime] = None
+        self.last_time: Optional[datetime] = None
+        self.rows: int = 0
+        if (rotate_daily or max_bytes > 0) and os.path.exists(file_path):
+            self.first_time, self.last_time, self.rows = read_time_range(file_path)
+        self.fp: io.TextIOWrapper = self.open_file(file_path)
+
+    @staticmethod
+    def open_file(file_path: str) -> io.TextIOWrapper:
+        # 出力先ディレクトリが存在しなければ作成する
+        dir_path: str = os.path.dirname(file_path)
+        if dir_path and not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+        if os.path.exists(file_path):
+            # 既存ファイルなら追記モード
+            return open(file_path, 'a', encoding="utf-8")
+
+        # 新規なら書き込みモードでヘッダーを出力
+        fp: io.TextIOWrapper = open(file_path, 'w', encoding="utf-8")
+        fp.write(CSV_HEADER)
+        fp.flush()
+        return fp
+
+    def need_rotate(self, rec: WeatherRecord) -> bool:
+        if self.first_time is None:
+            return False
+        if self.rotate_daily and rec.measurement_time.date() != self.first_time.date():
+            return True
+        return 0 < self.max_bytes <= self.fp.tell()
+
+    def write_records(self, recs: List[WeatherRecord]) -> None:
+        lines: List[str] = []
+        for rec in recs:
+            if self.need_rotate(rec):
+                # ローテーション前のレコードを書き込んでから切り替える
+                self.fp.write("".join(lines))
+                lines = []
+                self.rotate()
+            lines.append(to_csv_line(rec))
+            if self.first_time is None:
+                self.first_time = rec.measurement_time
+            self.last_time = rec.measurement_time
+            self.rows += 1
+        self.fp.write("".join(lines))
+        self.fp.flush()
+
+    def rotate(self) -> None:
+        self.fp.close()
+        base, ext = os.path.splitext(self.file_path)
+        segment_name: str = f"{base}_{self.first_time.strftime('%Y%m%d%H%M%S')}"
+        segment_path: str = f"{segment_name}{ext}"
+        # サイズでローテーションした場合は先頭の測定時刻が重複することがある
+        seq: int = 0
+        while os.path.exists(segment_path) or os.path.exists(f"{segment_path}.gz"):
+            seq += 1
+            segment_path = f"{segment_name}_{seq}{ext}"
+        os.rename(self.file_path, segment_path)
+        add_segment(self.file_path, os.path.basename(segment_path),
+                    self.first_time, self.last_time, self.rows)
+        if self.logger is not None:
+            self.logger.info(f"[{self.name}] Rotated: {segment_path}, rows: {self.rows}")
+        self.first_time, self.last_time, self.rows = None, None, 0
+        self.fp = self.open_file(self.file_path)
+        if self.compress:
+            thread: threading.Thread = threading.Thread(
+                target=self.compress_segment, args=(segment_path,), name="csv_compress"
+            )
+            thread.start()
+            self.compress_threads = [t for t in self.compress_threads if t.is_alive()]
+            self.compress_threads.append(thread)
+
+    def compress_segment(self, segment_path: str) -> None:
+        gz_path: str = f"{segment_path}.gz"
+        try:
+            with open(segment_path, 'rb') as f_in, gzip.open(gz_path, 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            rename_segment(self.file_path, os.path.basename(segment_path),
+                           os.path.basename(gz_path))
+            os.remove(segment_path)
+        except OSError as err:
+            if self.logger is not None:
+                self.logger.warning(f"[{self.name}] compress {segment_path}: {err}")
+
+    def close(self) -> None:
+        super().close()
+        self.fp.close()
+        # 圧縮中のファイルがあれば完了を待つ
+        for thread in self.compress_threads:
+            thread.join()
@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+import logging
+import socket
+import time
+from typing import Any, List, Optional
+
+from .base import WeatherRecord, WeatherSink
+
+"""
+PostgreSQLデータベース出力シンク
+ [スキーマ] weather [テーブル] t_device, t_weather
+ バッファのレコードを COPY FROM STDIN で一時テーブルに転送し、INSERT ... SELECT で登録する
+ ※psycopg2 は PostgreSQLに出力する場合のみ必要
+ ※接続は出力時に行う (起動時にサーバーが停止していても他のシンクは動作を継続する)
+ ※UDP受信と同じスレッドで接続するため、接続タイムアウトを短くし接続失敗後は一定時間再接続しない
+"""
+
+# 接続タイムアウト(秒) ※設定ファイルに connect_timeout があればその値
+CONNECT_TIMEOUT: int = 3
+# 接続失敗後に再接続しない時間(秒)
+RECONNECT_INTERVAL: float = 60.
+
+CREATE_TMP_WEATHER: str = """
+CREATE TEMP TABLE IF NOT EXISTS tmp_weather(
+   device_name VARCHAR(20) NOT NULL,
+   measurement_time timestamp NOT NULL,
+   temp_out REAL,
+   temp_in REAL,
+   humid REAL,
+   pressure REAL
+) ON COMMIT DROP"""
+COPY_TMP_WEATHER: str = """
+COPY tmp_weather(device_name, measurement_time, temp_out, temp_in, humid, pressure)
+ FROM STDIN WITH (FORMAT csv)"""
+# 未登録のデバイスと登録済みの測定時刻は無視する
+INSERT_WEATHER: str = """
+INSERT INTO weather.t_weather(did, measurement_time, temp_out, temp_in, humid, pressure)
+ SELECT
+   dev.id, tmp.measurement_time, tmp.temp_out, tmp.temp_in, tmp.humid, tmp.pressure
+ FROM
+   tmp_weather tmp
+   INNER JOIN weather.t_device dev ON dev.name = tmp.device_name
+ ON CONFLICT DO NOTHING"""
+
+
+def format_value(value: Optional[float]) -> str:
+    # COPY の CSV形式では空文字は NULL
+    return "" if value is None else str(value)
+
+
+class PgCopySink(WeatherSink):
+    def __init__(self, conf_file: str, batch_size: int, flush_interval: float,
+                 logger: Optional[logging.Logger] = None):
+        super().__init__("postgresql", batch_size, flush_interval, logger=logger)
+        import psycopg2
+
+        self.connect = psycopg2.connect
+        with open(conf_file, 'r') as fp:
+            self.db_conf = json.load(fp)
+            self.db_conf["host"] = self.db_conf["host"].format(hostname=socket.gethostname())
+        self.db_conf.setdefault("connect_timeout", CONNECT_TIMEOUT)
+        self.conn: Optional[Any] = None
+        # 直近の接続失敗時刻 (time.monotonic)
+        self.connect_failed_at: Optional[float] = None
+        try:
+            self.reconnect()
+        except Exception as err:
+            # 接続エラーはログに出力し、RECONNECT_INTERVAL 秒後の出力時に再接続する
+            self._warning(f"connect: {err}")
+
+    def reconnect(self) -> None:
+        if self.connect_failed_at is not None and \
+                time.monotonic() - self.connect_failed_at < RECONNECT_INTERVAL:
+            raise ConnectionError(f"reconnect waiting ({RECONNECT_INTERVAL} sec)")
+        try:
+            self.conn = self.connect(**self.db_conf)
+        except Exception:
+            self.connect_failed_at = time.monotonic()
+            raise
+        self.connect_failed_at = None
+
+    def write_records(self, recs: List[WeatherRecord]) -> None:
+        if self.conn is None or self.conn.closed:
+            # 起動時の接続エラー、またはサーバー再起動などで切断された場合は再接続する
+            self.reconnect()
+        buf: io.StringIO = io.StringIO()
+        # デバイス名にカンマなどが含まれる場合もCSV形式で引用符付きで出力する
+        writer = csv.writer(buf, lineterminator="\n")
+        for rec in recs:
+            writer.writerow((
+                rec.device_name, rec.measurement_time.isoformat(sep=" "),
+                format_value(rec.temp_out), format_value(rec.temp_in),
+                format_value(rec.humid), format_value(rec.pressure)
+            ))
+        buf.seek(0)
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(CREATE_TMP_WEATHER)
+                cur.copy_expert(COPY_TMP_WEATHER, buf)
+                cur.execute(INSERT_WEATHER)
+                inserted: int = cur.rowcount
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        if inserted < len(recs):
+            self._warning(f"inserted: {inserted}/{len(recs)}")
+
+    def close(self) -> None:
+        super().close()
+        if self.conn is not None:
+            self.conn.close()
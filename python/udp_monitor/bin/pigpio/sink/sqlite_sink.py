@@ -0,0 +1,69 @@
+import logging
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+from weather_daily_stat import create_daily_stat
+from .base import WeatherRecord, WeatherSink
+
+"""
+SQLite3データベース出力シンク
+ 測定時刻(measurement_time): INTEGER (ローカル時刻のunixエポック秒)
+ ※ batch_size 件ごと(または flush_interval 秒ごと)に1トランザクションで登録する
+ 外気温の日ごとの統計情報 (t_weather_daily_stat) は t_weather の登録トリガーで更新する
+"""
+
+SELECT_DEVICES: str = "SELECT id, name FROM t_device"
+INSERT_WEATHER: str = """
+INSERT INTO t_weather(did, measurement_time, temp_out, temp_in, humid, pressure)
+ VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+class SqliteSink(WeatherSink):
+    def __init__(self, db_file_path: str, batch_size: int, flush_interval: float,
+                 logger: Optional[logging.Logger] = None):
+        super().__init__("sqlite", batch_size, flush_interval, logger=logger)
+        self.conn: sqlite3.Connection = sqlite3.connect(db_file_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        create_daily_stat(self.conn, logger=logger)
+        self.devices: Dict[str, int] = {}
+        self.load_devices()
+
+    def load_devices(self) -> None:
+        cur: sqlite3.Cursor = self.conn.execute(SELECT_DEVICES)
+        self.devices = {name: did for (did, name) in cur.fetchall()}
+
+    def to_row(self, rec: WeatherRecord
+               ) -> Optional[Tuple[int, int, Optional[float], Optional[float],
+                                   Optional[float], Optional[float]]]:
+        did: Optional[int] = self.devices.get(rec.device_name)
+        if did is None:
+            # 起動後に追加されたデバイスの場合があるので再読み込みする
+            self.load_devices()
+            did = self.devices.get(rec.device_name)
+            if did is None:
+                if self.logger is not None:
+                    self.logger.warning(f"[{self.name}] {rec.device_name} not found!")
+                return None
+
+        epoch: int = int(time.mktime(rec.measurement_time.timetuple()))
+        return did, epoch, rec.temp_out, rec.temp_in, rec.humid, rec.pressure
+
+    def write_records(self, recs: List[WeatherRecord]) -> None:
+        with self.conn:
+            for rec in recs:
+                row = self.to_row(rec)
+                if row is None:
+                    continue
+                try:
+                    self.conn.execute(INSERT_WEATHER, row)
+                except sqlite3.IntegrityError as err:
+                    # 重複レコードはスキップする
+                    if self.logger is not None:
+                        self.logger.warning(f"[{self.name}] {row}: {err}")
+
+    def close(self) -> None:
+        super().close()
+        self.conn.close()
@@ -0,0 +1,138 @@
+import logging
+import socket
+import time
+from typing import Dict, List, Optional, Tuple
+
+"""
+UDP受信の取りこぼし確認用ユーティリティ
+ (1) カーネルの受信バッファサイズ (SO_RCVBUF) の設定
+ (2) /proc/net/udp から受信ポートの受信キュー滞留バイト数とドロップ数を取得
+ (3) デバイスごとの到着間隔 (パケットにシーケンス番号があれば番号の欠番) を集計
+   ※シーケンス番号の取得は weather_packet.decode_packet
+ ※集計結果は一定間隔でロガーに出力する
+"""
+
+PROC_NET_UDP: str = "/proc/net/udp"
+
+
+def set_recv_buffer(sock: socket.socket, size: int,
+                    logger: Optional[logging.Logger] = None) -> int:
+    """
+    Set socket receive buffer size.
+    :param sock: UDP socket
+    :param size: request buffer size (bytes), 0 is system default
+    :param logger: application logger or None
+    :return: actual buffer size
+    """
+    if size > 0:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+    # Linuxでは管理領域分として要求値の2倍が設定され、上限は net.core.rmem_max で制限される
+    actual: int = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    if logger is not None:
+        logger.info(f"SO_RCVBUF: {actual} (request: {size})")
+        if actual < size:
+            logger.warning("SO_RCVBUF is limited, check net.core.rmem_max.")
+    return actual
+
+
+def read_udp_drops(port: int, proc_file: str = PROC_NET_UDP) -> Optional[Tuple[int, int]]:
+    """
+    Read rx_queue and drops of UDP port from /proc/net/udp.
+    :param port: local port
+    :param proc_file: /proc/net/udp
+    :return: (rx_queue bytes, drops) or if not Linux or port not found, None
+    """
+    try:
+        with open(proc_file, 'r') as fp:
+            lines: List[str] = fp.readlines()
+    except OSError:
+        return None
+
+    # sl local_address rem_address st tx_queue:rx_queue ... drops
+    hex_port: str = f":{port:04X}"
+    found: bool = False
+    rx_queue: int = 0
+    drops: int = 0
+    for line in lines[1:]:
+        fields: List[str] = line.split()
+        if len(fields) < 13 or not fields[1].endswith(hex_port):
+            continue
+        found = True
+        rx_queue += int(fields[4].split(":")[1], 16)
+        drops += int(fields[-1])
+    return (rx_queue, drops) if found else None
+
+
+class DeviceArrival(object):
+    def __init__(self, arrival: float, seq: Optional[int]):
+        self.count: int = 1
+        self.last_arrival: float = arrival
+        self.last_seq: Optional[int] = seq
+        self.max_interval: float = 0.
+        # 到着間隔が閾値を超えた回数
+        self.gaps: int = 0
+        # シーケンス番号の欠番数
+        self.missed: int = 0
+
+
+class UdpStatsReporter(object):
+    """
+    UDP packet loss metrics reporter.
+    record() はパケット受信ごとに、report_if_due() は受信ループ内で呼び出す
+    """
+    def __init__(self, port: int, stats_interval: float, gap_threshold: float,
+                 logger: logging.Logger):
+        self.port: int = port
+        self.stats_interval: float = stats_interval
+        self.gap_threshold: float = gap_threshold
+        self.logger: logging.Logger = logger
+        self.devices: Dict[str, DeviceArrival] = {}
+        self.received: int = 0
+        self.last_report: float = time.monotonic()
+        # 起動時のドロップ数との差分を出力する
+        base: Optional[Tuple[int, int]] = read_udp_drops(port)
+        self.base_drops: int = base[1] if base is not None else 0
+        self.last_drops: int = self.base_drops
+
+    def record(self, device_name: str, seq: Optional[int] = None) -> None:
+        self.received += 1
+        now: float = time.monotonic()
+        dev: Optional[DeviceArrival] = self.devices.get(device_name)
+        if dev is None:
+            self.devices[device_name] = DeviceArrival(now, seq)
+            return
+
+        dev.count += 1
+        interval: float = now - dev.last_arrival
+        dev.last_arrival = now
+        dev.max_interval = max(dev.max_interval, interval)
+        if interval > self.gap_threshold:
+            dev.gaps += 1
+            self.logger.warning(f"{device_name}: arrival gap {interval:.1f} sec")
+        if seq is not None and dev.last_seq is not None and seq > dev.last_seq + 1:
+            dev.missed += seq - dev.last_seq - 1
+        if seq is not None:
+            dev.last_seq = seq
+
+    def report_if_due(self) -> None:
+        if time.monotonic() - self.last_report >= self.stats_interval:
+            self.report()
+
+    def report(self) -> None:
+        self.last_report = time.monotonic()
+        udp_drops: Optional[Tuple[int, int]] = read_udp_drops(self.port)
+        if udp_drops is not None:
+            rx_queue, drops = udp_drops
+            self.logger.info(
+                f"received: {self.received}, kernel drops: {drops - self.base_drops}"
+                f" (+{drops - self.last_drops}), rx_queue: {rx_queue} bytes"
+            )
+            self.last_drops = drops
+        else:
+            self.logger.info(f"received: {self.received}")
+        for name, dev in self.devices.items():
+            self.logger.info(
+                f"{name}: count: {dev.count}, gaps: {dev.gaps}, missed: {dev.missed}"
+                f", max interval: {dev.max_interval:.1f} sec"
+            )
+
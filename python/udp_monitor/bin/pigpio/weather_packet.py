@@ -0,0 +1,97 @@
+import math
+import struct
+from dataclasses import dataclass
+from typing import List, Optional
+
+"""
+ESP気象センサーのUDPパケットのデコード
+ (1) テキスト形式: "device_name,temp_out,temp_in,humid,pressure[,seq]"
+ (2) バイナリ形式: 先頭バイトがマジックナンバーの固定長 (20バイト, リトルエンディアン)
+   magic(B) version(B) device_id(H) temp_out(f) temp_in(f) humid(f) pressure(f)
+   ※欠測値は NaN, device_id は t_device.id
+ マジックナンバー(0xA5)はUTF-8の先頭バイトにならないためテキスト形式と区別できる
+"""
+
+PACKET_MAGIC: int = 0xA5
+PACKET_VERSION: int = 1
+PACKET_STRUCT: struct.Struct = struct.Struct("<BBH4f")
+
+
+@dataclass(frozen=True)
+class WeatherPacket:
+    # テキスト形式ならデバイス名, バイナリ形式ならデバイスID
+    device_name: Optional[str]
+    device_id: Optional[int]
+    temp_out: Optional[float]
+    temp_in: Optional[float]
+    humid: Optional[float]
+    pressure: Optional[float]
+    # シーケンス番号 (テキスト形式の6列目) ※なければ None
+    seq: Optional[int] = None
+
+    @property
+    def device_key(self) -> str:
+        # 受信状況の集計用のデバイス識別子
+        return self.device_name if self.device_name is not None else f"#{self.device_id}"
+
+
+def to_float(s_value: str) -> Optional[float]:
+    """
+    Numeric string convert to float value
+    :param s_value: Numeric string
+    :return: float value or if ValueError, None
+    """
+    try:
+        val = float(s_value)
+    except ValueError:
+        val = None
+    return val
+
+
+def nan_to_none(value: float) -> Optional[float]:
+    # 単精度浮動小数点数の有効桁数(7桁)に丸める (例) 20.200000762939453 -> 20.2
+    return None if math.isnan(value) else float(f"{value:.7g}")
+
+
+def pack_packet(device_id: int, temp_out: Optional[float], temp_in: Optional[float],
+                humid: Optional[float], pressure: Optional[float]) -> bytes:
+    # バイナリ形式のパケット生成 (ESP側の送信処理と同じレイアウト)
+    values: List[float] = [math.nan if v is None else v
+                           for v in (temp_out, temp_in, humid, pressure)]
+    return PACKET_STRUCT.pack(PACKET_MAGIC, PACKET_VERSION, device_id, *values)
+
+
+def decode_packet(data: bytes) -> WeatherPacket:
+    """
+    Decode UDP packet from ESP weather sensor.
+    :param data: text or binary packet
+    :return: WeatherPacket
+    :raise ValueError: invalid packet
+    """
+    if len(data) > 0 and data[0] == PACKET_MAGIC:
+        if len(data) != PACKET_STRUCT.size:
+            raise ValueError(f"Invalid binary packet size: {len(data)}")
+        _, version, device_id, temp_out, temp_in, humid, pressure = PACKET_STRUCT.unpack(data)
+        if version != PACKET_VERSION:
+            raise ValueError(f"Unsupported packet version: {version}")
+        return WeatherPacket(
+            device_name=None, device_id=device_id,
+            temp_out=nan_to_none(temp_out), temp_in=nan_to_none(temp_in),
+            humid=nan_to_none(humid), pressure=nan_to_none(pressure)
+        )
+
+    # from ESP output: device_name, temp_out, temp_in, humid, pressure
+    record: List[str] = data.decode("utf-8").split(",")
+    if len(record) < 5:
+        raise ValueError(f"Invalid text packet: {record}")
+    seq: Optional[int] = None
+    if len(record) > 5:
+        try:
+            seq = int(record[5])
+        except ValueError:
+            seq = None
+    return WeatherPacket(
+        device_name=record[0], device_id=None,
+        temp_out=to_float(record[1]), temp_in=to_float(record[2]),
+        humid=to_float(record[3]), pressure=to_float(record[4]), seq=seq
+    )